@@ -0,0 +1,92 @@
+"""Measures the time to encode and decode the saved state of ongoing matches and the size of their rows, in the binary encoding of matchCodec.py
+and as the JSON text they were saved as before. The states are taken after every command of matches played through the bot against fakeDiscord.py.
+
+Usage: python benchmarkCodec.py [--matches N] [--repeat N] [--seed N]
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import random
+import tempfile
+import time
+
+# The bot prints a line for every command in debug mode
+os.environ['IS_DEBUG'] = '0'
+
+from bot import RainbowBot
+from fakeDiscord import FakeDiscord
+from matchCodec import decodeDiscordMessage, decodeMatch, encodeDiscordMessage, encodeMatch
+from rainbow import RainbowData
+
+async def collectStates(numMatches: int, rng: random.Random):
+    """Plays matches on a simulated server, and returns the (match, discordMessage) of its ongoing match after every command."""
+    states = []
+    with tempfile.TemporaryDirectory() as directory:
+        bot = RainbowBot(os.path.join(directory, 'codec.db'))
+        fake = FakeDiscord(bot)
+        await fake.login()
+        guild = fake.createGuild(numMembers=5)
+
+        async def command(content: str):
+            await fake.sendCommand(guild.textChannel, rng.choice(guild.players), content)
+            match, discordMessage = await bot.loadOngoingMatch(guild.id)
+            if match is not None:
+                # The match and message are changed in place by later commands
+                states.append((decodeMatch(encodeMatch(match)), copy.deepcopy(discordMessage)))
+
+        for _ in range(numMatches):
+            players = rng.sample(guild.players, k=rng.randint(1, 5))
+            await command('!startMatch ' + ' '.join(player.mention for player in players))
+            await command('!ban ' + ' '.join(rng.sample(RainbowData.roster.attackers, k=2) + rng.sample(RainbowData.roster.defenders, k=2)))
+            await command('!map ' + rng.choice([map for map in RainbowData.maps if map != 'UnknownMap']))
+            await command(rng.choice(['!attack', '!defense']))
+            scores = [0, 0]
+            while not ((max(scores) == 4 and min(scores) <= 2) or max(scores) == 5):
+                if rng.random() < 0.2:
+                    await command(f'!{rng.choice(["ace", "interrogation"])} {rng.choice(players).mention}')
+                result = rng.choice(['won', 'lost'])
+                scores[0 if result == 'won' else 1] += 1
+                await command(f'!{result} {rng.choice(["attack", "defense"])}' if scores == [3, 3] else f'!{result}')
+            await command('!goodnight')
+        bot.db.close()
+    return states
+
+def measure(function, values: list, repeat: int):
+    """Returns the median microseconds the function takes per value, and its results."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [function(value) for value in values]
+        durations.append((time.perf_counter() - start) / len(values) * 1e6)
+    return sorted(durations)[len(durations) // 2], results
+
+def report(name: str, values: list, encode, decode, repeat: int):
+    encodeTime, rows = measure(encode, values, repeat)
+    decodeTime, _ = measure(decode, rows, repeat)
+    # JSON text is saved as UTF-8
+    numBytes = sum(len(row.encode('utf-8') if isinstance(row, str) else row) for row in rows)
+    print(f'{name:<24}{encodeTime:>12.1f}{decodeTime:>12.1f}{numBytes / len(rows):>14.0f}')
+
+async def runBenchmark(args):
+    states = await collectStates(args.matches, random.Random(args.seed))
+    matches = [match for match, _ in states]
+    discordMessages = [discordMessage for _, discordMessage in states]
+    print(f'Encoding the state of {args.matches} matches after each of their {len(states)} commands')
+    print(f'{"":<24}{"encode µs":>12}{"decode µs":>12}{"bytes per row":>14}')
+    # The JSON text is decoded through the same functions that read the rows saved before the binary encoding
+    report('match, JSON', matches, lambda match: json.dumps(match.toDict()), decodeMatch, args.repeat)
+    report('match, binary', matches, encodeMatch, decodeMatch, args.repeat)
+    report('message, JSON', discordMessages, json.dumps, decodeDiscordMessage, args.repeat)
+    report('message, binary', discordMessages, encodeDiscordMessage, decodeDiscordMessage, args.repeat)
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures encoding and decoding the state of ongoing matches, in the binary encoding and as JSON.')
+    parser.add_argument('--matches', type=int, default=50, help='The number of matches played to collect states from.')
+    parser.add_argument('--repeat', type=int, default=5, help='The number of times each state is encoded and decoded, of which the median time is reported.')
+    parser.add_argument('--seed', type=int, default=0, help='The seed of the matches.')
+    asyncio.run(runBenchmark(parser.parse_args()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Measures how many completed matches are persisted per second, by the bot's single-transaction path and by the previous path that committed every row on its own.
+Both write to temporary database files, so the time includes the fsyncs of the commits.
+
+Usage: python benchmarkPersistence.py [--matches N] [--seed N]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from types import SimpleNamespace
+
+# The bot prints a line for every command in debug mode
+os.environ['IS_DEBUG'] = '0'
+
+from bot import RainbowBot
+from database import RainbowDatabase
+from fakeDiscord import FakeDiscord
+from rainbow import RainbowData, RainbowMatch
+
+def playMatch(rng: random.Random, playerIds: list):
+    """Plays a random match with five of the players to its end."""
+    match = RainbowMatch(seed=rng.getrandbits(64))
+    match.setPlayers([{'id': playerId, 'mention': f'<@{playerId}>', 'name': f'player{playerId}', 'nick': None, 'global_name': None} for playerId in rng.sample(playerIds, k=5)])
+    match.setMap(rng.choice([map for map in RainbowData.maps if map != 'UnknownMap']))
+    match.startPlaying(rng.choice(['attack', 'defense']))
+    while True:
+        match.setupRound()
+        if rng.random() < 0.2:
+            match.addPlayerStat(rng.choice(match.players)['id'], rng.choice(match.statTypes))
+        if not match.resolveRound(rng.choice(['won', 'lost']), rng.choice(['attack', 'defense'])):
+            return match
+
+def saveMatchPerRow(conn: sqlite3.Connection, serverId: int, match: RainbowMatch):
+    """Saves a completed match like saveCompletedMatch did before it used a single transaction, with an INSERT and a commit for every row."""
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO matches (match_id, server_id, map, result) VALUES (?, ?, ?, ?)", (match.matchId, serverId, match.map, match.scores['blue'] > match.scores['red']))
+    conn.commit()
+    for player in match.players:
+        cursor.execute("INSERT OR IGNORE INTO players (player_id) VALUES (?)", (player['id'],))
+        cursor.execute("INSERT INTO player_matches (player_id, match_id) VALUES (?, ?)", (player['id'], match.matchId))
+        conn.commit()
+    for roundNumber in range(match.getNumRounds()):
+        site, result, operators = match.getRound(roundNumber)
+        cursor.execute("INSERT INTO rounds (round_num, match_id, site, result) VALUES (?, ?, ?, ?)", (roundNumber, match.matchId, site, result))
+        conn.commit()
+        for playerIndex, player in enumerate(match.players):
+            cursor.execute("INSERT INTO player_rounds (player_id, match_id, round_num, operator) VALUES (?, ?, ?, ?)", (player['id'], match.matchId, roundNumber, operators[playerIndex]))
+            conn.commit()
+    for player in match.players:
+        for statType in match.statTypes:
+            count = match.getPlayerStat(player['id'], statType)
+            if count:
+                cursor.execute("""
+                    INSERT OR REPLACE INTO player_additional_stats (player_id, stat_type, value)
+                    VALUES (?, ?, COALESCE((SELECT value FROM player_additional_stats WHERE player_id = ? AND stat_type = ?), 0) + ?)
+                """, (player['id'], statType, player['id'], statType, count))
+                conn.commit()
+
+async def benchmarkPerRow(path: str, matches: list):
+    # The tables are created like the bot does, but written through a single connection with SQLite's default journal, like the bot did before
+    db = RainbowDatabase(path)
+    await db.setup()
+    db.close()
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    start = time.perf_counter()
+    for serverId, match in matches:
+        saveMatchPerRow(conn, serverId, match)
+    duration = time.perf_counter() - start
+    conn.close()
+    return duration
+
+async def benchmarkTransaction(path: str, matches: list):
+    bot = RainbowBot(path)
+    await FakeDiscord(bot).login()
+    start = time.perf_counter()
+    for serverId, match in matches:
+        await bot.saveCompletedMatch(SimpleNamespace(guild=SimpleNamespace(id=serverId)), match)
+    duration = time.perf_counter() - start
+    bot.db.close()
+    return duration
+
+async def runBenchmark(args):
+    rng = random.Random(args.seed)
+    playerIds = [rng.randrange(10**17, 10**18) for _ in range(100)]
+    matches = [(rng.randrange(10), playMatch(rng, playerIds)) for _ in range(args.matches)]
+    numRows = sum(1 + 2 * len(match.players) + match.getNumRounds() * (1 + len(match.players)) for _, match in matches)
+    print(f'Persisting {args.matches} matches of five players with {numRows} rows in total')
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, benchmark in [('commit per row', benchmarkPerRow), ('single transaction', benchmarkTransaction)]:
+            duration = await benchmark(os.path.join(directory, f'{benchmark.__name__}.db'), matches)
+            print(f'{name:<20}{args.matches / duration:>10.0f} matches/s{duration / args.matches * 1000:>10.2f} ms/match')
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures how many completed matches are persisted per second, with a commit per row and in a single transaction.')
+    parser.add_argument('--matches', type=int, default=200, help='The number of matches persisted by each path.')
+    parser.add_argument('--seed', type=int, default=0, help='The seed of the random matches.')
+    asyncio.run(runBenchmark(parser.parse_args()))
+
+if __name__ == '__main__':
+    main()
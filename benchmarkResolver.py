@@ -0,0 +1,79 @@
+"""Checks that the name resolvers return the same names as fuzzy matching against all names with fuzzywuzzy's extractOne would,
+for every name and misspellings of it, and measures how many names they resolve per second.
+
+Usage: python benchmarkResolver.py [--repeat N]
+"""
+import argparse
+import sys
+import time
+from fuzzywuzzy import process
+from rainbow import NameResolver, attackerResolver, defenderResolver, mapResolver, operatorResolver
+
+RESOLVERS = {'operator': operatorResolver, 'attacker': attackerResolver, 'defender': defenderResolver, 'map': mapResolver}
+# Misspellings that were once resolved to a different name than extractOne picks, by the resolver they are given to
+KNOWN_INPUTS = {'operator': ['inka', 'ibana', 'ctash', 'jero'], 'attacker': ['ctash', 'jero'], 'defender': ['inka', 'ibana', 'jero']}
+
+def misspellings(name: str):
+    """Returns the name in lowercase, and every variant of it with a letter left out or two neighbouring letters swapped."""
+    name = name.lower()
+    variants = {name}
+    for i in range(len(name)):
+        variants.add(name[:i] + name[i + 1:])
+        if i + 1 < len(name):
+            variants.add(name[:i] + name[i + 1] + name[i] + name[i + 2:])
+    return variants
+
+def getInputs(kind: str, resolver: NameResolver):
+    """Returns the inputs the resolver has to fuzzy match, which excludes those that are an alias of a name."""
+    inputs = set(KNOWN_INPUTS.get(kind, []))
+    for name in resolver.names:
+        inputs |= misspellings(name)
+    return sorted(text for text in inputs if NameResolver.normalize(text) and NameResolver.normalize(text) not in resolver._normalized)
+
+def baseline(resolver: NameResolver, text: str):
+    match, score = process.extractOne(text, resolver.names)
+    return match if score >= resolver.minimumScore else None
+
+def checkResolvers(inputs: dict):
+    """Prints every input a resolver resolves differently than the baseline, and returns the number of them."""
+    numMismatches = 0
+    for kind, resolver in RESOLVERS.items():
+        for text in inputs[kind]:
+            expected = baseline(resolver, text)
+            resolved = resolver._resolve(text)
+            if resolved != expected:
+                numMismatches += 1
+                print(f'{kind} resolver: {text!r} resolved to {resolved} instead of {expected}')
+    return numMismatches
+
+def measure(name: str, resolve, inputs: list, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in inputs:
+            resolve(text)
+    duration = time.perf_counter() - start
+    print(f'{name:<28}{repeat * len(inputs) / duration:>12.0f} resolutions/s')
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks the name resolvers against fuzzywuzzy\'s extractOne, and measures their throughput.')
+    parser.add_argument('--repeat', type=int, default=3, help='The number of times every input is resolved when measuring.')
+    args = parser.parse_args()
+
+    inputs = {kind: getInputs(kind, resolver) for kind, resolver in RESOLVERS.items()}
+    numInputs = sum(len(kindInputs) for kindInputs in inputs.values())
+    numMismatches = checkResolvers(inputs)
+    print(f'{numMismatches} of {numInputs} inputs resolved differently than extractOne')
+
+    # Commands mostly name operators, and mostly spell them correctly
+    operatorInputs = inputs['operator']
+    typicalInputs = operatorResolver.names * 4 + operatorInputs
+    operatorResolver.resolve.cache_clear()
+    measure('extractOne, misspelled', lambda text: baseline(operatorResolver, text), operatorInputs, args.repeat)
+    measure('resolver, misspelled', operatorResolver._resolve, operatorInputs, args.repeat)
+    measure('extractOne, typical', lambda text: baseline(operatorResolver, text), typicalInputs, args.repeat)
+    measure('resolver, typical', operatorResolver._resolve, typicalInputs, args.repeat)
+    measure('memoized resolver, typical', operatorResolver.resolve, typicalInputs, args.repeat)
+    sys.exit(1 if numMismatches else 0)
+
+if __name__ == '__main__':
+    main()
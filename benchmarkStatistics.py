@@ -0,0 +1,204 @@
+"""Measures how long the !stats command takes to render a player's and a server's statistics as their match history grows, from the pre-summed
+statistics and from a row per match and per round aggregated in Python like the command did before. Both have to render the same message before they are timed.
+
+Usage: python benchmarkStatistics.py [--histories N,N,...] [--repeat N] [--seed N]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+# The bot prints a line for every command in debug mode
+os.environ['IS_DEBUG'] = '0'
+
+from bot import RainbowBot
+from fakeDiscord import FakeDiscord
+from rainbow import RainbowData
+
+def fillHistory(cursor: sqlite3.Cursor, serverId: int, playerIds: list, numMatches: int, rng: random.Random):
+    """Inserts random matches of the server into the raw match tables, each played by the first player and one of the others."""
+    maps = [map for map in RainbowData.maps if map != 'UnknownMap']
+    operatorIds = [RainbowData.roster.getId(operator) for operator in RainbowData.roster.attackers + RainbowData.roster.defenders]
+    matches, playerMatches, rounds, playerRounds = [], [], [], []
+    for matchNum in range(numMatches):
+        matchId = f'match{matchNum}'
+        matchPlayers = [playerIds[0], rng.choice(playerIds[1:])]
+        matchMap = rng.choice(maps)
+        matches.append((matchId, serverId, matchMap, rng.randint(0, 1)))
+        playerMatches += [(playerId, matchId) for playerId in matchPlayers]
+        for roundNum in range(rng.randint(4, 9)):
+            # Rounds on attack have no site
+            rounds.append((matchId, roundNum, rng.choice([None, *range(len(RainbowData.maps[matchMap]))]), rng.randint(0, 1)))
+            playerRounds += [(playerId, matchId, roundNum, rng.choice(operatorIds)) for playerId in matchPlayers]
+    cursor.executemany("INSERT INTO matches (match_id, server_id, map, result) VALUES (?, ?, ?, ?)", matches)
+    cursor.executemany("INSERT OR IGNORE INTO players (player_id) VALUES (?)", [(playerId,) for playerId in playerIds])
+    cursor.executemany("INSERT INTO player_matches (player_id, match_id) VALUES (?, ?)", playerMatches)
+    cursor.executemany("INSERT INTO rounds (match_id, round_num, site, result) VALUES (?, ?, ?, ?)", rounds)
+    cursor.executemany("INSERT INTO player_rounds (player_id, match_id, round_num, operator) VALUES (?, ?, ?, ?)", playerRounds)
+    return len(playerRounds)
+
+# The queries the !stats command made before the statistics were pre-summed, of a player's or a server's matches and rounds
+PLAYER_QUERIES = {
+    'maps': """
+        SELECT matches.map, matches.result
+        FROM matches
+        JOIN player_matches ON matches.match_id = player_matches.match_id
+        WHERE player_matches.player_id = ?
+    """,
+    'sites': """
+        SELECT rounds.site, rounds.result
+        FROM rounds
+        JOIN matches ON rounds.match_id = matches.match_id
+        JOIN player_rounds ON rounds.match_id = player_rounds.match_id AND rounds.round_num = player_rounds.round_num
+        WHERE matches.map = ? AND player_rounds.player_id = ?
+    """,
+    'operators': """
+        SELECT player_rounds.operator, rounds.result
+        FROM player_rounds
+        JOIN rounds ON player_rounds.match_id = rounds.match_id AND player_rounds.round_num = rounds.round_num
+        WHERE player_rounds.player_id = ?
+    """,
+    'additionalStatistics': """
+        SELECT stat_type, value
+        FROM player_additional_stats
+        WHERE player_id = ?
+    """
+}
+SERVER_QUERIES = {
+    'maps': """
+        SELECT matches.map, matches.result
+        FROM matches
+        WHERE matches.server_id = ?
+    """,
+    'sites': """
+        SELECT rounds.site, rounds.result
+        FROM rounds
+        JOIN matches ON rounds.match_id = matches.match_id
+        WHERE matches.map = ? AND matches.server_id = ?
+    """,
+    'operators': """
+        SELECT player_rounds.operator, rounds.result
+        FROM player_rounds
+        JOIN rounds ON player_rounds.match_id = rounds.match_id AND player_rounds.round_num = rounds.round_num
+        JOIN matches ON player_rounds.match_id = matches.match_id
+        WHERE matches.server_id = ?
+    """
+}
+
+def _countWinsLosses(rows: list):
+    counts = {}
+    for key, result in rows:
+        wins, losses = counts.get(key, (0, 0))
+        counts[key] = (wins + 1, losses) if result == 1 else (wins, losses + 1)
+    return counts
+
+def _ranked(counts: dict):
+    """Returns the keys by their win/loss ratio, with ties broken by the plays and then the key like the queries of the !stats command."""
+    return sorted(counts, key=lambda key: (-(counts[key][0] / counts[key][1] if counts[key][1] != 0 else counts[key][0]), -sum(counts[key]), key))
+
+def _ratio(wins: int, losses: int):
+    return round(wins / losses, 2) if losses != 0 else float(wins)
+
+def renderInPython(conn: sqlite3.Connection, statisticType: str, targetId: int):
+    """Renders the statistics of a player for the 'overall' statisticType, or of a server for 'server', the way the !stats command did before:
+    from a row per match and per round, with the wins, losses and plays counted by scanning the rows."""
+    queries = PLAYER_QUERIES if statisticType == 'overall' else SERVER_QUERIES
+    maps = conn.execute(queries['maps'], (targetId,)).fetchall()
+    mapCounts = _countWinsLosses(maps)
+    overallWins = sum(wins for wins, _ in mapCounts.values())
+    overallLosses = sum(losses for _, losses in mapCounts.values())
+    mapCounts.pop(None, None)
+    message = f'Matches played: **{len(maps)}**, with **{overallWins}** wins and **{overallLosses}** losses.\n'
+    message += f'Overall Win/Loss Ratio: **{_ratio(overallWins, overallLosses)}**\n\n'
+    topMaps = _ranked(mapCounts)[:3]
+    if len(topMaps) > 0:
+        message += 'Top maps:\n'
+        for map in topMaps:
+            numMapPlays = len([m for m in maps if m[0] == map])
+            siteCounts = _countWinsLosses(conn.execute(queries['sites'], (map, targetId)).fetchall())
+            attack = siteCounts.pop(None, None)
+            message += f'**{map}: {_ratio(*mapCounts[map])}** (**{numMapPlays}** plays)\n'
+            if attack is not None:
+                message += f'\tAttack:    **{_ratio(*attack)}**\n'
+            message += f'\tDefense: **{_ratio(sum(wins for wins, _ in siteCounts.values()), sum(losses for _, losses in siteCounts.values()))}**\n'
+            for site in _ranked(siteCounts):
+                message += f'\t\t{RainbowData.maps[map][site]}: **{_ratio(*siteCounts[site])}**\n'
+            message += '\n'
+
+    operators = conn.execute(queries['operators'], (targetId,)).fetchall()
+    if len(operators) > 0:
+        operatorCounts = _countWinsLosses(operators)
+        for title, side in [('Top Attackers', lambda operator: operator > 0), ('\nTop Defenders', lambda operator: operator < 0)]:
+            message += f'{title}:\n'
+            for operator in _ranked({key: value for key, value in operatorCounts.items() if side(key)})[:3]:
+                numOperatorPlays = len([o for o in operators if o[0] == operator])
+                message += f'**{RainbowData.roster.getName(operator)}: {_ratio(*operatorCounts[operator])}** (**{numOperatorPlays}** plays)\n'
+
+    additionalStatistics = conn.execute(queries['additionalStatistics'], (targetId,)).fetchall() if 'additionalStatistics' in queries else []
+    if len(additionalStatistics) > 0:
+        message += '\nSome additional statistics:\n'
+        for stat in additionalStatistics:
+            message += f'**{stat[0].title()}**: {stat[1]}\n'
+    return message
+
+async def measure(action, repeat: int):
+    """Returns the median seconds the action takes."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await action()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+async def benchmarkHistory(directory: str, numMatches: int, repeat: int, rng: random.Random):
+    """Times rendering the statistics of the player and of the server from the raw rows in Python and from the pre-summed statistics, which have to render the same text."""
+    bot = RainbowBot(os.path.join(directory, f'statistics{numMatches}.db'))
+    fake = FakeDiscord(bot)
+    await fake.login()
+    guild = fake.createGuild(numMembers=10)
+    player = guild.players[0]
+    numPlayerRounds = await bot.db.transaction(fillHistory, guild.id, [member.id for member in guild.players], numMatches, rng)
+    await bot.db.rebuildStatistics()
+
+    cog = bot.get_cog('Statistics')
+    ctx = SimpleNamespace(guild=guild)
+    conn = sqlite3.connect(bot.db.path)
+    latencies = []
+    for statisticType, targetId in [('overall', player.id), ('server', guild.id)]:
+        async def renderPython():
+            return renderInPython(conn, statisticType, targetId)
+        async def renderSummed():
+            return await cog._createStatisticsString(ctx, statisticType, player)
+        pythonMessage, summedMessage = await renderPython(), await renderSummed()
+        if pythonMessage != summedMessage:
+            conn.close()
+            bot.db.close()
+            sys.exit(f'The {statisticType} statistics of {numMatches} matches differ:\n{pythonMessage}\n{summedMessage}')
+        latencies += [await measure(renderPython, repeat), await measure(renderSummed, repeat)]
+    conn.close()
+    bot.db.close()
+    print(f'{numMatches:>9}{numPlayerRounds:>14}' + ''.join(f'{latency * 1000:>16.2f}' for latency in latencies))
+
+async def runBenchmark(args):
+    rng = random.Random(args.seed)
+    print(f'{"matches":>9}{"player-rounds":>14}{"player Python":>16}{"player summed":>16}{"server Python":>16}{"server summed":>16}')
+    with tempfile.TemporaryDirectory() as directory:
+        for numMatches in args.histories:
+            await benchmarkHistory(directory, numMatches, args.repeat, rng)
+    print('Milliseconds to render the statistics message, which is the same from the raw rows and from the pre-summed statistics')
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures rendering the statistics of the !stats command on synthetic match histories of growing size.')
+    parser.add_argument('--histories', type=lambda value: [int(size) for size in value.split(',')], default=[1000, 10000, 50000], help='The numbers of matches played by the player, separated by commas.')
+    parser.add_argument('--repeat', type=int, default=5, help='The number of times each message is rendered, of which the median is reported.')
+    parser.add_argument('--seed', type=int, default=0, help='The seed of the synthetic histories.')
+    asyncio.run(runBenchmark(parser.parse_args()))
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,32 @@
+import time
+# Taken before the other imports, so the startup report includes the time spent importing
+STARTUP_START = time.perf_counter()
+
+import asyncio
 import discord
-from itertools import zip_longest
-import json
+from contextlib import asynccontextmanager, contextmanager
 import os
-import sqlite3
 from discord.ext import commands
 from dotenv import load_dotenv
-from rainbow import RainbowMatch
+from database import RainbowDatabase
+from matchCache import MatchMessageIndex, OngoingMatchCache
+from matchControls import buildControls, getControl
+from matchCodec import decodeDiscordMessage, decodeEvent, decodeMatch, encodeDiscordMessage, encodeEvent, encodeMatch
+from matchSession import GuildQueue, MatchSession, currentSession
+from messageCache import RecentMessageCache
+from messageRenderer import DebouncedRenderer
+from rainbow import RainbowMatch, warmUpResolvers
 from version import __version__ as VERSION
 
+IMPORT_TIME = time.perf_counter() - STARTUP_START
+
 load_dotenv()
 TOKEN = os.getenv('DISCORD_BOT_TOKEN')
 IS_DEBUG = os.getenv('IS_DEBUG') == '1'
+# The number of events an ongoing match may log before it is saved in full again
+EVENTS_PER_SNAPSHOT = 32
+# The number of seconds over which the updates of a match message are merged into one edit, 0 edits the message on every update
+MATCH_MESSAGE_WINDOW = float(os.getenv('MATCH_MESSAGE_WINDOW', '0.5'))
 
 if IS_DEBUG:
     print('DEBUG MODE: Running in debug mode')
@@ -18,143 +34,152 @@ if IS_DEBUG:
 print(f'Running RandomSixBot v{VERSION}')
 
 class RainbowBot(commands.Bot):
-    def __init__(self):
-        os.makedirs('data', exist_ok=True)
-        self.conn = sqlite3.connect("data/rainbowDiscordBot.db")
-        self.cursor = self.conn.cursor()
-
-        # Currently ongoing matches, one per server
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS ongoing_matches (
-                server_id INTEGER PRIMARY KEY,
-                match_data TEXT,
-                discord_message TEXT
-            )
-        """)
-
-        # Matches with their map and overall scores
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS matches (
-                match_id TEXT PRIMARY KEY,
-                server_id INTEGER,
-                map TEXT,
-                result INTEGER
-            )
-        """)
-
-        # Players that have ever played in a match
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS players (
-                player_id INTEGER PRIMARY KEY
-            )
-        """)
-
-        # Matches a certain player has played
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS player_matches (
-                player_id INTEGER,
-                match_id TEXT,
-                PRIMARY KEY(player_id, match_id),
-                FOREIGN KEY(player_id) REFERENCES players(player_id),
-                FOREIGN KEY(match_id) REFERENCES matches(match_id)
-            )
-        """)
-
-        # Played sites and outcome for each round, 1 is win, 0 is loss
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS rounds (
-                match_id TEXT,
-                round_num INTEGER,
-                site INTEGER,
-                result INTEGER,
-                PRIMARY KEY(match_id, round_num),
-                FOREIGN KEY(match_id) REFERENCES matches(match_id)
-            )
-        """)
-
-        # Operators played by a player in each round
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS player_rounds (
-                player_id INTEGER,
-                match_id TEXT,
-                round_num INTEGER,
-                operator INTEGER,
-                PRIMARY KEY(player_id, match_id, round_num),
-                FOREIGN KEY(match_id) REFERENCES matches(match_id),
-                FOREIGN KEY(player_id) REFERENCES players(player_id)
-            )
-        """)
-
-        # Additional player statistics, such as Caveira interrogations, Aces etc.
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS player_additional_stats (
-                player_id INTEGER,
-                stat_type INTEGER,
-                value INTEGER,
-                PRIMARY KEY(player_id, stat_type),
-                FOREIGN KEY(player_id) REFERENCES players(player_id)
-            )
-        """)
-
-        if IS_DEBUG:
-            print('DEBUG MODE: Deleting matches with no map set')
-            # Get all match ids where map is null
-            self.cursor.execute("SELECT match_id FROM matches WHERE map IS NULL")
-            match_ids = [row[0] for row in self.cursor.fetchall()]
-
-            # Delete data associated with these match ids in the other tables
-            for match_id in match_ids:
-                self.cursor.execute("DELETE FROM player_matches WHERE match_id = ?", (match_id,))
-                self.cursor.execute("DELETE FROM rounds WHERE match_id = ?", (match_id,))
-                self.cursor.execute("DELETE FROM player_rounds WHERE match_id = ?", (match_id,))
-
-            # Delete matches where map is null
-            self.cursor.execute("DELETE FROM matches WHERE map IS NULL")
-
-        self.conn.commit()
+    def __init__(self, databasePath: str = 'data/rainbowDiscordBot.db'):
+        # The duration of each startup phase in seconds, which is printed once the bot is ready
+        self.startupTimes = {'imports': IMPORT_TIME}
+        self._isReady = False
+
+        os.makedirs(os.path.dirname(databasePath) or '.', exist_ok=True)
+        with self._timePhase('dbOpen'):
+            self.db = RainbowDatabase(databasePath)
+        # Write-through cache of the ongoing matches, so commands do not need to load and parse them from the database
+        self.matchCache = OngoingMatchCache()
+        # The number of handled commands and button clicks, and the read queries, commits and seconds waiting for the database they took in total
+        self.commandMetrics = {'commands': 0, 'queries': 0, 'commits': 0, 'dbTime': 0.0}
+        # Commands on the same server are run one at a time, so they cannot overwrite each other's changes to the match
+        self.guildQueue = GuildQueue()
+        # The match messages of all ongoing matches, so clicks on the buttons of other messages are dropped before doing any work. Filled in by setup_hook
+        self.matchMessages = MatchMessageIndex()
+        # The number of button clicks that were handled, and that were dropped because they were not on the message of an ongoing match
+        self.controlMetrics = {'handled': 0, 'shortCircuited': 0}
+        # The most recent messages of each channel, so sending a match message does not need to fetch the channel history
+        self.recentMessages = RecentMessageCache()
+        # The id and hash of the content and buttons of the match message each server last sent or edited, so edits that would not change it are skipped
+        self._renderedContent = {}
+        self.renderMetrics = {'edits': 0, 'skippedEdits': 0, 'historyFetches': 0}
+        # Merges the updates of a match message made in quick succession into one edit, the number of merged updates is kept in renderer.coalesced
+        self.renderer = DebouncedRenderer(MATCH_MESSAGE_WINDOW)
 
         intents = discord.Intents.default()
         intents.members = True
         intents.message_content = True
-
-        commands.Bot.__init__(self, command_prefix='!', intents=intents, case_insensitive=True, help_command=commands.HelpCommand())
+        # The presence is sent when connecting to the gateway, so it is kept across reconnects without calling change_presence
+        activity = discord.Activity(type=discord.ActivityType.playing, name='the development build' if IS_DEBUG else '!startMatch here | !help')
+
+        commands.Bot.__init__(self, command_prefix='!', intents=intents, case_insensitive=True, help_command=commands.HelpCommand(), activity=activity)
+
+    @contextmanager
+    def _timePhase(self, phase: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startupTimes[phase] = time.perf_counter() - start
+
+    async def setup_hook(self):
+        """Prepares the bot once before it connects to the gateway, unlike on_ready which is called again on every reconnect.
+        The database and the resolvers are prepared on their own threads while the cogs are loaded."""
+        await asyncio.gather(self._setUpDatabase(), self._loadCogs(), self._warmUpResolvers())
+        self._setupEnd = time.perf_counter()
+
+    async def _setUpDatabase(self):
+        with self._timePhase('schema'):
+            await self.db.setup()
+        if IS_DEBUG:
+            print('DEBUG MODE: Deleting matches with no map set')
+            with self._timePhase('debugCleanup'):
+                await self.db.transaction(self.db.removeMatchesWithoutMap)
+        with self._timePhase('matchMessages'):
+            for serverId, discordMessageData in await self.db.fetchall("SELECT server_id, discord_message FROM ongoing_matches WHERE discord_message IS NOT NULL"):
+                self.matchMessages.set(serverId, decodeDiscordMessage(discordMessageData)['matchMessageId'])
+
+    async def _loadCogs(self):
+        # The cogs are loaded in order, as that is the order their categories are listed in by !help
+        with self._timePhase('cogs'):
+            for cog in ['matchManagement', 'ongoingMatch', 'trackingMatchStatistics', 'statistics', 'general']:
+                await self.load_extension(f'cogs.{cog}')
+
+    async def _warmUpResolvers(self):
+        with self._timePhase('resolvers'):
+            await asyncio.to_thread(warmUpResolvers)
 
     async def on_ready(self):
-        print(f'Logged in as {bot.user}')
-        cogs_list = [
-            'matchManagement',
-            'ongoingMatch',
-            'trackingMatchStatistics',
-            'statistics',
-            'general'
-        ]
-        for cog in cogs_list:
-            await bot.load_extension(f'cogs.{cog}')
+        print(f'Logged in as {self.user}')
+        if self._isReady:
+            return
+        self._isReady = True
+        self.startupTimes['gatewayReady'] = time.perf_counter() - self._setupEnd
+        phases = ', '.join(f'{phase} {duration * 1000:.0f}ms' for phase, duration in self.startupTimes.items())
+        print(f'Started in {time.perf_counter() - STARTUP_START:.2f}s: {phases}')
+
+    async def invoke(self, ctx: commands.Context):
+        # Every message is passed to invoke, but only commands need a unit of work and a turn on their server
+        if ctx.command is None:
+            return await super().invoke(ctx)
+        async with self.matchSession(ctx):
+            await super().invoke(ctx)
+
+    @asynccontextmanager
+    async def matchSession(self, ctx: commands.Context):
+        """Handles the command or button click of the context as a single unit of work, which loads the ongoing match at most once and writes all changes in one transaction at the end.
+        The unit of work only starts once all earlier commands and button clicks on the same server have finished."""
+        if ctx.guild is None or currentSession.get() is not None:
+            yield
+            return
 
+        async with self.guildQueue.turn(ctx.guild.id) as waitTime:
+            session = MatchSession(ctx.guild.id)
+            token = currentSession.set(session)
+            with self.db.counting() as counter:
+                try:
+                    yield
+                finally:
+                    currentSession.reset(token)
+                    try:
+                        await session.flush(self.db)
+                    except Exception:
+                        # The cache is ahead of the database now, so the next command has to load the match again
+                        self.matchCache.pop(ctx.guild.id)
+                        raise
+
+        self.commandMetrics['commands'] += 1
+        self.commandMetrics['queries'] += counter.queries
+        self.commandMetrics['commits'] += counter.commits
+        self.commandMetrics['dbTime'] += counter.dbTime
         if IS_DEBUG:
-            await bot.change_presence(activity=discord.Activity(type=discord.ActivityType.playing, name='the development build'))
-        else:
-            await bot.change_presence(activity=discord.Activity(type=discord.ActivityType.playing, name='!startMatch here | !help'))
+            print(f'DEBUG MODE: {ctx.command or "Button"} waited {waitTime * 1000:.1f}ms for its turn, made {counter.queries} queries and {counter.commits} commits in {counter.dbTime * 1000:.1f}ms')
 
-    async def on_reaction_add(self, reaction: discord.Reaction, user: discord.User):
-        """Handles reactions being added to messages."""
-        ctx: commands.Context = await self.get_context(reaction.message)
+    async def on_interaction(self, interaction: discord.Interaction):
+        """Handles clicks on the buttons of match messages. Clicks on any other message are dropped right away, without loading the message or the match."""
+        emoji = getControl(interaction.data.get('custom_id')) if interaction.type == discord.InteractionType.component else None
+        if emoji is None:
+            return
+        # The click is acknowledged right away, the match message itself is updated by the command like for any other command
+        await interaction.response.defer()
+        if interaction.guild_id is None or interaction.message.id not in self.matchMessages:
+            self.controlMetrics['shortCircuited'] += 1
+            return
+        self.controlMetrics['handled'] += 1
+
+        ctx: commands.Context = await self.get_context(interaction.message)
+        async with self.matchSession(ctx):
+            await self._handleControl(ctx, interaction.message, emoji, interaction.user)
+
+    async def _handleControl(self, ctx: commands.Context, message: discord.Message, emoji: str, user: discord.Member):
+        """Runs the command of a clicked button, which is identified by the emoji of its control in discordMessage['reactions']."""
         match, discordMessage, canContinue = await self.getMatchData(ctx, False)
 
-        if discordMessage is None or discordMessage['matchMessageId'] != reaction.message.id or user == bot.user:
-            return     
-        if user.mention not in [player['mention'] for player in match.players] or reaction.emoji not in discordMessage['reactions'] or not canContinue:
-            await reaction.message.remove_reaction(reaction, user)
+        if discordMessage is None or discordMessage['matchMessageId'] != message.id:
+            return
+        if user.mention not in [player['mention'] for player in match.players] or emoji not in discordMessage['reactions'] or not canContinue:
             return
-
-        await reaction.message.remove_reaction(reaction, user)
 
         # During a match
-        if reaction.emoji == '🇼': # Round was won
+        if emoji == '🇼': # Round was won
             await self.get_cog('Ongoing Match')._won(ctx)
-        elif reaction.emoji == '🇱': # Round was lost
+        elif emoji == '🇱': # Round was lost
             await self.get_cog('Ongoing Match')._lost(ctx)
-        elif reaction.emoji == '⚔️': # Starting (overtime) on attack
+        elif emoji == '⚔️': # Starting (overtime) on attack
             if match.currRound == 0:
                 await self.get_cog('Ongoing Match')._startAttack(ctx)
             elif (match.currRound == 6 and match.scores["red"] == 3):
@@ -162,8 +187,8 @@ class RainbowBot(commands.Bot):
             elif (match.currRound == 6 and match.scores["blue"] == 3):
                 await self.get_cog('Ongoing Match')._lost(ctx, 'attack')
             else:
-                print('Unknown reaction/match state combination: ⚔️', match.currRound, match.scores)
-        elif reaction.emoji == '🛡️': # Starting (overtime) on defense
+                print('Unknown control/match state combination: ⚔️', match.currRound, match.scores)
+        elif emoji == '🛡️': # Starting (overtime) on defense
             if match.currRound == 0:
                 await self.get_cog('Ongoing Match')._startDefense(ctx)
             elif (match.currRound == 6 and match.scores["red"] == 3):
@@ -171,36 +196,69 @@ class RainbowBot(commands.Bot):
             elif (match.currRound == 6 and match.scores["blue"] == 3):
                 await self.get_cog('Ongoing Match')._lost(ctx, 'defense')
             else:
-                print('Unknown reaction/match state combination: 🛡️', match.currRound, match.scores)
+                print('Unknown control/match state combination: 🛡️', match.currRound, match.scores)
 
         # End of match
-        elif reaction.emoji == '👍': # Play another match with the same players
+        elif emoji == '👍': # Play another match with the same players
             await self.get_cog('Match Management')._another(ctx)
-        elif reaction.emoji == '🎤': # Play another match with players in the current voice channel
-            member = reaction.message.guild.get_member(user.id)
+        elif emoji == '🎤': # Play another match with players in the current voice channel
+            member = message.guild.get_member(user.id)
             ctx.author = member if member.voice else ctx.author
             await self.get_cog('Match Management')._another(ctx, 'here')
-        elif reaction.emoji == '👎': # End the match
+        elif emoji == '👎': # End the match
             await self.get_cog('Match Management')._goodnight(ctx)
-        elif reaction.emoji == '✋': # End the match without saving statistics
+        elif emoji == '✋': # End the match without saving statistics
             await self.get_cog('Match Management')._goodnight(ctx, 'delete')
 
         # Statistics
-        elif reaction.emoji == '🗡️': # Player got an interrogation
+        elif emoji == '🗡️': # Player got an interrogation
             await self.get_cog('Tracking Match Statistics')._interrogation(ctx, user)
         else:
-            print('Unknown reaction:', reaction.emoji)
+            print('Unknown control:', emoji)
             return
 
     async def on_message(self, message: discord.Message):
+        self.recentMessages.add(message.channel.id, message.id, message.content)
         if message.content.startswith('!') and message.channel.type in [discord.ChannelType.public_thread, discord.ChannelType.private_thread, discord.ChannelType.news_thread]:
             await message.channel.send('You cannot use commands in threads, please try again in a text channel.')
             return
-        await bot.process_commands(message)
+        await self.process_commands(message)
+
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        if 'content' in payload.data:
+            self.recentMessages.edit(payload.channel_id, payload.message_id, payload.data['content'])
 
-    def resetDiscordMessage(self, serverId: int):
-        self.cursor.execute("DELETE FROM ongoing_matches WHERE server_id = ?", (serverId,))
-        self.conn.commit()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self.recentMessages.delete(payload.channel_id, payload.message_id)
+
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        for messageId in payload.message_ids:
+            self.recentMessages.delete(payload.channel_id, messageId)
+
+    async def _write(self, function, *args):
+        """Calls function(cursor, *args) in a transaction. During a command, the call is queued and made together with the other writes of the command when it ends."""
+        session = currentSession.get()
+        if session is not None:
+            session.addWrite(function, *args)
+        else:
+            await self.db.transaction(function, *args)
+
+    def _remember(self, serverId: int, **values):
+        """Keeps the new match and/or discord message of the ongoing match in the current command's session, so it is not loaded again during the command."""
+        session = currentSession.get()
+        if session is None or session.serverId != serverId:
+            return
+        if 'match' in values and 'discordMessage' in values:
+            session.remember(values['match'], values['discordMessage'])
+        elif session.discordMessage is not None:
+            # Partial changes only apply while the server has an ongoing match, like the row they are saved to
+            session.remember(values.get('match', session.match), values.get('discordMessage', session.discordMessage))
+
+    async def resetDiscordMessage(self, serverId: int):
+        self.matchCache.pop(serverId)
+        self.matchMessages.discard(serverId)
+        self._remember(serverId, match=None, discordMessage=None)
+        await self._write(self.db.removeOngoingMatch, serverId)
         return {
             'matchMessageId': None,
             'messageContent': {
@@ -217,85 +275,107 @@ class RainbowBot(commands.Bot):
 
     async def sendMatchMessage(self, ctx: commands.Context, discordMessage, forgetMatch=False):
         message = '\n'.join([v for v in discordMessage['messageContent'].values() if v != ''])
+        # The buttons are shown for the controls of the match state, a forgotten match has none left
+        controls = [] if forgetMatch else list(discordMessage['reactions'])
 
         if discordMessage['matchMessageId']:
-            recentMessages = [message async for message in ctx.channel.history(limit=7)]
-            matchMessage: discord.Message = await ctx.channel.fetch_message(discordMessage['matchMessageId'])
-
-            if matchMessage in recentMessages:
-                numLinesInRecentMessages = 0
-                for recentMessage in recentMessages:
-                    if recentMessage.id == matchMessage.id:
-                        break
-                    numLinesInRecentMessages += len(recentMessage.content.split('\n'))
-
-                if numLinesInRecentMessages < 12:
-                    await matchMessage.edit(content=message)
-                else:
-                    if ctx.channel.get_thread(matchMessage.id) is None:
-                        await matchMessage.delete()
-                    else:
-                        discordMessage['messageContent']['actionPrompt'] = 'Use "**!startMatch**" to start a new match.'
-                        message = '\n'.join([v for v in discordMessage['messageContent'].values() if v != ''])
-                        await matchMessage.edit(content=message)
-                        await matchMessage.clear_reactions()
-                        await self.archiveThread(ctx, matchMessage.id)
-                    matchMessage = (await ctx.send(message))
-                    discordMessage['matchMessageId'] = matchMessage.id
+            recentMessages = await self._getRecentMessages(ctx.channel)
+            matchMessage: discord.Message = await self.getMessage(ctx.channel, discordMessage['matchMessageId'])
+            recentMessageIds = [messageId for messageId, _ in recentMessages]
+
+            isNearBottom = False
+            if matchMessage.id in recentMessageIds:
+                numLinesInRecentMessages = sum(numLines for _, numLines in recentMessages[:recentMessageIds.index(matchMessage.id)])
+                isNearBottom = numLinesInRecentMessages < 12
+
+            # Edits of the match message in place are merged with the other updates of the window, the state is still saved right away
+            if isNearBottom and not forgetMatch and self.renderer.window > 0:
+                await self.saveDiscordMessage(ctx, discordMessage)
+                async def render():
+                    await self._editMatchMessage(ctx, matchMessage, message, controls)
+                self.renderer.schedule(ctx.guild.id, matchMessage.id, render)
+                return
+
+            # This update replaces a pending one of the same message, which is about to be replaced, forgotten or edited right away
+            self.renderer.cancel(ctx.guild.id, matchMessage.id)
+            if isNearBottom:
+                await self._editMatchMessage(ctx, matchMessage, message, controls)
             else:
                 if ctx.channel.get_thread(matchMessage.id) is None:
                     await matchMessage.delete()
+                    self.recentMessages.delete(ctx.channel.id, matchMessage.id)
                 else:
                     discordMessage['messageContent']['actionPrompt'] = 'Use "**!startMatch**" to start a new match.'
                     message = '\n'.join([v for v in discordMessage['messageContent'].values() if v != ''])
-                    await matchMessage.edit(content=message)
-                    await matchMessage.clear_reactions()
+                    await self._editMatchMessage(ctx, matchMessage, message, [])
                     await self.archiveThread(ctx, matchMessage.id)
-                matchMessage = (await ctx.send(message))
+                # An update that is still pending can only be one of another message, which is made before this one is sent
+                await self.renderer.flush(ctx.guild.id)
+                matchMessage = await self._sendMatchMessage(ctx, message, controls)
                 discordMessage['matchMessageId'] = matchMessage.id
         else:
-            matchMessage = (await ctx.send(message))
+            # A pending update of the previous match's message is still made, e.g. its end of match text, as this update goes to a new message
+            await self.renderer.flush(ctx.guild.id)
+            matchMessage = await self._sendMatchMessage(ctx, message, controls)
             discordMessage['matchMessageId'] = matchMessage.id
 
         if forgetMatch:
+            await self.resetDiscordMessage(ctx.guild.id)
+        await self.saveDiscordMessage(ctx, discordMessage)
+
+    async def _getRecentMessages(self, channel: discord.TextChannel):
+        """Returns the (messageId, numLines) of the most recent messages in the channel from newest to oldest. The history is only fetched the first time, after that it is kept up to date from gateway events."""
+        recentMessages = self.recentMessages.recent(channel.id)
+        if recentMessages is None:
+            self.renderMetrics['historyFetches'] += 1
+            self.recentMessages.prime(channel.id, [message async for message in channel.history(limit=self.recentMessages.fetchLimit())])
+            recentMessages = self.recentMessages.recent(channel.id)
+        return recentMessages
+
+    async def getMessage(self, channel: discord.abc.Messageable, messageId: int):
+        """Returns a message from the client's message cache, which is kept up to date from gateway events, and only fetches it if it has fallen out."""
+        message = discord.utils.get(reversed(self.cached_messages), id=messageId)
+        if message is None:
+            message = await channel.fetch_message(messageId)
+        return message
+
+    async def _sendMatchMessage(self, ctx: commands.Context, content: str, controls: list):
+        matchMessage = await ctx.send(content, view=buildControls(controls))
+        self.recentMessages.add(ctx.channel.id, matchMessage.id, content)
+        self._renderedContent[ctx.guild.id] = (matchMessage.id, hash((content, tuple(controls))))
+        return matchMessage
+
+    async def _editMatchMessage(self, ctx: commands.Context, matchMessage: discord.Message, content: str, controls: list):
+        """Edits the content and buttons of the match message in a single call, unless it already shows them."""
+        rendered = (matchMessage.id, hash((content, tuple(controls))))
+        if self._renderedContent.get(ctx.guild.id) == rendered:
+            self.renderMetrics['skippedEdits'] += 1
+            return
+        await matchMessage.edit(content=content, view=buildControls(controls))
+        self._renderedContent[ctx.guild.id] = rendered
+        self.renderMetrics['edits'] += 1
+        # Match messages sent before the buttons were added still have their controls as reactions
+        if matchMessage.reactions:
             await matchMessage.clear_reactions()
-            self.resetDiscordMessage(ctx.guild.id)
-            self.saveDiscordMessage(ctx, discordMessage)
-        else:
-            self.saveDiscordMessage(ctx, discordMessage)
-            await self._manageReactions(matchMessage, discordMessage)
-
-    async def _manageReactions(self, message: discord.Message, discordMessage):
-        currentReactions = [r.emoji for r in message.reactions]
 
-        if not any(reaction in discordMessage['reactions'] for reaction in currentReactions):
-            await message.clear_reactions()
-        else:
-            # Remove extra reactions from right to left
-            for reaction in reversed(currentReactions):
-                if reaction not in discordMessage['reactions']:
-                    await message.clear_reaction(reaction)
-
-        # Make sure the reactions are in the correct order and remove user-added reaction counts
-        for i, (current, expected) in enumerate(zip_longest(currentReactions, discordMessage['reactions'])):
-            if current != expected:
-                for reaction in currentReactions[i:]:
-                    await message.clear_reaction(reaction)
-                for reaction in discordMessage['reactions'][i:]:
-                    await message.add_reaction(reaction)
-                break
-            elif next((r for r in message.reactions if r.emoji == current), None).count > 1:
-                users = [user async for user in current.users()]
-                for user in users[1:]:
-                    await message.remove_reaction(current, user)
-    
-    def saveOngoingMatch(self, ctx: commands.Context, match):
+    async def saveOngoingMatch(self, ctx: commands.Context, match):
         serverId = ctx.guild.id
-        matchData = json.dumps(match.__dict__)
-        self.cursor.execute("UPDATE ongoing_matches SET match_data = ? WHERE server_id = ?", (matchData, serverId))
-        self.conn.commit()
+        self.matchCache.update(serverId, match=match)
+        self._remember(serverId, match=match)
+
+        # Most commands only append a few small events, the full match is only saved when the events cannot describe a change or the log grows too long
+        if match.needsSnapshot(EVENTS_PER_SNAPSHOT):
+            matchData = encodeMatch(match)
+            match.savedSnapshot()
+            await self._write(self.db.saveMatchSnapshot, serverId, matchData)
+            return
+
+        firstSeq, events = match.takeEvents()
+        if events:
+            rows = [(serverId, firstSeq + index, encodeEvent(event)) for index, event in enumerate(events)]
+            await self._write(self.db.appendMatchEvents, rows)
 
-    def saveCompletedMatch(self, ctx: commands.Context, match: RainbowMatch):
+    async def saveCompletedMatch(self, ctx: commands.Context, match: RainbowMatch):
         matchMap = match.map
         # Proper matches will have a map name set, so we only save those to the database
         if not IS_DEBUG and matchMap is None:
@@ -304,49 +384,78 @@ class RainbowBot(commands.Bot):
         serverId = ctx.guild.id
         didWin = match.scores['blue'] > match.scores['red']
 
-        self.cursor.execute("INSERT INTO matches (match_id, server_id, map, result) VALUES (?, ?, ?, ?)", (matchId, serverId, matchMap, didWin))
-        self.conn.commit()
-
-        for player in match.players:
-            self.cursor.execute("INSERT OR IGNORE INTO players (player_id) VALUES (?)", (player['id'],))
-            self.cursor.execute("INSERT INTO player_matches (player_id, match_id) VALUES (?, ?)", (player['id'], matchId))
-            self.conn.commit()
-
-        for roundNumber, round in enumerate(match.rounds):
-            site = round['site']
-            roundResult = round['result']
-            self.cursor.execute("INSERT INTO rounds (round_num, match_id, site, result) VALUES (?, ?, ?, ?)", (roundNumber, matchId, site, roundResult))
-            self.conn.commit()
-
-            for playerIndex, player in enumerate(match.players):
-                playerId = player['id']
-                operator = round['operators'][playerIndex]
-                self.cursor.execute("INSERT INTO player_rounds (player_id, match_id, round_num, operator) VALUES (?, ?, ?, ?)", (playerId, matchId, roundNumber, operator))
-                self.conn.commit()
-
-        for round in match.rounds:
-            for statType, players in round['playerStats'].items():
-                for playerId, count in players.items():
-                    # Increase the counter of this stat by the count, or create it if it doesn't exist.
-                    self.cursor.execute("""
-                        INSERT OR REPLACE INTO player_additional_stats (player_id, stat_type, value)
-                        VALUES (?, ?, COALESCE((SELECT value FROM player_additional_stats WHERE player_id = ? AND stat_type = ?), 0) + ?)
-                    """, (playerId, statType, playerId, statType, count))
-                    self.conn.commit()
-
-    def removeMatchData(self, matchId):
+        playerRows = [(player['id'],) for player in match.players]
+        playerMatchRows = [(player['id'], matchId) for player in match.players]
+        rounds = [match.getRound(roundNumber) for roundNumber in range(match.getNumRounds())]
+        roundRows = [(roundNumber, matchId, site, result) for roundNumber, (site, result, _) in enumerate(rounds)]
+        playerRoundRows = [
+            (player['id'], matchId, roundNumber, operators[playerIndex])
+            for roundNumber, (_, _, operators) in enumerate(rounds)
+            for playerIndex, player in enumerate(match.players)
+        ]
+
+        # Sum up the additional statistics over all rounds first, so each counter is only updated once
+        additionalStatRows = [
+            (str(player['id']), statType, count)
+            for player in match.players
+            for statType in match.statTypes
+            if (count := match.getPlayerStat(player['id'], statType))
+        ]
+
+        # The same rounds in the shape used to update the pre-summed statistics
+        playerIds = [player['id'] for player in match.players]
+        roundResults = [(site, result) for _, _, site, result in roundRows]
+        playerRoundResults = [(playerId, roundRows[roundNumber][2], roundRows[roundNumber][3], operator) for playerId, _, roundNumber, operator in playerRoundRows]
+
+        def writeMatch(cursor):
+            cursor.execute("INSERT INTO matches (match_id, server_id, map, result) VALUES (?, ?, ?, ?)", (matchId, serverId, matchMap, didWin))
+            cursor.executemany("INSERT OR IGNORE INTO players (player_id) VALUES (?)", playerRows)
+            cursor.executemany("INSERT INTO player_matches (player_id, match_id) VALUES (?, ?)", playerMatchRows)
+            cursor.executemany("INSERT INTO rounds (round_num, match_id, site, result) VALUES (?, ?, ?, ?)", roundRows)
+            cursor.executemany("INSERT INTO player_rounds (player_id, match_id, round_num, operator) VALUES (?, ?, ?, ?)", playerRoundRows)
+            # Increase the counter of this stat by the count, or create it if it doesn't exist.
+            cursor.executemany("""
+                INSERT INTO player_additional_stats (player_id, stat_type, value)
+                VALUES (?, ?, ?)
+                ON CONFLICT(player_id, stat_type) DO UPDATE SET value = value + excluded.value
+            """, additionalStatRows)
+            self.db.updateStatistics(cursor, serverId, matchMap, didWin, playerIds, roundResults, playerRoundResults)
+
+        # Write the whole match in a single transaction, which is rolled back if any of the inserts fail
+        await self._write(writeMatch)
+
+    async def removeMatchData(self, matchId):
         """Removes all data associated with a match from the database."""
-        self.cursor.execute("DELETE FROM matches WHERE match_id = ?", (matchId,))
-        self.cursor.execute("DELETE FROM player_matches WHERE match_id = ?", (matchId,))
-        self.cursor.execute("DELETE FROM rounds WHERE match_id = ?", (matchId,))
-        self.cursor.execute("DELETE FROM player_rounds WHERE match_id = ?", (matchId,))
-        self.conn.commit()
+        def deleteMatch(cursor):
+            # The pre-summed statistics are derived from the rows below, so they need to be reversed first
+            self.db.removeStatistics(cursor, matchId)
+            cursor.execute("DELETE FROM matches WHERE match_id = ?", (matchId,))
+            cursor.execute("DELETE FROM player_matches WHERE match_id = ?", (matchId,))
+            cursor.execute("DELETE FROM rounds WHERE match_id = ?", (matchId,))
+            cursor.execute("DELETE FROM player_rounds WHERE match_id = ?", (matchId,))
+
+        await self._write(deleteMatch)
 
-    def saveDiscordMessage(self, ctx: commands.Context, discordMessage):
+    async def saveDiscordMessage(self, ctx: commands.Context, discordMessage):
         serverId = ctx.guild.id
-        discordMessage = json.dumps(discordMessage)
-        self.cursor.execute("UPDATE ongoing_matches SET discord_message = ? WHERE server_id = ?", (discordMessage, serverId))
-        self.conn.commit()
+        self.matchCache.update(serverId, discordMessage=discordMessage)
+        self.matchMessages.update(serverId, discordMessage['matchMessageId'])
+        self._remember(serverId, discordMessage=discordMessage)
+        await self._write(self.db.saveDiscordMessage, serverId, encodeDiscordMessage(discordMessage))
+
+    async def createOngoingMatch(self, serverId: int, discordMessage):
+        """Creates the row for a new ongoing match on the given server."""
+        self.matchCache.put(serverId, None, discordMessage)
+        self.matchMessages.set(serverId, discordMessage['matchMessageId'])
+        self._remember(serverId, match=None, discordMessage=discordMessage)
+        await self._write(self.db.createOngoingMatch, serverId, encodeDiscordMessage(discordMessage))
+
+    async def deleteOngoingMatch(self, serverId: int):
+        """Removes the ongoing match of the given server."""
+        self.matchCache.pop(serverId)
+        self.matchMessages.discard(serverId)
+        self._remember(serverId, match=None, discordMessage=None)
+        await self._write(self.db.removeOngoingMatch, serverId)
 
     async def startThreadOnMessage(self, ctx: commands.Context, threadParentMessage: discord.Message, threadName: str) -> discord.Thread:
         """Starts a new thread on a message."""
@@ -355,8 +464,9 @@ class RainbowBot(commands.Bot):
         # Remove the 'RandomSixBot started a thread' system message in the channel if it exists
         recentMessages = [message async for message in ctx.channel.history(limit=2)]
         for message in recentMessages:
-            if message.type == discord.MessageType.thread_created and message.author == bot.user:
+            if message.type == discord.MessageType.thread_created and message.author == self.user:
                 await message.delete()
+                self.recentMessages.delete(ctx.channel.id, message.id)
                 break
 
         return thread
@@ -376,29 +486,64 @@ class RainbowBot(commands.Bot):
         if thread:
             await thread.edit(archived=True)
 
+    async def loadOngoingMatch(self, serverId: int):
+        """Returns the live match (or None if it has not been created yet) and discord message of the server's ongoing match, or (None, None) if there is none.
+        The ongoing match is served from the cache if possible, and only loaded from the database on a cache miss."""
+        session = currentSession.get()
+        if session is not None and session.serverId == serverId and session.isLoaded:
+            return session.match, session.discordMessage
+
+        cached = self.matchCache.get(serverId)
+        if cached is not None:
+            self._remember(serverId, match=cached[0], discordMessage=cached[1])
+            return cached
+
+        # The snapshot and the events logged since are read together, with one row per event (or a single row without an event)
+        rows = await self.db.fetchall("""
+            SELECT ongoing_matches.match_data, ongoing_matches.discord_message, ongoing_match_events.event
+            FROM ongoing_matches
+            LEFT JOIN ongoing_match_events ON ongoing_match_events.server_id = ongoing_matches.server_id
+            WHERE ongoing_matches.server_id = ?
+            ORDER BY ongoing_match_events.seq
+        """, (serverId,))
+        if not rows or rows[0][1] is None:
+            self._remember(serverId, match=None, discordMessage=None)
+            return None, None
+
+        matchData, discordMessageData, _ = rows[0]
+        match = decodeMatch(matchData) if matchData is not None else None
+        discordMessage = decodeDiscordMessage(discordMessageData)
+        # Rows saved before the binary encoding are JSON text, and are rewritten the first time they are loaded
+        if isinstance(matchData, str) or isinstance(discordMessageData, str):
+            if match is not None:
+                await self._write(self.db.saveMatchSnapshot, serverId, encodeMatch(match))
+                match.savedSnapshot()
+            await self._write(self.db.saveDiscordMessage, serverId, encodeDiscordMessage(discordMessage))
+        elif match is not None:
+            match.applyEvents([decodeEvent(event) for _, _, event in rows if event is not None])
+        self.matchCache.put(serverId, match, discordMessage)
+        self.matchMessages.set(serverId, discordMessage['matchMessageId'])
+        self._remember(serverId, match=match, discordMessage=discordMessage)
+        return match, discordMessage
+
     async def getMatchData(self, ctx: commands.Context, shouldAlertOnNoMatch=True):
-        """Gets the match data and discord message from the database. If there is no match in progress, it will send a message to the user."""
-        serverId = ctx.guild.id
-        matchData, discordMessage = None, None
-        result = self.cursor.execute("SELECT match_data, discord_message FROM ongoing_matches WHERE server_id = ?", (serverId,)).fetchone()
+        """Gets the match data and discord message of the ongoing match. If there is no match in progress, it will send a message to the user."""
+        match, discordMessage = await self.loadOngoingMatch(ctx.guild.id)
 
-        if result is not None:
-            matchData, discordMessage = result
-            matchData = json.loads(matchData) if matchData is not None else None
-            discordMessage = json.loads(discordMessage) if discordMessage is not None else self.resetDiscordMessage(ctx.guild.id)
-        else:
-            discordMessage = self.resetDiscordMessage(ctx.guild.id)
+        if discordMessage is None:
+            discordMessage = await self.resetDiscordMessage(ctx.guild.id)
 
-        if matchData is None and shouldAlertOnNoMatch:
+        if match is None and shouldAlertOnNoMatch:
             discordMessage['messageContent']['playersBanner'] = 'No match in progress. Use "**!startMatch @player1 @player2...**" to start a new match.'
-            await bot.sendMatchMessage(ctx, discordMessage, True)
+            await self.sendMatchMessage(ctx, discordMessage, True)
             return None, None, False
 
-        match = RainbowMatch(matchData)
+        if match is None:
+            match = RainbowMatch()
         return match, discordMessage, True
 
     def __del__(self):
-        self.conn.close()
+        self.db.close()
 
 if __name__ == "__main__":
     bot = RainbowBot()
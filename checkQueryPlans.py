@@ -0,0 +1,113 @@
+"""Fills a temporary database with a synthetic history of about a million player-rounds, and checks with EXPLAIN QUERY PLAN that none of the queries
+of the !stats command or of removing a match reads a whole table or index, which would make them slower the more matches are saved.
+
+Usage: python checkQueryPlans.py [--playerRounds N] [--seed N]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+# The bot prints a line for every command in debug mode
+os.environ['IS_DEBUG'] = '0'
+
+from bot import RainbowBot
+from fakeDiscord import FakeDiscord
+from rainbow import RainbowData
+
+NUM_SERVERS = 200
+NUM_PLAYERS = 5000
+
+def fillHistory(cursor: sqlite3.Cursor, numPlayerRounds: int, rng: random.Random):
+    """Inserts random matches into the raw match tables until they hold the given number of player-rounds, and returns the ids of the matches."""
+    maps = [map for map in RainbowData.maps if map != 'UnknownMap']
+    operatorIds = [RainbowData.roster.getId(operator) for operator in RainbowData.roster.attackers + RainbowData.roster.defenders]
+    matchIds = []
+    players, playerMatches, rounds, playerRounds = set(), [], [], []
+    while len(playerRounds) < numPlayerRounds:
+        matchId = f'match{len(matchIds)}'
+        matchIds.append((matchId, rng.randrange(NUM_SERVERS), rng.choice(maps), rng.randint(0, 1)))
+        matchPlayers = rng.sample(range(NUM_PLAYERS), k=rng.randint(1, 5))
+        players.update(matchPlayers)
+        playerMatches += [(playerId, matchId) for playerId in matchPlayers]
+        for roundNum in range(rng.randint(4, 9)):
+            rounds.append((matchId, roundNum, rng.choice([None, 0, 1, 2, 3]), rng.randint(0, 1)))
+            playerRounds += [(playerId, matchId, roundNum, rng.choice(operatorIds)) for playerId in matchPlayers]
+
+    cursor.executemany("INSERT INTO matches (match_id, server_id, map, result) VALUES (?, ?, ?, ?)", matchIds)
+    cursor.executemany("INSERT INTO players (player_id) VALUES (?)", [(playerId,) for playerId in players])
+    cursor.executemany("INSERT INTO player_matches (player_id, match_id) VALUES (?, ?)", playerMatches)
+    cursor.executemany("INSERT INTO rounds (match_id, round_num, site, result) VALUES (?, ?, ?, ?)", rounds)
+    cursor.executemany("INSERT INTO player_rounds (player_id, match_id, round_num, operator) VALUES (?, ?, ?, ?)", playerRounds)
+    return [row[0] for row in matchIds], len(playerRounds)
+
+def recordQueries(db, queries: list):
+    """Makes the read queries of the database also add their (query, parameters) to the list."""
+    def recorded(fetch):
+        async def fetchAndRecord(query: str, parameters: tuple = ()):
+            queries.append((query, parameters))
+            return await fetch(query, parameters)
+        return fetchAndRecord
+    db.fetchone = recorded(db.fetchone)
+    db.fetchall = recorded(db.fetchall)
+
+def findScans(conn: sqlite3.Connection, query: str, parameters: tuple = ()):
+    """Returns the steps of the query plan that read a whole table or index."""
+    plan = conn.execute('EXPLAIN QUERY PLAN ' + query, parameters).fetchall()
+    return [detail for _, _, _, detail in plan if detail.startswith('SCAN ') and detail != 'SCAN CONSTANT ROW']
+
+async def checkQueryPlans(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        bot = RainbowBot(os.path.join(directory, 'queryPlans.db'))
+        await FakeDiscord(bot).login()
+
+        start = time.perf_counter()
+        matchIds, numPlayerRounds = await bot.db.transaction(fillHistory, args.playerRounds, rng)
+        await bot.db.rebuildStatistics()
+        print(f'Filled the database with {len(matchIds)} matches and {numPlayerRounds} player-rounds in {time.perf_counter() - start:.1f}s')
+
+        # The queries are checked exactly as the bot makes them, with the parameters of real players, servers and matches
+        queries = []
+        recordQueries(bot.db, queries)
+        statistics = bot.get_cog('Statistics')
+        topMaps = list(RainbowData.maps)[:3]
+        for statType in ['overall', 'maps', 'additionalStatistics', 'attackers', 'defenders']:
+            await statistics._getPlayerStatisticFromDatabase(SimpleNamespace(id=rng.randrange(NUM_PLAYERS)), statType)
+        await statistics._getPlayerStatisticFromDatabase(SimpleNamespace(id=rng.randrange(NUM_PLAYERS)), 'sites', topMaps)
+        for statType in ['overall', 'maps', 'attackers', 'defenders']:
+            await statistics._getServerStatisticFromDatabase(SimpleNamespace(id=rng.randrange(NUM_SERVERS)), statType)
+        await statistics._getServerStatisticFromDatabase(SimpleNamespace(id=rng.randrange(NUM_SERVERS)), 'sites', topMaps)
+
+        # The statements of the writer connection are traced with their parameters already filled in
+        bot.db._writeConn.set_trace_callback(lambda statement: queries.append((statement, ())))
+        await bot.removeMatchData(rng.choice(matchIds))
+        bot.db._writeConn.set_trace_callback(None)
+
+        numScans = 0
+        conn = sqlite3.connect(bot.db.path)
+        for query, parameters in queries:
+            if not query.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            for scan in findScans(conn, query, parameters):
+                numScans += 1
+                print(f'{scan} in:\n{query.strip()}\n')
+        conn.close()
+        bot.db.close()
+
+    print(f'{numScans} full scans in {len(queries)} queries')
+    return numScans
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks that the statistics queries use indexes on a database with a large synthetic history.')
+    parser.add_argument('--playerRounds', type=int, default=1_000_000, help='The number of player-rounds in the synthetic history.')
+    parser.add_argument('--seed', type=int, default=0, help='The seed of the synthetic history.')
+    sys.exit(1 if asyncio.run(checkQueryPlans(parser.parse_args())) else 0)
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,7 @@ class General(commands.Cog, name='General'):
 
         message = await ctx.channel.fetch_message(discordMessage['matchMessageId'])
         await message.delete()
+        self.bot.recentMessages.delete(ctx.channel.id, message.id)
 
         discordMessage['matchMessageId'] = None
         await self.bot.sendMatchMessage(ctx, discordMessage)
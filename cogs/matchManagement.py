@@ -1,5 +1,4 @@
 from discord.ext import commands
-import json
 import re
 from rainbow import RainbowMatch
 from bot import RainbowBot
@@ -13,14 +12,12 @@ class MatchManagement(commands.Cog, name='Match Management'):
     async def _startMatch(self, ctx: commands.Context, *playerNamesOrHere):
         """Starts a new match with up to five players. Use **!startMatch here** to start a match with everyone in your current voice channel, or **!startMatch @player1 @player2...** to start a match with the mentioned players. This command must be used first in order for any other match commands to work."""
         serverId = ctx.guild.id
-        matchData = self.bot.cursor.execute("SELECT match_data FROM ongoing_matches WHERE server_id = ?", (serverId,)).fetchone()
+        oldMatch, discordMessage = await self.bot.loadOngoingMatch(serverId)
 
-        if matchData is not None and matchData[0] is not None:
-            oldMatch = RainbowMatch(json.loads(matchData[0]))
-            discordMessage = self.bot.cursor.execute("SELECT discord_message FROM ongoing_matches WHERE server_id = ?", (serverId,)).fetchone()[0]
-            discordMessage = json.loads(discordMessage)
+        if oldMatch is not None:
             if not oldMatch.isMatchFinished():
                 await ctx.message.delete()
+                self.bot.recentMessages.delete(ctx.channel.id, ctx.message.id)
                 previousActionPrompt = discordMessage['messageContent']['actionPrompt']
                 discordMessage['messageContent']['actionPrompt'] = 'A match is already in progress. Use "**!another**" to start a new match with the same players, "**!another here**" to start a match with everyone in your voice channel, or "**!goodnight**" to end the match.\n' if '!another' not in discordMessage['messageContent']['actionPrompt'] else ''
                 discordMessage['messageContent']['actionPrompt'] += previousActionPrompt
@@ -30,8 +27,8 @@ class MatchManagement(commands.Cog, name='Match Management'):
                 await self._goodnight(ctx)
 
         match = RainbowMatch()
-        discordMessage = self.bot.resetDiscordMessage(ctx.guild.id)
-        self.bot.cursor.execute("INSERT INTO ongoing_matches (server_id, discord_message) VALUES (?, ?)", (serverId, json.dumps(discordMessage)))
+        discordMessage = await self.bot.resetDiscordMessage(ctx.guild.id)
+        await self.bot.createOngoingMatch(serverId, discordMessage)
 
         # Instead of a player name, the user can use the argument "here" to start a match with the players in their voice channel
         if len(playerNamesOrHere) == 1 and playerNamesOrHere[0].lower() in ['voice', 'voicechannel', 'channel', 'here']:
@@ -76,7 +73,7 @@ class MatchManagement(commands.Cog, name='Match Management'):
         discordMessage['messageContent']['actionPrompt'] = 'Next, use "**!setMap map**" and "**!ban op1 op2...**", then start playing with "**!attack**" ⚔️ or "**!defense**" 🛡️.'
         discordMessage['reactions'] = ['⚔️', '🛡️']
 
-        self.bot.saveOngoingMatch(ctx, match)
+        await self.bot.saveOngoingMatch(ctx, match)
         await self.bot.sendMatchMessage(ctx, discordMessage)
 
     @commands.command(aliases=['addPlayers', 'addPlayer', 'add'])
@@ -87,6 +84,7 @@ class MatchManagement(commands.Cog, name='Match Management'):
             return
         if ctx.message.id != discordMessage['matchMessageId'] or not discordMessage['matchMessageId']:
             await ctx.message.delete()
+            self.bot.recentMessages.delete(ctx.channel.id, ctx.message.id)
         
         if match.currRound > 0:
             discordMessage['messageContent']['playersBanner'] = f'You cannot add players to a match that has already started. Use "**!another @player1 @player2...**" to start a new match.\nCurrent players are {match.playersString}{", playing on **" + match.map + "**" if match.map else ""}.\n'
@@ -111,7 +109,7 @@ class MatchManagement(commands.Cog, name='Match Management'):
             await self.bot.sendMatchMessage(ctx, discordMessage)
             return
 
-        self.bot.saveOngoingMatch(ctx, match)
+        await self.bot.saveOngoingMatch(ctx, match)
         await self.bot.sendMatchMessage(ctx, discordMessage)
 
     @commands.command(aliases=['removePlayers', 'removePlayer', 'remove'])
@@ -122,6 +120,7 @@ class MatchManagement(commands.Cog, name='Match Management'):
             return
         if ctx.message.id != discordMessage['matchMessageId'] or not discordMessage['matchMessageId']:
             await ctx.message.delete()
+            self.bot.recentMessages.delete(ctx.channel.id, ctx.message.id)
 
         if match.currRound > 0:
             discordMessage['messageContent']['playersBanner'] = f'You cannot remove players from a match that has already started. Use "**!another @player1 @player2...**" to start a new match.\nCurrent players are {match.playersString}{", playing on **" + match.map + "**" if match.map else ""}.\n'
@@ -146,7 +145,7 @@ class MatchManagement(commands.Cog, name='Match Management'):
             await self.bot.sendMatchMessage(ctx, discordMessage)
             return
 
-        self.bot.saveOngoingMatch(ctx, match)
+        await self.bot.saveOngoingMatch(ctx, match)
         await self.bot.sendMatchMessage(ctx, discordMessage)
 
     @commands.command(aliases=['another', 'again'])
@@ -171,8 +170,7 @@ class MatchManagement(commands.Cog, name='Match Management'):
         await self.bot.sendMatchMessage(ctx, discordMessage, True)
         await self.bot.archiveThread(ctx, discordMessage['matchMessageId'])
 
-        self.bot.cursor.execute("DELETE FROM ongoing_matches WHERE server_id = ?", (ctx.guild.id,))
-        self.bot.conn.commit()
+        await self.bot.deleteOngoingMatch(ctx.guild.id)
 
         playerIdStrings = [f'<@{player["id"]}>' for player in match.players]
         if here is not None and here.lower() in ['voice', 'voicechannel', 'channel', 'here']:
@@ -188,6 +186,7 @@ class MatchManagement(commands.Cog, name='Match Management'):
             return
         if ctx.message.id != discordMessage['matchMessageId'] or not discordMessage['matchMessageId']:
             await ctx.message.delete()
+            self.bot.recentMessages.delete(ctx.channel.id, ctx.message.id)
 
         if not match.isMatchFinished():
             discordMessage['messageContent']['playersBanner'] = f"Stopped a match with {match.playersString}{' on **' + match.map + '**' if match.map else ''} before completing it.\n"
@@ -203,14 +202,13 @@ class MatchManagement(commands.Cog, name='Match Management'):
         discordMessage['reactions'] = []
 
         if delete == 'delete':
-            self.bot.removeMatchData(match.matchId)
+            await self.bot.removeMatchData(match.matchId)
             discordMessage['messageContent']['statsBanner'] = 'Match data has been **removed** from the database (additional player statistics such as interrogations are always saved).\n'
 
         await self.bot.sendMatchMessage(ctx, discordMessage)
         await self.bot.archiveThread(ctx, discordMessage['matchMessageId'])
 
-        self.bot.cursor.execute("DELETE FROM ongoing_matches WHERE server_id = ?", (ctx.guild.id,))
-        self.bot.conn.commit()
+        await self.bot.deleteOngoingMatch(ctx.guild.id)
 
     def _validatePlayerNames(self, ctx: commands.Context, playerNames):
         playerIds = [re.findall(r'\d+', name) for name in playerNames if name.startswith('<@')]
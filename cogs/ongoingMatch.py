@@ -1,7 +1,6 @@
 from discord.ext import commands
-from fuzzywuzzy import process
 from bot import RainbowBot
-from rainbow import RainbowData, RainbowMatch
+from rainbow import RainbowMatch, attackerResolver, defenderResolver
 
 class OngoingMatch(commands.Cog, name='Ongoing Match'):
     """Commands to interact with an ongoing match, such as banning operators or playing rounds."""
@@ -26,6 +25,7 @@ class OngoingMatch(commands.Cog, name='Ongoing Match'):
             return
         if ctx.message.id != discordMessage['matchMessageId'] or not discordMessage['matchMessageId']:
             await ctx.message.delete()
+            self.bot.recentMessages.delete(ctx.channel.id, ctx.message.id)
 
         if len(mapName) == 0:
             discordMessage['messageContent']['actionPrompt'] = 'You must specify a map. Use "**!setMap map**" to try again.'
@@ -53,7 +53,7 @@ class OngoingMatch(commands.Cog, name='Ongoing Match'):
         else:
             discordMessage['messageContent']['actionPrompt'] += 'Use "**!won**" 🇼 or "**!lost**" 🇱 to continue.'
 
-        self.bot.saveOngoingMatch(ctx, match)
+        await self.bot.saveOngoingMatch(ctx, match)
         await self.bot.sendMatchMessage(ctx, discordMessage)
 
     @commands.command(aliases=['attack', 'startAttack'])
@@ -74,6 +74,7 @@ class OngoingMatch(commands.Cog, name='Ongoing Match'):
             return
         if ctx.message.id != discordMessage['matchMessageId'] or not discordMessage['matchMessageId']:
             await ctx.message.delete()
+            self.bot.recentMessages.delete(ctx.channel.id, ctx.message.id)
 
         if not match.playingOnSide:
             discordMessage['messageContent']['actionPrompt'] = 'You must specify what side you start on. Use "**!attack**" ⚔️ or "**!defense**" 🛡️.'
@@ -88,12 +89,12 @@ class OngoingMatch(commands.Cog, name='Ongoing Match'):
                 return
 
         if match.resolveRound('won', overtimeSide):
-            self.bot.saveOngoingMatch(ctx, match)
-            self.bot.saveDiscordMessage(ctx, discordMessage)
+            await self.bot.saveOngoingMatch(ctx, match)
+            await self.bot.saveDiscordMessage(ctx, discordMessage)
             await self._playRound(ctx)
         else:
-            self.bot.saveOngoingMatch(ctx, match)
-            self.bot.saveDiscordMessage(ctx, discordMessage)
+            await self.bot.saveOngoingMatch(ctx, match)
+            await self.bot.saveDiscordMessage(ctx, discordMessage)
             await self._endMatch(ctx)
 
     @commands.command(aliases=['lost', 'l'])
@@ -104,6 +105,7 @@ class OngoingMatch(commands.Cog, name='Ongoing Match'):
             return
         if ctx.message.id != discordMessage['matchMessageId'] or not discordMessage['matchMessageId']:
             await ctx.message.delete()
+            self.bot.recentMessages.delete(ctx.channel.id, ctx.message.id)
 
         if not match.playingOnSide:
             discordMessage['messageContent']['actionPrompt'] = 'You must specify what side you start on. Use ""**!attack**" ⚔️ or "**!defense**" 🛡️.'
@@ -118,12 +120,12 @@ class OngoingMatch(commands.Cog, name='Ongoing Match'):
                 return
 
         if match.resolveRound('lost', overtimeSide):
-            self.bot.saveOngoingMatch(ctx, match)
-            self.bot.saveDiscordMessage(ctx, discordMessage)
+            await self.bot.saveOngoingMatch(ctx, match)
+            await self.bot.saveDiscordMessage(ctx, discordMessage)
             await self._playRound(ctx)
         else:
-            self.bot.saveOngoingMatch(ctx, match)
-            self.bot.saveDiscordMessage(ctx, discordMessage)
+            await self.bot.saveOngoingMatch(ctx, match)
+            await self.bot.saveDiscordMessage(ctx, discordMessage)
             await self._endMatch(ctx)
 
     @commands.command(aliases=['swap', 'switch'])
@@ -134,13 +136,14 @@ class OngoingMatch(commands.Cog, name='Ongoing Match'):
             return
         if ctx.message.id != discordMessage['matchMessageId'] or not discordMessage['matchMessageId']:
             await ctx.message.delete()
+            self.bot.recentMessages.delete(ctx.channel.id, ctx.message.id)
 
         if match.currRound == 0:
             discordMessage['messageContent']['actionPrompt'] = 'You can only swap operators during an ongoing round. Use "**!attack**" ⚔️ or "**!defense**" 🛡️ to start the match.'
             await self.bot.sendMatchMessage(ctx, discordMessage)
             return
         
-        validOperators = RainbowData.attackers if match.playingOnSide == 'attack' else RainbowData.defenders
+        operatorResolver = attackerResolver if match.playingOnSide == 'attack' else defenderResolver
 
         if operator is None:
             discordMessage['messageContent']['statsBanner'] = 'You must include the operator you are swapping to. Use "**!swap operator**" or "**!swap operator @player**" to try again.'
@@ -152,8 +155,8 @@ class OngoingMatch(commands.Cog, name='Ongoing Match'):
             player = await commands.MemberConverter().convert(ctx, player)
 
         operator = operator.lower().capitalize()
-        operatorMatch, score = process.extractOne(operator, validOperators)
-        if score >= 75:
+        operatorMatch = operatorResolver.resolve(operator)
+        if operatorMatch is not None:
             operator = operatorMatch
         else:
             discordMessage['messageContent']['statsBanner'] = f'**{operator}** is not a valid operator. Use "**!swap operator**" or "**!swap operator @player**" to try again.'
@@ -164,7 +167,7 @@ class OngoingMatch(commands.Cog, name='Ongoing Match'):
 
         discordMessage = self._setRoundLineup(discordMessage, match, playerOperators, backupOperators)
 
-        self.bot.saveOngoingMatch(ctx, match)
+        await self.bot.saveOngoingMatch(ctx, match)
         await self.bot.sendMatchMessage(ctx, discordMessage)
 
     @commands.command(aliases=['swapSite', 'site'])
@@ -175,6 +178,7 @@ class OngoingMatch(commands.Cog, name='Ongoing Match'):
             return
         if ctx.message.id != discordMessage['matchMessageId'] or not discordMessage['matchMessageId']:
             await ctx.message.delete()
+            self.bot.recentMessages.delete(ctx.channel.id, ctx.message.id)
 
         if match.currRound == 0:
             discordMessage['messageContent']['actionPrompt'] = 'You can only change the site during an ongoing round. Use "**!attack**" ⚔️ or "**!defense**" 🛡️ to start the match.'
@@ -214,7 +218,7 @@ class OngoingMatch(commands.Cog, name='Ongoing Match'):
         else:
             discordMessage['messageContent']['statsBanner'] = f'**{siteNumber}** is not a valid site number (1-4). Use "**!site <siteNumber>**" to try again.'
 
-        self.bot.saveOngoingMatch(ctx, match)
+        await self.bot.saveOngoingMatch(ctx, match)
         await self.bot.sendMatchMessage(ctx, discordMessage)
 
     async def _banUnban(self, ctx: commands.Context, *operators, ban: bool = True):
@@ -223,6 +227,7 @@ class OngoingMatch(commands.Cog, name='Ongoing Match'):
             return
         if ctx.message.id != discordMessage['matchMessageId'] or not discordMessage['matchMessageId']:
             await ctx.message.delete()
+            self.bot.recentMessages.delete(ctx.channel.id, ctx.message.id)
 
         operators = [op.lower().capitalize() for op in operators]
         bans = ' '.join(operators)
@@ -248,7 +253,7 @@ class OngoingMatch(commands.Cog, name='Ongoing Match'):
         else:
             discordMessage['messageContent']['actionPrompt'] = 'Use "**!won**" 🇼 or "**!lost**" 🇱 to continue.'
 
-        self.bot.saveOngoingMatch(ctx, match)
+        await self.bot.saveOngoingMatch(ctx, match)
         await self.bot.sendMatchMessage(ctx, discordMessage)
 
     async def _playMatch(self, ctx: commands.Context, side: str):
@@ -257,6 +262,7 @@ class OngoingMatch(commands.Cog, name='Ongoing Match'):
             return
         if ctx.message.id != discordMessage['matchMessageId'] or not discordMessage['matchMessageId']:
             await ctx.message.delete()
+            self.bot.recentMessages.delete(ctx.channel.id, ctx.message.id)
 
         if match == None:
             discordMessage['messageContent']['playersBanner'] = 'No match in progress. Use "**!startMatch @player1 @player2...**" to start a new match.'
@@ -265,16 +271,10 @@ class OngoingMatch(commands.Cog, name='Ongoing Match'):
         
         discordMessage['messageContent']['playersBanner'] = f"Playing a match with {match.playersString}{' on **' + match.map + '**' if match.map else ''}.\n"
         
-        if side == 'attack':
-            match.playingOnSide = 'attack'
-        else:
-            match.playingOnSide = 'defense'
-
-        if match.currRound == 0:
-                match.currRound = 1
+        match.startPlaying('attack' if side == 'attack' else 'defense')
 
-        self.bot.saveOngoingMatch(ctx, match)
-        self.bot.saveDiscordMessage(ctx, discordMessage)
+        await self.bot.saveOngoingMatch(ctx, match)
+        await self.bot.saveDiscordMessage(ctx, discordMessage)
         await self._playRound(ctx)
 
     async def _playRound(self, ctx: commands.Context):
@@ -307,7 +307,7 @@ class OngoingMatch(commands.Cog, name='Ongoing Match'):
 
         discordMessage = self._setRoundLineup(discordMessage, match, operators)
 
-        self.bot.saveOngoingMatch(ctx, match)
+        await self.bot.saveOngoingMatch(ctx, match)
         await self.bot.sendMatchMessage(ctx, discordMessage)
 
     async def _endMatch(self, ctx: commands.Context):
@@ -322,8 +322,8 @@ class OngoingMatch(commands.Cog, name='Ongoing Match'):
         discordMessage['messageContent']['statsBanner'] = ''
         discordMessage['messageContent']['actionPrompt'] = 'Use "**!another**" 👍 for a new match with the same players, "**!another here**" 🎤 for a new match in your voice channel, or "**!goodnight (delete)**" 👎 (✋) to end the match (and exclude it from statistics).'
         discordMessage['reactions'] = ['👍', '🎤', '👎', '✋']
-        self.bot.saveOngoingMatch(ctx, match)
-        self.bot.saveCompletedMatch(ctx, match)
+        await self.bot.saveOngoingMatch(ctx, match)
+        await self.bot.saveCompletedMatch(ctx, match)
         await self.bot.createMatchRecapThread(ctx, match, discordMessage)
         await self.bot.sendMatchMessage(ctx, discordMessage)
     
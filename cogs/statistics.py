@@ -3,6 +3,9 @@ from discord.ext import commands
 from bot import RainbowBot
 from rainbow import RainbowData, RainbowMatch
 
+# Orders pre-summed rows the same way as the displayed ratio, with the wins themselves used when there are no losses. Ties are broken by the plays and then the key, so equal statistics are always listed in the same order
+WIN_LOSS_RATIO = 'CASE WHEN losses = 0 THEN wins ELSE CAST(wins AS REAL) / losses END'
+
 class Statistics(commands.Cog, name='Statistics'):
     """Commands to view statistics for players and past matches."""
     def __init__(self, bot: RainbowBot):
@@ -47,26 +50,7 @@ class Statistics(commands.Cog, name='Statistics'):
         # Returns the player's Win/Loss ratio and additional statistics
         if statisticType == 'overall' or statisticType == 'server':
             message += f'Here are the requested statistics for **{target}** (Use "**!stats help**" for more usage information):\n\n'
-            if statisticType == 'overall':
-                maps = self._getPlayerStatisticFromDatabase(player, 'maps')
-                additionalStatistics = self._getPlayerStatisticFromDatabase(player, 'additionalStatistics')
-                operators = self._getPlayerStatisticFromDatabase(player, 'operators')
-            else:
-                maps = self._getServerStatisticFromDatabase(ctx.guild, 'maps')
-                additionalStatistics = []
-                operators = self._getServerStatisticFromDatabase(ctx.guild, 'operators')
-
-            # Maps/Sites
-            message += self._createMapStatisticsString(ctx, statisticType, maps, player)
-
-            # Operators
-            message += self._createOperatorStatisticsString(operators)
-
-            # Additional statistics
-            if len(additionalStatistics) > 0:
-                message += '\nSome additional statistics:\n'
-                for stat in additionalStatistics:
-                    message += f'**{stat[0].title()}**: {stat[1]}\n'
+            message += await self._createStatisticsString(ctx, statisticType, player)
         elif statisticType == 'help':
             message = 'The "**!stats**" command allows you to query and view statistics for yourself, your server, or another user on this server.\n\n'
             message += 'Available *statisticTypes* are:\n'
@@ -81,189 +65,221 @@ class Statistics(commands.Cog, name='Statistics'):
         thread: discord.Thread = await self.bot.startThreadOnMessage(ctx, ctx.message, threadName)
         await thread.send(message)
 
-    def _getPlayerStatisticFromDatabase(self, player: discord.User, statType: str, additionalArguments: list = None):
-        """Gets all data related to the given player and statistic from the database."""
-        # Returns a list of maps and match results for matches this player played
-        if statType == 'maps':
-            return self.bot.cursor.execute("""
-                SELECT matches.map, matches.result
-                FROM matches
-                JOIN player_matches ON matches.match_id = player_matches.match_id
-                WHERE player_matches.player_id = ?
-            """, (player.id,)).fetchall()
+    async def _createStatisticsString(self, ctx: commands.Context, statisticType: str, player: discord.User):
+        """Creates the map, operator and additional statistics of a player for the 'overall' statisticType, or of the server for 'server'."""
+        if statisticType == 'overall':
+            overall = await self._getPlayerStatisticFromDatabase(player, 'overall')
+            maps = await self._getPlayerStatisticFromDatabase(player, 'maps')
+            additionalStatistics = await self._getPlayerStatisticFromDatabase(player, 'additionalStatistics')
+            attackers = await self._getPlayerStatisticFromDatabase(player, 'attackers')
+            defenders = await self._getPlayerStatisticFromDatabase(player, 'defenders')
+        else:
+            overall = await self._getServerStatisticFromDatabase(ctx.guild, 'overall')
+            maps = await self._getServerStatisticFromDatabase(ctx.guild, 'maps')
+            additionalStatistics = []
+            attackers = await self._getServerStatisticFromDatabase(ctx.guild, 'attackers')
+            defenders = await self._getServerStatisticFromDatabase(ctx.guild, 'defenders')
+
+        # Maps/Sites
+        message = await self._createMapStatisticsString(ctx, statisticType, overall, maps, player)
+
+        # Operators
+        message += self._createOperatorStatisticsString(attackers, defenders)
+
+        # Additional statistics
+        if len(additionalStatistics) > 0:
+            message += '\nSome additional statistics:\n'
+            for stat in additionalStatistics:
+                message += f'**{stat[0].title()}**: {stat[1]}\n'
+        return message
+
+    async def _getPlayerStatisticFromDatabase(self, player: discord.User, statType: str, additionalArguments: list = None):
+        """Gets the pre-summed wins and losses related to the given player and statistic from the database. Rankings are returned as (key, wins, losses, plays) tuples."""
+        # Returns the total match wins and losses of this player
+        if statType == 'overall':
+            return await self.bot.db.fetchone("""
+                SELECT COALESCE(SUM(wins), 0), COALESCE(SUM(losses), 0)
+                FROM player_map_stats
+                WHERE player_id = ?
+            """, (player.id,))
+        # Returns the three maps with the best win/loss ratio for this player
+        elif statType == 'maps':
+            return await self.bot.db.fetchall(f"""
+                SELECT map, wins, losses, wins + losses AS plays
+                FROM player_map_stats
+                WHERE player_id = ? AND map != ''
+                ORDER BY {WIN_LOSS_RATIO} DESC, plays DESC, map
+                LIMIT 3
+            """, (player.id,))
         # Returns a list of all additional statistics for this player, such as interrogations or aces
         elif statType == 'additionalStatistics':
-            return self.bot.cursor.execute("""
+            return await self.bot.db.fetchall("""
                 SELECT stat_type, value
                 FROM player_additional_stats
                 WHERE player_id = ?
-            """, (player.id,)).fetchall()
-        # Gets a list of operators played by this player, and if the player won the round
-        elif statType == 'operators':
-            return self.bot.cursor.execute("""
-                SELECT player_rounds.operator, rounds.result
-                FROM player_rounds
-                JOIN rounds ON player_rounds.match_id = rounds.match_id AND player_rounds.round_num = rounds.round_num
-                WHERE player_rounds.player_id = ?
-            """, (player.id,)).fetchall()
-        # Gets a list of played sites for a given map, and if the player won the round
+            """, (player.id,))
+        # Gets the three attackers or defenders with the best round win/loss ratio for this player
+        elif statType == 'attackers' or statType == 'defenders':
+            return await self.bot.db.fetchall(f"""
+                SELECT operator, wins, losses, wins + losses AS plays
+                FROM player_operator_stats
+                WHERE player_id = ? AND {'operator > 0' if statType == 'attackers' else 'operator < 0'}
+                ORDER BY {WIN_LOSS_RATIO} DESC, plays DESC, operator
+                LIMIT 3
+            """, (player.id,))
+        # Gets the round wins and losses on each site of the given maps, with a site of None for rounds played on attack
         elif statType == 'sites':
-            map = additionalArguments[0]
-            return self.bot.cursor.execute("""
-                SELECT rounds.site, rounds.result
-                FROM rounds
-                JOIN matches ON rounds.match_id = matches.match_id
-                JOIN player_rounds ON rounds.match_id = player_rounds.match_id AND rounds.round_num = player_rounds.round_num
-                WHERE matches.map = ? AND player_rounds.player_id = ?
-            """, (map, player.id)).fetchall()
+            maps = additionalArguments
+            return await self.bot.db.fetchall(f"""
+                SELECT map, NULLIF(site, -1), wins, losses, wins + losses AS plays
+                FROM player_site_stats
+                WHERE player_id = ? AND map IN ({', '.join('?' * len(maps))})
+                ORDER BY map, {WIN_LOSS_RATIO} DESC, plays DESC, site
+            """, (player.id, *maps))
         else:
             print(f'Unknown statType when querying player statistics: {statType}')
             return None
     
-    def _getServerStatisticFromDatabase(self, server: discord.Guild, statType: str, additionalArguments: list = None):
-        """Gets all data related to the given server and statistic from the database."""
-        # Returns a list of maps and match results for matches played on this server
-        if statType == 'maps':
-            return self.bot.cursor.execute("""
-                SELECT matches.map, matches.result
-                FROM matches
-                WHERE matches.server_id = ?
-            """, (server.id,)).fetchall()
-        # Gets a list of operators played in matches on this server, and if the player won the round
-        elif statType == 'operators':
-            return self.bot.cursor.execute("""
-                SELECT player_rounds.operator, rounds.result
-                FROM player_rounds
-                JOIN rounds ON player_rounds.match_id = rounds.match_id AND player_rounds.round_num = rounds.round_num
-                JOIN matches ON player_rounds.match_id = matches.match_id
-                WHERE matches.server_id = ?
-            """, (server.id,)).fetchall()
-        # Gets a list of played sites for a given map, and if the players won the round
+    async def _getServerStatisticFromDatabase(self, server: discord.Guild, statType: str, additionalArguments: list = None):
+        """Gets the pre-summed wins and losses related to the given server and statistic from the database. Rankings are returned as (key, wins, losses, plays) tuples."""
+        # Returns the total match wins and losses on this server
+        if statType == 'overall':
+            return await self.bot.db.fetchone("""
+                SELECT COALESCE(SUM(wins), 0), COALESCE(SUM(losses), 0)
+                FROM server_map_stats
+                WHERE server_id = ?
+            """, (server.id,))
+        # Returns the three maps with the best win/loss ratio on this server
+        elif statType == 'maps':
+            return await self.bot.db.fetchall(f"""
+                SELECT map, wins, losses, wins + losses AS plays
+                FROM server_map_stats
+                WHERE server_id = ? AND map != ''
+                ORDER BY {WIN_LOSS_RATIO} DESC, plays DESC, map
+                LIMIT 3
+            """, (server.id,))
+        # Gets the three attackers or defenders with the best round win/loss ratio on this server
+        elif statType == 'attackers' or statType == 'defenders':
+            return await self.bot.db.fetchall(f"""
+                SELECT operator, wins, losses, wins + losses AS plays
+                FROM server_operator_stats
+                WHERE server_id = ? AND {'operator > 0' if statType == 'attackers' else 'operator < 0'}
+                ORDER BY {WIN_LOSS_RATIO} DESC, plays DESC, operator
+                LIMIT 3
+            """, (server.id,))
+        # Gets the round wins and losses on each site of the given maps, with a site of None for rounds played on attack
         elif statType == 'sites':
-            map = additionalArguments[0]
-            return self.bot.cursor.execute("""
-                SELECT rounds.site, rounds.result
-                FROM rounds
-                JOIN matches ON rounds.match_id = matches.match_id
-                WHERE matches.map = ? AND matches.server_id = ?
-            """, (map, server.id)).fetchall()
+            maps = additionalArguments
+            return await self.bot.db.fetchall(f"""
+                SELECT map, NULLIF(site, -1), wins, losses, wins + losses AS plays
+                FROM server_site_stats
+                WHERE server_id = ? AND map IN ({', '.join('?' * len(maps))})
+                ORDER BY map, {WIN_LOSS_RATIO} DESC, plays DESC, site
+            """, (server.id, *maps))
         else:
             print(f'Unknown statType when querying server statistics: {statType}')
             return None
 
-    def _calculateWinLossRatio(self, maps: list):
+    def _calculateWinLossRatio(self, rows: list):
         res = {}
         overallWins = 0
         overallLosses = 0
-        for map in maps:
-            if map[0] not in res:
-                res[map[0]] = {'wins': 0, 'losses': 0}
-            if map[1] == 1:
-                overallWins += 1
-                res[map[0]]['wins'] += 1
-            else:
-                overallLosses += 1
-                res[map[0]]['losses'] += 1
+        for key, wins, losses, _ in rows:
+            res[key] = {'wins': wins, 'losses': losses}
+            overallWins += wins
+            overallLosses += losses
         # None means no map is set, or the round was played on attack
         none = res.pop(None, None)
         overall = {'wins': overallWins, 'losses': overallLosses}
         return res, overall, none
     
     def _getOperatorFromId(self, operatorId: int):
-        if operatorId > 0:
-            return RainbowData.attackers[operatorId - 1]
-        return RainbowData.defenders[abs(operatorId) - 1]
+        return RainbowData.roster.getName(operatorId)
+
+    async def _createMapStatisticsString(self, ctx: commands.Context, statisticType: str, overall: tuple, maps: list, player: discord.User):
+        overallWins, overallLosses = overall
+        message = f'Matches played: **{overallWins + overallLosses}**, with **{overallWins}** wins and **{overallLosses}** losses.\n'
+        message += f'Overall Win/Loss Ratio: **{round(overallWins/overallLosses, 2) if overallLosses != 0 else float(overallWins)}**\n\n'
+        if len(maps) > 0:
+            # Get the win/loss of each defensive site for all top maps at once
+            topMaps = [map[0] for map in maps]
+            if statisticType == 'overall':
+                allSites = await self._getPlayerStatisticFromDatabase(player, 'sites', topMaps)
+            elif statisticType == 'server':
+                allSites = await self._getServerStatisticFromDatabase(ctx.guild, 'sites', topMaps)
+            sitesPerMap = {map: [] for map in topMaps}
+            for siteMap, *site in allSites:
+                sitesPerMap[siteMap].append(site)
 
-    def _createMapStatisticsString(self, ctx: commands.Context, statisticType: str, maps: list, player: discord.User):
-        mapsWinLoss, overallWinLoss, _ = self._calculateWinLossRatio(maps)
-        message = f'Matches played: **{len(maps)}**, with **{overallWinLoss["wins"]}** wins and **{overallWinLoss["losses"]}** losses.\n'
-        message += f'Overall Win/Loss Ratio: **{round(overallWinLoss["wins"]/overallWinLoss["losses"], 2) if overallWinLoss["losses"] != 0 else float(overallWinLoss["wins"])}**\n\n'
-        sortedMaps = sorted(mapsWinLoss, key=lambda x: mapsWinLoss[x]['wins']/mapsWinLoss[x]['losses']if mapsWinLoss[x]["losses"] != 0 else mapsWinLoss[x]['wins'], reverse=True)[:3]
-        if len(sortedMaps) > 0:
-            # Get the win/loss of each defensive site for the top maps
             message += 'Top maps:\n'
-            for map in sortedMaps:
-                numMapPlays = len([m for m in maps if m[0] == map])
-                if statisticType == 'overall':
-                    sites = self._getPlayerStatisticFromDatabase(player, 'sites', [map])
-                elif statisticType == 'server':
-                    sites = self._getServerStatisticFromDatabase(ctx.guild, 'sites', [map])
-                siteWinsLosses, siteOverallWinLoss, attackWinLoss = self._calculateWinLossRatio(sites)
-                sortedSites = sorted(siteWinsLosses, key=lambda x: siteWinsLosses[x]['wins']/siteWinsLosses[x]['losses'] if siteWinsLosses[x]["losses"] != 0 else siteWinsLosses[x]['wins'], reverse=True)
+            for map, mapWins, mapLosses, numMapPlays in maps:
+                # The sites are already sorted by their win/loss ratio
+                siteWinsLosses, siteOverallWinLoss, attackWinLoss = self._calculateWinLossRatio(sitesPerMap[map])
 
-                message += f'**{map}: {round(mapsWinLoss[map]["wins"]/mapsWinLoss[map]["losses"], 2) if mapsWinLoss[map]["losses"] != 0 else float(mapsWinLoss[map]["wins"])}** (**{numMapPlays}** plays)\n'
+                message += f'**{map}: {round(mapWins/mapLosses, 2) if mapLosses != 0 else float(mapWins)}** (**{numMapPlays}** plays)\n'
 
                 if attackWinLoss is not None:
                     message += f'\tAttack:    **{round(attackWinLoss["wins"]/attackWinLoss["losses"], 2) if attackWinLoss["losses"] != 0 else float(attackWinLoss["wins"])}**\n'
                 # defenseWinLoss is the overall win/loss minus the attack win/loss
                 defenseWinLoss = {'wins': siteOverallWinLoss['wins'] - attackWinLoss['wins'], 'losses': siteOverallWinLoss['losses'] - attackWinLoss['losses']}
                 message += f'\tDefense: **{round(defenseWinLoss["wins"]/defenseWinLoss["losses"], 2) if defenseWinLoss["losses"] != 0 else float(defenseWinLoss["wins"])}**\n'
-                for site in sortedSites:
+                for site in siteWinsLosses:
                     siteName = RainbowData.maps[map][site]
                     message += f'\t\t{siteName}: **{round(siteWinsLosses[site]["wins"]/siteWinsLosses[site]["losses"], 2) if siteWinsLosses[site]["losses"] != 0 else float(siteWinsLosses[site]["wins"])}**\n'
                 message += '\n'
 
         return message
 
-    def _createOperatorStatisticsString(self, operators: list):
+    def _createOperatorStatisticsString(self, attackers: list, defenders: list):
         message = ''
-        if len(operators) == 0:
+        if len(attackers) == 0 and len(defenders) == 0:
             return message
 
-        operatorWinsLosses = {}
-        for operator in operators:
-            if operator[0] not in operatorWinsLosses:
-                operatorWinsLosses[operator[0]] = {'wins': 0, 'losses': 0}
-            if operator[1] == 1:
-                operatorWinsLosses[operator[0]]['wins'] += 1
-            else:
-                operatorWinsLosses[operator[0]]['losses'] += 1
-
-        attackers = {k: operatorWinsLosses[k] for k in operatorWinsLosses if k > 0}
-        defenders = {k: operatorWinsLosses[k] for k in operatorWinsLosses if k < 0}
-        sorted_attackers = sorted(attackers, key=lambda x: attackers[x]['wins']/attackers[x]['losses'] if attackers[x]["losses"] != 0 else attackers[x]['wins'], reverse=True)[:3]
-        sorted_defenders = sorted(defenders, key=lambda x: defenders[x]['wins']/defenders[x]['losses'] if defenders[x]["losses"] != 0 else defenders[x]['wins'], reverse=True)[:3]
-
         # Add the top three attackers to the message
         message += 'Top Attackers:\n'
-        for operator in sorted_attackers:
-            numOperatorPlays = len([o for o in operators if o[0] == operator])
-            message += f'**{self._getOperatorFromId(operator)}: {round(attackers[operator]["wins"]/attackers[operator]["losses"], 2) if attackers[operator]["losses"] != 0 else float(attackers[operator]["wins"])}** (**{numOperatorPlays}** plays)\n'
+        for operator, wins, losses, numOperatorPlays in attackers:
+            message += f'**{self._getOperatorFromId(operator)}: {round(wins/losses, 2) if losses != 0 else float(wins)}** (**{numOperatorPlays}** plays)\n'
 
         # Add the top three defenders to the message
         message += '\nTop Defenders:\n'
-        for operator in sorted_defenders:
-            numOperatorPlays = len([o for o in operators if o[0] == operator])
-            message += f'**{self._getOperatorFromId(operator)}: {round(defenders[operator]["wins"]/defenders[operator]["losses"], 2) if defenders[operator]["losses"] != 0 else float(defenders[operator]["wins"])}** (**{numOperatorPlays}** plays)\n'
+        for operator, wins, losses, numOperatorPlays in defenders:
+            message += f'**{self._getOperatorFromId(operator)}: {round(wins/losses, 2) if losses != 0 else float(wins)}** (**{numOperatorPlays}** plays)\n'
 
         return message
 
+    @commands.command(aliases=['rebuildStatistics', 'rebuildStats'], hidden=True)
+    @commands.is_owner()
+    async def _rebuildStatistics(self, ctx: commands.Context):
+        """Recomputes the pre-summed statistics of all players and servers from the saved matches."""
+        await self.bot.db.rebuildStatistics()
+        await ctx.send('The statistics have been rebuilt from all saved matches.')
+
     def createMatchRecapStringFromMatch(self, match: RainbowMatch):
         """Creates a recap of all rounds played in the match."""
         message = ''
         message += f'Banned operators: {", ".join([f"**{op}**" for op in match.bannedOperators])}\n'
-        message += f'Started playing on {"**Attack**" if match.rounds[0]["site"] is None else "**Defense**"}.\n\n'
+        message += f'Started playing on {"**Attack**" if match.getRound(0)[0] is None else "**Defense**"}.\n\n'
 
-        for roundIndex, round in enumerate(match.rounds):
-            if round['site'] is not None:
-                siteName = RainbowData.maps[match.map][round['site']] if match.map is not None else f"the {RainbowData.maps['UnknownMap'][round['site']]} site"
+        for roundIndex in range(match.getNumRounds()):
+            site, result, operators = match.getRound(roundIndex)
+            if site is not None:
+                siteName = RainbowData.maps[match.map][site] if match.map is not None else f"the {RainbowData.maps['UnknownMap'][site]} site"
                 playedSite = f" (defense) on\n\t**{siteName}**"
             else:
                 playedSite = " (attack)"
-            message += f"{'**Won**' if round['result'] == 1 else '**Lost**'} round {roundIndex + 1}{playedSite}\n"
+            message += f"{'**Won**' if result == 1 else '**Lost**'} round {roundIndex + 1}{playedSite}\n"
 
             for playerIndex, player in enumerate(match.players):
                 playerNameString = player['nick'] if player['nick'] is not None else player['global_name'] if player['global_name'] is not None else player['name'] if player['name'] is not None else player['mention']
-                operator = self._getOperatorFromId(round['operators'][playerIndex])
+                operator = self._getOperatorFromId(operators[playerIndex])
                 message += f'\t**{playerNameString}** played **{operator}**\n'
-                for statType, playerStatValues in round['playerStats'].items():
-                    if playerStatValues.get(str(player["id"])):
+                for statType in match.statTypes:
+                    count = match.getRoundPlayerStat(roundIndex, playerIndex, statType)
+                    if count:
                         if statType == 'aces':
                             message += f"\t\t**{playerNameString} aced** the round!\n"
                         elif statType == 'interrogations':
-                            message += f"\t\t**{playerNameString}** got **{playerStatValues[str(player['id'])]} interrogation{'s' if playerStatValues[str(player['id'])] > 1 else ''}**!\n"
-                        else:
-                            message += f"\t\t{statType.title()}: {playerStatValues[str(player['id'])]}\n"
+                            message += f"\t\t**{playerNameString}** got **{count} interrogation{'s' if count > 1 else ''}**!\n"
             message += '\n'
         
         message += f'Match ID: {match.matchId}'
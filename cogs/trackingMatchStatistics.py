@@ -15,6 +15,7 @@ class TrackingMatchStatistics(commands.Cog, name='Tracking Match Statistics'):
             return
         if ctx.message.id != discordMessage['matchMessageId'] or not discordMessage['matchMessageId']:
             await ctx.message.delete()
+            self.bot.recentMessages.delete(ctx.channel.id, ctx.message.id)
         
         if player is None:
             player = ctx.author
@@ -27,7 +28,7 @@ class TrackingMatchStatistics(commands.Cog, name='Tracking Match Statistics'):
             numInterrogations = match.getPlayerStat(player.id, 'interrogations')
             discordMessage['messageContent']['statsBanner'] = f'{player.mention} has interrogated someone! They have gotten {numInterrogations} interrogation{"s" if numInterrogations != 1 else ""} in this match!'
 
-        self.bot.saveOngoingMatch(ctx, match)
+        await self.bot.saveOngoingMatch(ctx, match)
         await self.bot.sendMatchMessage(ctx, discordMessage)
     
     @commands.command(aliases=['ace'])
@@ -38,6 +39,7 @@ class TrackingMatchStatistics(commands.Cog, name='Tracking Match Statistics'):
             return
         if ctx.message.id != discordMessage['matchMessageId'] or not discordMessage['matchMessageId']:
             await ctx.message.delete()
+            self.bot.recentMessages.delete(ctx.channel.id, ctx.message.id)
         
         if player is None:
             player = ctx.author
@@ -50,7 +52,7 @@ class TrackingMatchStatistics(commands.Cog, name='Tracking Match Statistics'):
             numAces = match.getPlayerStat(player.id, 'aces')
             discordMessage['messageContent']['statsBanner'] = f'{player.mention} has aced the round! They have gotten {numAces} ace{"s" if numAces != 1 else ""} in this match!'
 
-        self.bot.saveOngoingMatch(ctx, match)
+        await self.bot.saveOngoingMatch(ctx, match)
         await self.bot.sendMatchMessage(ctx, discordMessage)
 
 async def setup(bot: RainbowBot):
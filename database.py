@@ -0,0 +1,435 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+class QueryCounter:
+    """Counts the read queries and the commits made by the task that is counting, and the time it waited for them, see RainbowDatabase.counting."""
+    def __init__(self, parent=None):
+        self.queries = 0
+        self.commits = 0
+        # The seconds spent waiting for the queries and commits, including the time they were queued behind those of other tasks
+        self.dbTime = 0.0
+        # The counter of the enclosing counting block, which counts everything this one does as well
+        self.parent = parent
+
+# The counter of the current task, which is inherited by the tasks it starts
+_activeCounter = ContextVar('activeCounter', default=None)
+
+class RainbowDatabase:
+    """Runs all SQLite queries on dedicated worker threads, so a slow query never blocks the event loop.
+    Writes go through a single writer thread and connection, reads are spread over a small pool of read-only connections."""
+    def __init__(self, path: str, numReaders: int = 2):
+        self.path = path
+        # The number of read queries and commits since the database was opened, and the seconds spent waiting for them
+        self.queries = 0
+        self.commits = 0
+        self.dbTime = 0.0
+        self._writeConn = sqlite3.connect(path, check_same_thread=False)
+        # WAL allows the read connections to query the database while a write is in progress
+        self._writeConn.execute("PRAGMA journal_mode=WAL")
+        self._writeConn.execute("PRAGMA synchronous=NORMAL")
+
+        self._readConns = []
+        self._readConnsLock = threading.Lock()
+        self._local = threading.local()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rainbow-db-writer')
+        self._readers = ThreadPoolExecutor(max_workers=numReaders, thread_name_prefix='rainbow-db-reader', initializer=self._openReadConnection)
+
+    async def setup(self):
+        """Creates the tables and indexes that do not exist yet on the writer thread. Must be awaited before any other query."""
+        await self._run(self._writer, self._createSchema)
+
+    def _createSchema(self):
+        cursor = self._writeConn.cursor()
+        hasStatisticTables = cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'player_map_stats'").fetchone() is not None
+
+        # Currently ongoing matches, one per server. The match and message are binary encoded by matchCodec, which SQLite keeps as blobs despite the
+        # TEXT columns, while rows saved before that are still JSON text
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ongoing_matches (
+                server_id INTEGER PRIMARY KEY,
+                match_data TEXT,
+                discord_message TEXT
+            )
+        """)
+
+        # The events of each ongoing match since its last snapshot in ongoing_matches.match_data, replayed in order of seq on top of it
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ongoing_match_events (
+                server_id INTEGER,
+                seq INTEGER,
+                event BLOB,
+                PRIMARY KEY (server_id, seq)
+            ) WITHOUT ROWID
+        """)
+
+        # Matches with their map and overall scores
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS matches (
+                match_id TEXT PRIMARY KEY,
+                server_id INTEGER,
+                map TEXT,
+                result INTEGER
+            )
+        """)
+
+        # Players that have ever played in a match
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS players (
+                player_id INTEGER PRIMARY KEY
+            )
+        """)
+
+        # Matches a certain player has played
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS player_matches (
+                player_id INTEGER,
+                match_id TEXT,
+                PRIMARY KEY(player_id, match_id),
+                FOREIGN KEY(player_id) REFERENCES players(player_id),
+                FOREIGN KEY(match_id) REFERENCES matches(match_id)
+            )
+        """)
+
+        # Played sites and outcome for each round, 1 is win, 0 is loss
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS rounds (
+                match_id TEXT,
+                round_num INTEGER,
+                site INTEGER,
+                result INTEGER,
+                PRIMARY KEY(match_id, round_num),
+                FOREIGN KEY(match_id) REFERENCES matches(match_id)
+            )
+        """)
+
+        # Operators played by a player in each round
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS player_rounds (
+                player_id INTEGER,
+                match_id TEXT,
+                round_num INTEGER,
+                operator INTEGER,
+                PRIMARY KEY(player_id, match_id, round_num),
+                FOREIGN KEY(match_id) REFERENCES matches(match_id),
+                FOREIGN KEY(player_id) REFERENCES players(player_id)
+            )
+        """)
+
+        # Additional player statistics, such as Caveira interrogations, Aces etc.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS player_additional_stats (
+                player_id INTEGER,
+                stat_type INTEGER,
+                value INTEGER,
+                PRIMARY KEY(player_id, stat_type),
+                FOREIGN KEY(player_id) REFERENCES players(player_id)
+            )
+        """)
+
+        self._createIndexes(cursor)
+        self._createStatisticTables(cursor)
+
+        # Databases created before the statistic tables existed need them filled from the existing matches once
+        if not hasStatisticTables:
+            self._rebuildStatistics(cursor)
+
+        self._writeConn.commit()
+
+    def _createIndexes(self, cursor: sqlite3.Cursor):
+        """Creates the secondary indexes used by the statistics queries, so they do not need to scan whole tables as the history grows."""
+        # Server statistics filter matches by server, and optionally by map
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_matches_server_map ON matches (server_id, map, result)")
+
+        # Operators played by a player, covering the operator so the table itself is never read
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_player_rounds_player ON player_rounds (player_id, match_id, round_num, operator)")
+
+        # Operators played in a match, used for server statistics and when deleting a match
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_player_rounds_match ON player_rounds (match_id, round_num, operator)")
+
+        # Players of a match, used when deleting a match
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_player_matches_match ON player_matches (match_id)")
+
+    def _createStatisticTables(self, cursor: sqlite3.Cursor):
+        """Creates the tables holding pre-summed wins and losses, which are kept up to date whenever a match is saved or removed.
+        Matches without a map are stored with an empty map name, and rounds played on attack with a site of -1, so they can be part of the primary key."""
+        # Match wins and losses of a player on each map
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS player_map_stats (
+                player_id INTEGER,
+                map TEXT,
+                wins INTEGER,
+                losses INTEGER,
+                PRIMARY KEY(player_id, map)
+            )
+        """)
+
+        # Round wins and losses of a player on each site of a map
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS player_site_stats (
+                player_id INTEGER,
+                map TEXT,
+                site INTEGER,
+                wins INTEGER,
+                losses INTEGER,
+                PRIMARY KEY(player_id, map, site)
+            )
+        """)
+
+        # Round wins and losses of a player with each operator
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS player_operator_stats (
+                player_id INTEGER,
+                operator INTEGER,
+                wins INTEGER,
+                losses INTEGER,
+                PRIMARY KEY(player_id, operator)
+            )
+        """)
+
+        # Match wins and losses of a server on each map
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS server_map_stats (
+                server_id INTEGER,
+                map TEXT,
+                wins INTEGER,
+                losses INTEGER,
+                PRIMARY KEY(server_id, map)
+            )
+        """)
+
+        # Round wins and losses of a server on each site of a map
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS server_site_stats (
+                server_id INTEGER,
+                map TEXT,
+                site INTEGER,
+                wins INTEGER,
+                losses INTEGER,
+                PRIMARY KEY(server_id, map, site)
+            )
+        """)
+
+        # Round wins and losses of each operator played on a server, counted once per player
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS server_operator_stats (
+                server_id INTEGER,
+                operator INTEGER,
+                wins INTEGER,
+                losses INTEGER,
+                PRIMARY KEY(server_id, operator)
+            )
+        """)
+
+    def updateStatistics(self, cursor: sqlite3.Cursor, serverId: int, matchMap: str, didWin: bool, playerIds: list, roundResults: list, playerRounds: list, sign: int = 1):
+        """Adds a match to the statistic tables, or removes it again if sign is -1. Must be called on the writer thread, inside the transaction that saves or removes the match.
+        roundResults holds a (site, result) tuple for each round, playerRounds a (playerId, site, result, operator) tuple for each round of each player."""
+        matchMap = matchMap or ''
+        matchWins, matchLosses = (sign, 0) if didWin else (0, sign)
+
+        def count(keys):
+            counts = {}
+            for key, result in keys:
+                wins, losses = counts.get(key, (0, 0))
+                counts[key] = (wins + sign, losses) if result == 1 else (wins, losses + sign)
+            return [(*key, wins, losses) for key, (wins, losses) in counts.items()]
+
+        playerSites = count(((playerId, matchMap, -1 if site is None else site), result) for playerId, site, result, _ in playerRounds)
+        playerOperators = count(((playerId, operator), result) for playerId, _, result, operator in playerRounds)
+        serverSites = count(((serverId, matchMap, -1 if site is None else site), result) for site, result in roundResults)
+        serverOperators = count(((serverId, operator), result) for _, _, result, operator in playerRounds)
+
+        upsert = "INSERT INTO {table} VALUES ({values}) ON CONFLICT({key}) DO UPDATE SET wins = wins + excluded.wins, losses = losses + excluded.losses"
+        cursor.executemany(upsert.format(table='player_map_stats', values='?, ?, ?, ?', key='player_id, map'), [(playerId, matchMap, matchWins, matchLosses) for playerId in playerIds])
+        cursor.executemany(upsert.format(table='player_site_stats', values='?, ?, ?, ?, ?', key='player_id, map, site'), playerSites)
+        cursor.executemany(upsert.format(table='player_operator_stats', values='?, ?, ?, ?', key='player_id, operator'), playerOperators)
+        cursor.execute(upsert.format(table='server_map_stats', values='?, ?, ?, ?', key='server_id, map'), (serverId, matchMap, matchWins, matchLosses))
+        cursor.executemany(upsert.format(table='server_site_stats', values='?, ?, ?, ?, ?', key='server_id, map, site'), serverSites)
+        cursor.executemany(upsert.format(table='server_operator_stats', values='?, ?, ?, ?', key='server_id, operator'), serverOperators)
+
+    def saveMatchSnapshot(self, cursor: sqlite3.Cursor, serverId: int, matchData: bytes):
+        """Saves the full state of a server's ongoing match and drops the events it already includes. Must be called on the writer thread."""
+        cursor.execute("UPDATE ongoing_matches SET match_data = ? WHERE server_id = ?", (matchData, serverId))
+        cursor.execute("DELETE FROM ongoing_match_events WHERE server_id = ?", (serverId,))
+
+    def appendMatchEvents(self, cursor: sqlite3.Cursor, rows: list):
+        """Appends (server_id, seq, event) rows to the event logs of the ongoing matches. Must be called on the writer thread."""
+        cursor.executemany("INSERT INTO ongoing_match_events (server_id, seq, event) VALUES (?, ?, ?)", rows)
+
+    def saveDiscordMessage(self, cursor: sqlite3.Cursor, serverId: int, discordMessage: bytes):
+        """Saves the state of a server's match message. Must be called on the writer thread."""
+        cursor.execute("UPDATE ongoing_matches SET discord_message = ? WHERE server_id = ?", (discordMessage, serverId))
+
+    def createOngoingMatch(self, cursor: sqlite3.Cursor, serverId: int, discordMessage: bytes):
+        """Creates the row of a server's new ongoing match, which has no match data until the match is first saved. Must be called on the writer thread."""
+        cursor.execute("INSERT INTO ongoing_matches (server_id, discord_message) VALUES (?, ?)", (serverId, discordMessage))
+
+    def removeOngoingMatch(self, cursor: sqlite3.Cursor, serverId: int):
+        """Removes the ongoing match of a server together with its events. Must be called on the writer thread."""
+        cursor.execute("DELETE FROM ongoing_matches WHERE server_id = ?", (serverId,))
+        cursor.execute("DELETE FROM ongoing_match_events WHERE server_id = ?", (serverId,))
+
+    def removeStatistics(self, cursor: sqlite3.Cursor, matchId: str):
+        """Subtracts a saved match from the statistic tables, using its rows in the raw tables. Must be called on the writer thread, before the raw rows are deleted."""
+        match = cursor.execute("SELECT server_id, map, result FROM matches WHERE match_id = ?", (matchId,)).fetchone()
+        if match is None:
+            return
+
+        playerIds = [row[0] for row in cursor.execute("SELECT player_id FROM player_matches WHERE match_id = ?", (matchId,))]
+        roundResults = cursor.execute("SELECT site, result FROM rounds WHERE match_id = ?", (matchId,)).fetchall()
+        playerRounds = cursor.execute("""
+            SELECT player_rounds.player_id, rounds.site, rounds.result, player_rounds.operator
+            FROM player_rounds
+            JOIN rounds ON player_rounds.match_id = rounds.match_id AND player_rounds.round_num = rounds.round_num
+            WHERE player_rounds.match_id = ?
+        """, (matchId,)).fetchall()
+
+        self.updateStatistics(cursor, match[0], match[1], match[2] == 1, playerIds, roundResults, playerRounds, sign=-1)
+        # Only the rows of the match's players and server can have dropped to zero, which are found through the primary keys instead of reading the whole tables
+        for table in ['player_map_stats', 'player_site_stats', 'player_operator_stats']:
+            cursor.execute(f"DELETE FROM {table} WHERE player_id IN ({', '.join('?' * len(playerIds))}) AND wins = 0 AND losses = 0", playerIds)
+        for table in ['server_map_stats', 'server_site_stats', 'server_operator_stats']:
+            cursor.execute(f"DELETE FROM {table} WHERE server_id = ? AND wins = 0 AND losses = 0", (match[0],))
+
+    async def rebuildStatistics(self):
+        """Recomputes all statistic tables from the raw match tables."""
+        await self.transaction(self._rebuildStatistics)
+
+    def _rebuildStatistics(self, cursor: sqlite3.Cursor):
+        wins = "SUM(CASE WHEN {column} = 1 THEN 1 ELSE 0 END)"
+        losses = "SUM(CASE WHEN {column} = 1 THEN 0 ELSE 1 END)"
+        matchWinsLosses = f"{wins.format(column='matches.result')}, {losses.format(column='matches.result')}"
+        roundWinsLosses = f"{wins.format(column='rounds.result')}, {losses.format(column='rounds.result')}"
+
+        for table in ['player_map_stats', 'player_site_stats', 'player_operator_stats', 'server_map_stats', 'server_site_stats', 'server_operator_stats']:
+            cursor.execute(f"DELETE FROM {table}")
+
+        cursor.execute(f"""
+            INSERT INTO player_map_stats
+            SELECT player_matches.player_id, COALESCE(matches.map, ''), {matchWinsLosses}
+            FROM player_matches
+            JOIN matches ON player_matches.match_id = matches.match_id
+            GROUP BY 1, 2
+        """)
+        cursor.execute(f"""
+            INSERT INTO player_site_stats
+            SELECT player_rounds.player_id, COALESCE(matches.map, ''), COALESCE(rounds.site, -1), {roundWinsLosses}
+            FROM player_rounds
+            JOIN rounds ON player_rounds.match_id = rounds.match_id AND player_rounds.round_num = rounds.round_num
+            JOIN matches ON player_rounds.match_id = matches.match_id
+            GROUP BY 1, 2, 3
+        """)
+        cursor.execute(f"""
+            INSERT INTO player_operator_stats
+            SELECT player_rounds.player_id, player_rounds.operator, {roundWinsLosses}
+            FROM player_rounds
+            JOIN rounds ON player_rounds.match_id = rounds.match_id AND player_rounds.round_num = rounds.round_num
+            GROUP BY 1, 2
+        """)
+        cursor.execute(f"""
+            INSERT INTO server_map_stats
+            SELECT matches.server_id, COALESCE(matches.map, ''), {matchWinsLosses}
+            FROM matches
+            GROUP BY 1, 2
+        """)
+        cursor.execute(f"""
+            INSERT INTO server_site_stats
+            SELECT matches.server_id, COALESCE(matches.map, ''), COALESCE(rounds.site, -1), {roundWinsLosses}
+            FROM rounds
+            JOIN matches ON rounds.match_id = matches.match_id
+            GROUP BY 1, 2, 3
+        """)
+        cursor.execute(f"""
+            INSERT INTO server_operator_stats
+            SELECT matches.server_id, player_rounds.operator, {roundWinsLosses}
+            FROM player_rounds
+            JOIN rounds ON player_rounds.match_id = rounds.match_id AND player_rounds.round_num = rounds.round_num
+            JOIN matches ON player_rounds.match_id = matches.match_id
+            GROUP BY 1, 2
+        """)
+
+    def removeMatchesWithoutMap(self, cursor: sqlite3.Cursor):
+        """Deletes all matches that have no map set, along with their rounds. Must be called on the writer thread."""
+        # Get all match ids where map is null
+        cursor.execute("SELECT match_id FROM matches WHERE map IS NULL")
+        matchIds = [(row[0],) for row in cursor.fetchall()]
+
+        # Delete data associated with these match ids in the other tables
+        cursor.executemany("DELETE FROM player_matches WHERE match_id = ?", matchIds)
+        cursor.executemany("DELETE FROM rounds WHERE match_id = ?", matchIds)
+        cursor.executemany("DELETE FROM player_rounds WHERE match_id = ?", matchIds)
+
+        # Delete matches where map is null
+        cursor.execute("DELETE FROM matches WHERE map IS NULL")
+        self._rebuildStatistics(cursor)
+
+    def _openReadConnection(self):
+        conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+        self._local.conn = conn
+        with self._readConnsLock:
+            self._readConns.append(conn)
+
+    @contextmanager
+    def counting(self):
+        """Counts the read queries and commits made by the current task (e.g. a command) until the block is left. Blocks can be nested."""
+        counter = QueryCounter(_activeCounter.get())
+        token = _activeCounter.set(counter)
+        try:
+            yield counter
+        finally:
+            _activeCounter.reset(token)
+
+    def _count(self, isCommit: bool):
+        counter = _activeCounter.get()
+        if isCommit:
+            self.commits += 1
+        else:
+            self.queries += 1
+        while counter is not None:
+            if isCommit:
+                counter.commits += 1
+            else:
+                counter.queries += 1
+            counter = counter.parent
+
+    async def _run(self, executor: ThreadPoolExecutor, function, *args):
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+        finally:
+            duration = time.perf_counter() - start
+            self.dbTime += duration
+            counter = _activeCounter.get()
+            while counter is not None:
+                counter.dbTime += duration
+                counter = counter.parent
+
+    async def fetchone(self, query: str, parameters: tuple = ()):
+        """Runs a read query on one of the reader threads and returns the first row."""
+        self._count(isCommit=False)
+        return await self._run(self._readers, lambda: self._local.conn.execute(query, parameters).fetchone())
+
+    async def fetchall(self, query: str, parameters: tuple = ()):
+        """Runs a read query on one of the reader threads and returns all rows."""
+        self._count(isCommit=False)
+        return await self._run(self._readers, lambda: self._local.conn.execute(query, parameters).fetchall())
+
+    async def transaction(self, function, *args):
+        """Calls function(cursor, *args) on the writer thread inside a single transaction, which is rolled back if it raises."""
+        self._count(isCommit=True)
+        def write():
+            with self._writeConn:
+                return function(self._writeConn.cursor(), *args)
+        return await self._run(self._writer, write)
+
+    def close(self):
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        with self._readConnsLock:
+            for conn in self._readConns:
+                conn.close()
+        self._writeConn.close()
@@ -0,0 +1,285 @@
+"""An in-process stand-in for the parts of Discord the bot uses, so its commands and buttons can be run without a network connection, e.g. by loadTest.py.
+Every call that would be a REST request is counted, and the gateway events the bot listens to are dispatched to it the way Discord sends them."""
+import asyncio
+import datetime
+import itertools
+import re
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import SimpleNamespace
+import discord
+
+# The REST calls counted by the current task, see FakeDiscord.countingRest
+_activeRestCounter = ContextVar('activeRestCounter', default=None)
+
+class FakeDiscord:
+    """Connects a RainbowBot to simulated servers. Only the attributes and methods the bot and its cogs use are implemented."""
+    def __init__(self, bot: discord.Client, restLatency: float = 0.0):
+        self.bot = bot
+        # The seconds each REST call takes
+        self.restLatency = restLatency
+        # The number of REST calls made since the start, by route
+        self.restCalls = Counter()
+        # Ids as long as Discord's snowflakes, which discord.py's converters require of mentions
+        self._ids = itertools.count(1 << 60)
+        self._channels = {}
+        self._state = _FakeState(self)
+
+        self.user = FakeMember(self.nextId(), 'RandomSixBot', isBot=True)
+        bot._connection.user = self.user
+        # The messages the bot received from the gateway, which discord.Client.cached_messages is based on
+        bot._connection._messages = deque(maxlen=bot._connection.max_messages or 1000)
+
+    async def login(self):
+        """Prepares the bot like discord.Client.login does, without connecting to Discord."""
+        await self.bot._async_setup_hook()
+        await self.bot.setup_hook()
+
+    def nextId(self):
+        return next(self._ids)
+
+    def createGuild(self, numMembers: int = 5, name: str = None):
+        """Creates a server with a text channel, a voice channel and the given number of members besides the bot."""
+        guild = FakeGuild(self.nextId(), name)
+        guild.members = [FakeMember(self.nextId(), f'player{i}') for i in range(numMembers)] + [self.user]
+        guild.textChannel = FakeTextChannel(self, guild, 'general')
+        guild.voiceChannel = FakeVoiceChannel(guild, self.nextId(), 'Voice')
+        return guild
+
+    @contextmanager
+    def countingRest(self):
+        """Counts the REST calls made by the current task until the block is left, by route."""
+        counter = Counter()
+        token = _activeRestCounter.set(counter)
+        try:
+            yield counter
+        finally:
+            _activeRestCounter.reset(token)
+
+    async def sendCommand(self, channel, author, content: str):
+        """Posts a message as the given member, and waits until the bot has handled it."""
+        message = self._createMessage(channel, author, content)
+        await self.bot.on_message(message)
+        return message
+
+    async def click(self, message, user, customId: str):
+        """Clicks a button of a message as the given member, and waits until the bot has handled it. Returns False if the message has no such button."""
+        if customId not in message.components:
+            return False
+        await self.bot.on_interaction(FakeInteraction(self, message, user, customId))
+        return True
+
+    async def _request(self, route: str):
+        self.restCalls[route] += 1
+        counter = _activeRestCounter.get()
+        if counter is not None:
+            counter[route] += 1
+        await asyncio.sleep(self.restLatency)
+
+    def _createMessage(self, channel, author, content: str, components: list = (), type: discord.MessageType = discord.MessageType.default):
+        message = FakeMessage(self, channel, author, content, components, type)
+        channel.messages.append(message)
+        self.bot._connection._messages.append(message)
+        return message
+
+    def _dispatchCreate(self, message):
+        self.bot.dispatch('message', message)
+
+    def _dispatchEdit(self, message):
+        self.bot.dispatch('raw_message_edit', SimpleNamespace(channel_id=message.channel.id, message_id=message.id, guild_id=message.guild.id, data={'content': message.content}))
+
+    def _dispatchDelete(self, message):
+        self.bot.dispatch('raw_message_delete', SimpleNamespace(channel_id=message.channel.id, message_id=message.id, guild_id=message.guild.id))
+
+class _FakeState:
+    """The subset of discord.py's ConnectionState that commands.Context.send uses."""
+    def __init__(self, fake: FakeDiscord):
+        self.allowed_mentions = None
+        self.http = SimpleNamespace(send_message=self._sendMessage)
+        self._fake = fake
+
+    async def _sendMessage(self, channelId: int, params):
+        components = [component['custom_id'] for row in params.payload.get('components', []) for component in row['components']]
+        return await self._fake._channels[channelId]._send(params.payload.get('content'), components)
+
+    def create_message(self, channel, data):
+        # The message was already created by _sendMessage, which returns it as the payload
+        return data
+
+class FakeMember:
+    def __init__(self, id: int, name: str, isBot: bool = False):
+        self.id = id
+        self.name = name
+        self.nick = None
+        self.global_name = None
+        self.display_name = name
+        self.mention = f'<@{id}>'
+        self.bot = isBot
+        # The voice state of the member, which has the voice channel the member is in as its channel, or None if the member is not in one
+        self.voice = None
+
+    def __str__(self):
+        return self.name
+
+class FakeGuild:
+    def __init__(self, id: int, name: str = None):
+        self.id = id
+        self.name = name or f'Server {id}'
+        self.members = []
+        self.textChannel = None
+        self.voiceChannel = None
+
+    @property
+    def players(self):
+        """The members of the server that are not the bot."""
+        return [member for member in self.members if not member.bot]
+
+    def get_member(self, id: int):
+        return discord.utils.get(self.members, id=id)
+
+class FakeVoiceChannel:
+    def __init__(self, guild: FakeGuild, id: int, name: str):
+        self.guild = guild
+        self.id = id
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def members(self):
+        # A new list every time, like discord.VoiceChannel.members
+        return [member for member in self.guild.members if member.voice is not None and member.voice.channel is self]
+
+    def connect(self, member: FakeMember):
+        """Moves the member into this voice channel."""
+        member.voice = SimpleNamespace(channel=self)
+
+class FakeTextChannel:
+    type = discord.ChannelType.text
+
+    def __init__(self, fake: FakeDiscord, guild: FakeGuild, name: str, id: int = None):
+        self.id = id or fake.nextId()
+        self.guild = guild
+        self.name = name
+        # The messages of the channel from oldest to newest
+        self.messages = []
+        # The threads started on the messages of the channel, by the id of the message they were started on
+        self._threads = {}
+        self._fake = fake
+        fake._channels[self.id] = self
+
+    async def send(self, content: str = None, view: discord.ui.View = None):
+        return await self._send(content, _customIds(view))
+
+    async def _send(self, content: str, components: list):
+        await self._fake._request('POST /channels/{channel_id}/messages')
+        message = self._fake._createMessage(self, self._fake.user, content or '', components)
+        self._fake._dispatchCreate(message)
+        return message
+
+    async def history(self, limit: int = 100):
+        await self._fake._request('GET /channels/{channel_id}/messages')
+        for message in self.messages[::-1][:limit]:
+            yield message
+
+    async def fetch_message(self, id: int):
+        await self._fake._request('GET /channels/{channel_id}/messages/{message_id}')
+        message = discord.utils.get(self.messages, id=id)
+        if message is None:
+            raise discord.NotFound(SimpleNamespace(status=404, reason='Not Found'), 'Unknown Message')
+        return message
+
+    def get_thread(self, id: int):
+        return self._threads.get(id)
+
+    async def create_thread(self, name: str, auto_archive_duration: int = None, message=None):
+        await self._fake._request('POST /channels/{channel_id}/messages/{message_id}/threads')
+        # Threads started on a message share its id, and Discord does not post a system message for them
+        thread = FakeThread(self._fake, self, name, message.id)
+        self._threads[thread.id] = thread
+        return thread
+
+class FakeThread(FakeTextChannel):
+    type = discord.ChannelType.public_thread
+
+    def __init__(self, fake: FakeDiscord, parent: FakeTextChannel, name: str, id: int):
+        super().__init__(fake, parent.guild, name, id)
+        self.parent = parent
+        self.archived = False
+
+    async def edit(self, archived: bool = None):
+        await self._fake._request('PATCH /channels/{channel_id}')
+        if archived is not None:
+            self.archived = archived
+        return self
+
+class FakeMessage:
+    def __init__(self, fake: FakeDiscord, channel: FakeTextChannel, author: FakeMember, content: str, components: list = (), type: discord.MessageType = discord.MessageType.default):
+        self.id = fake.nextId()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.type = type
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.edited_at = None
+        self.attachments = []
+        self.mentions = [member for member in (channel.guild.get_member(int(id)) for id in re.findall(r'<@!?(\d+)>', content)) if member is not None]
+        self.reactions = []
+        # The custom ids of the buttons on the message
+        self.components = list(components)
+        self._state = fake._state
+        self._fake = fake
+
+    async def edit(self, content: str = None, view: discord.ui.View = None):
+        await self._fake._request('PATCH /channels/{channel_id}/messages/{message_id}')
+        if content is not None:
+            self.content = content
+        if view is not None:
+            self.components = _customIds(view)
+        self.edited_at = datetime.datetime.now(datetime.timezone.utc)
+        self._fake._dispatchEdit(self)
+        return self
+
+    async def delete(self):
+        await self._fake._request('DELETE /channels/{channel_id}/messages/{message_id}')
+        if self in self.channel.messages:
+            self.channel.messages.remove(self)
+            self._fake._dispatchDelete(self)
+
+    async def add_reaction(self, emoji: str):
+        await self._fake._request('PUT /channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me')
+        if discord.utils.get(self.reactions, emoji=emoji) is None:
+            self.reactions.append(SimpleNamespace(emoji=emoji, count=1, me=True))
+
+    async def remove_reaction(self, emoji: str, member: FakeMember):
+        await self._fake._request('DELETE /channels/{channel_id}/messages/{message_id}/reactions/{emoji}/{user_id}')
+        self.reactions = [reaction for reaction in self.reactions if reaction.emoji != emoji]
+
+    async def clear_reaction(self, emoji: str):
+        await self._fake._request('DELETE /channels/{channel_id}/messages/{message_id}/reactions/{emoji}')
+        self.reactions = [reaction for reaction in self.reactions if reaction.emoji != emoji]
+
+    async def clear_reactions(self):
+        await self._fake._request('DELETE /channels/{channel_id}/messages/{message_id}/reactions')
+        self.reactions = []
+
+class FakeInteraction:
+    """A click on a button of a message."""
+    type = discord.InteractionType.component
+
+    def __init__(self, fake: FakeDiscord, message: FakeMessage, user: FakeMember, customId: str):
+        self.data = {'custom_id': customId, 'component_type': discord.ComponentType.button.value}
+        self.guild_id = message.guild.id
+        self.message = message
+        self.user = user
+        self.response = SimpleNamespace(defer=self._defer)
+        self._fake = fake
+
+    async def _defer(self):
+        await self._fake._request('POST /interactions/{interaction_id}/{interaction_token}/callback')
+
+def _customIds(view: discord.ui.View):
+    return [item.custom_id for item in view.children] if view is not None else []
@@ -0,0 +1,193 @@
+"""Plays matches on thousands of simulated servers at once through the bot's commands and buttons, against the in-process Discord stand-in of fakeDiscord.py,
+and reports the latency, database time and REST calls of each kind of command. No network connection or bot token is needed, and the matches are saved to a temporary database.
+
+Usage: python loadTest.py [--guilds N] [--matches N] [--concurrency N] [--latency MS] [--think MS] [--window S] [--seed N]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+# The bot prints a line for every command in debug mode
+os.environ['IS_DEBUG'] = '0'
+
+from bot import RainbowBot
+from fakeDiscord import FakeDiscord
+from matchControls import CONTROLS, CUSTOM_ID_PREFIX
+from rainbow import RainbowData
+
+# The share of the actions that have a button which are made by clicking it, if it is already shown, instead of using the command
+CLICK_RATE = 0.5
+
+class LoadTest:
+    """Drives the simulated servers, and collects a (latency, dbTime, queries, commits, restCalls) sample for every command and button click."""
+    def __init__(self, bot: RainbowBot, fake: FakeDiscord, numMatches: int, thinkTime: float):
+        self.bot = bot
+        self.fake = fake
+        self.numMatches = numMatches
+        self.thinkTime = thinkTime
+        self.samples = defaultdict(list)
+        self.errors = Counter()
+        bot.add_listener(self._onCommandError, 'on_command_error')
+
+    async def _onCommandError(self, ctx, error):
+        self._recordError(error)
+
+    def _recordError(self, error: Exception):
+        if not self.errors:
+            print(f'First error: {error!r}')
+        self.errors[type(error).__name__] += 1
+
+    async def playServer(self, guild, rng: random.Random):
+        """Plays the matches of a single server, one action after another like its players would."""
+        players = None
+        for matchNum in range(self.numMatches):
+            # Later matches are started with the same players half of the time, through the button of the previous match message
+            if players is None or not await self._click(guild, players[0], '👍', rng):
+                players = rng.sample(guild.players, k=rng.randint(1, 5))
+                if rng.random() < 0.3:
+                    for player in players:
+                        guild.voiceChannel.connect(player)
+                    await self._command(guild, players[0], 'startMatch', '!startMatch here', rng)
+                else:
+                    await self._command(guild, players[0], 'startMatch', '!startMatch ' + ' '.join(player.mention for player in players), rng)
+            author = players[0]
+
+            if rng.random() < 0.7:
+                bans = rng.sample(RainbowData.roster.attackers, k=2) + rng.sample(RainbowData.roster.defenders, k=2)
+                await self._command(guild, author, 'ban', '!ban ' + ' '.join(bans), rng)
+            side = rng.choice(['attack', 'defense'])
+            await self._action(guild, author, side, '⚔️' if side == 'attack' else '🛡️', rng)
+
+            scores = [0, 0]
+            while not _isFinished(scores):
+                if rng.random() < 0.05:
+                    await self._click(guild, author, '🗡️', rng)
+                result = rng.choice(['won', 'lost'])
+                scores[0 if result == 'won' else 1] += 1
+                # The round that leads to overtime needs the side overtime starts on, which only the command can be given directly
+                if scores == [3, 3]:
+                    await self._command(guild, author, result, f'!{result} {rng.choice(["attack", "defense"])}', rng)
+                else:
+                    await self._action(guild, author, result, '🇼' if result == 'won' else '🇱', rng)
+
+            if rng.random() < 0.2:
+                await self._command(guild, author, 'stats', rng.choice(['!stats', '!stats server', f'!stats {rng.choice(players).mention}']), rng)
+            if matchNum == self.numMatches - 1 or rng.random() < 0.5:
+                await self._action(guild, author, 'goodnight', '👎', rng)
+            for player in guild.players:
+                player.voice = None
+
+    async def _action(self, guild, author, command: str, emoji: str, rng: random.Random):
+        """Clicks the button of the action if it is shown on the match message, and otherwise uses its command."""
+        if not await self._click(guild, author, emoji, rng):
+            await self._command(guild, author, command, f'!{command}', rng)
+
+    async def _command(self, guild, author, name: str, content: str, rng: random.Random):
+        await self._measure(f'!{name}', lambda: self.fake.sendCommand(guild.textChannel, author, content), rng)
+
+    async def _click(self, guild, author, emoji: str, rng: random.Random):
+        """Clicks a button of the server's match message some of the time, and returns whether it did."""
+        customId = CUSTOM_ID_PREFIX + CONTROLS[emoji][0]
+        matchMessage = _getMatchMessage(guild.textChannel)
+        if matchMessage is None or customId not in matchMessage.components or rng.random() >= CLICK_RATE:
+            return False
+        await self._measure(f'button {CONTROLS[emoji][0]}', lambda: self.fake.click(matchMessage, author, customId), rng)
+        return True
+
+    async def _measure(self, name: str, action, rng: random.Random):
+        if self.thinkTime > 0:
+            await asyncio.sleep(rng.expovariate(1 / self.thinkTime))
+        with self.bot.db.counting() as counter, self.fake.countingRest() as restCalls:
+            start = time.perf_counter()
+            try:
+                await action()
+            except Exception as e:
+                self._recordError(e)
+            latency = time.perf_counter() - start
+        self.samples[name].append((latency, counter.dbTime, counter.queries, counter.commits, sum(restCalls.values())))
+
+def _isFinished(scores: list):
+    # First to four, or first to five after overtime at 3:3
+    return (max(scores) == 4 and min(scores) <= 2) or max(scores) == 5
+
+def _getMatchMessage(channel):
+    """Returns the newest message of the bot with buttons in the channel, which is the match message."""
+    for message in reversed(channel.messages):
+        if message.author.bot and message.components:
+            return message
+    return None
+
+def _percentile(sortedValues: list, fraction: float):
+    return sortedValues[min(len(sortedValues) - 1, int(fraction * len(sortedValues)))]
+
+def printReport(test: LoadTest, bot: RainbowBot, fake: FakeDiscord, duration: float, numGuilds: int):
+    allSamples = [sample for samples in test.samples.values() for sample in samples]
+    numActions = len(allSamples)
+    print(f'Handled {numActions} commands and button clicks on {numGuilds} servers in {duration:.2f}s ({numActions / duration:.0f}/s)')
+    print(f'{"":<20}{"count":>8}{"p50 ms":>9}{"p99 ms":>9}{"DB ms":>8}{"queries":>9}{"commits":>9}{"REST":>7}')
+    for name, samples in sorted(test.samples.items()) + [('all', allSamples)]:
+        latencies = sorted(sample[0] for sample in samples)
+        count = len(samples)
+        print(f'{name:<20}{count:>8}{_percentile(latencies, 0.5) * 1000:>9.2f}{_percentile(latencies, 0.99) * 1000:>9.2f}'
+              f'{sum(sample[1] for sample in samples) / count * 1000:>8.2f}{sum(sample[2] for sample in samples) / count:>9.2f}'
+              f'{sum(sample[3] for sample in samples) / count:>9.2f}{sum(sample[4] for sample in samples) / count:>7.2f}')
+
+    numRestCalls = sum(fake.restCalls.values())
+    numDeferredCalls = numRestCalls - sum(sample[4] for sample in allSamples)
+    print(f'REST calls: {numRestCalls} in total, {numRestCalls / numActions:.2f} per command, of which {numDeferredCalls / numActions:.2f} are merged match message edits made after the command')
+    for route, count in fake.restCalls.most_common():
+        print(f'\t{count:>9}  {route}')
+    cacheStats = bot.matchCache.stats()
+    print(f'Match message updates: {bot.renderer.renders} edits after merging, {bot.renderer.coalesced} merged away, {bot.renderMetrics["skippedEdits"]} skipped as unchanged')
+    print(f'Server queue: {bot.guildQueue.numWaits} turns, {bot.guildQueue.maxWaitTime * 1000:.2f}ms longest wait')
+    print(f'Match cache: {cacheStats["hitRate"]:.2%} hit rate, {cacheStats["evictions"]} evictions')
+    print(f'Buttons: {bot.controlMetrics["handled"]} handled, {bot.controlMetrics["shortCircuited"]} dropped')
+    print(f'Errors: {dict(test.errors) if test.errors else "none"}')
+
+async def runLoadTest(args):
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    random.seed(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        bot = RainbowBot(os.path.join(directory, 'loadTest.db'))
+        if args.window is not None:
+            bot.renderer.window = args.window
+        fake = FakeDiscord(bot, args.latency / 1000)
+        await fake.login()
+
+        guilds = [fake.createGuild(numMembers=8) for _ in range(args.guilds)]
+        test = LoadTest(bot, fake, args.matches, args.think / 1000)
+        semaphore = asyncio.Semaphore(args.concurrency)
+        async def playServer(guild, rng):
+            async with semaphore:
+                await test.playServer(guild, rng)
+
+        print(f'Playing {args.matches} match(es) on each of {args.guilds} servers, {args.concurrency} at a time, with seed {seed}')
+        start = time.perf_counter()
+        await asyncio.gather(*[playServer(guild, random.Random(seed + i)) for i, guild in enumerate(guilds)])
+        # The last updates of each match message are only made once their window has passed
+        while len(bot.renderer):
+            await asyncio.sleep(0.05)
+        duration = time.perf_counter() - start
+        # Let the gateway events that were dispatched last be handled
+        await asyncio.sleep(0)
+
+        printReport(test, bot, fake, duration, args.guilds)
+        bot.db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays matches on many simulated servers through the bot against an in-process stand-in for Discord, and reports command latencies, database time and REST calls.')
+    parser.add_argument('--guilds', type=int, default=2000, help='The number of simulated servers.')
+    parser.add_argument('--matches', type=int, default=1, help='The number of matches played on each server.')
+    parser.add_argument('--concurrency', type=int, default=500, help='The number of servers playing at the same time.')
+    parser.add_argument('--latency', type=float, default=0.0, help='The milliseconds each simulated REST call takes.')
+    parser.add_argument('--think', type=float, default=0.0, help='The average milliseconds players wait before each command or button click.')
+    parser.add_argument('--window', type=float, default=None, help='Overrides MATCH_MESSAGE_WINDOW, the seconds over which match message updates are merged.')
+    parser.add_argument('--seed', type=int, default=None, help='The seed of the first server, later servers use the following seeds.')
+    asyncio.run(runLoadTest(parser.parse_args()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+import time
+from collections import OrderedDict
+
+class OngoingMatchCache:
+    """A bounded cache of the live match and discord message of each server's ongoing match.
+    The least recently used server is evicted when the cache is full, and servers that have been idle for longer than the ttl (in seconds) are dropped.
+    The database remains the source of truth, so evicted servers are simply reloaded from it on their next command."""
+    def __init__(self, maxSize: int = 1000, ttl: float = 6 * 60 * 60):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        # Maps the server id to a [match, discordMessage, lastAccess] entry, ordered from least to most recently used
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, serverId: int):
+        return serverId in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, serverId: int):
+        """Returns the cached (match, discordMessage) tuple of the server, or None if it is not cached."""
+        self._evictExpired()
+        entry = self._entries.get(serverId)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        entry[2] = time.monotonic()
+        self._entries.move_to_end(serverId)
+        return entry[0], entry[1]
+
+    def put(self, serverId: int, match, discordMessage):
+        """Caches the match and discord message of the server, evicting the least recently used server if the cache is full."""
+        self._entries[serverId] = [match, discordMessage, time.monotonic()]
+        self._entries.move_to_end(serverId)
+        self._evictExpired()
+        while len(self._entries) > self.maxSize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def update(self, serverId: int, **values):
+        """Replaces the match and/or discordMessage of a cached server. Servers that are not cached are left alone, as their row might not exist."""
+        entry = self._entries.get(serverId)
+        if entry is None:
+            return
+        if 'match' in values:
+            entry[0] = values['match']
+        if 'discordMessage' in values:
+            entry[1] = values['discordMessage']
+        entry[2] = time.monotonic()
+        self._entries.move_to_end(serverId)
+
+    def pop(self, serverId: int):
+        """Removes the server from the cache."""
+        self._entries.pop(serverId, None)
+
+    def stats(self):
+        """Returns the hit and miss counters of the cache."""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hitRate': self.hits / lookups if lookups else 0.0
+        }
+
+    def _evictExpired(self):
+        expiredBefore = time.monotonic() - self.ttl
+        while self._entries:
+            serverId, entry = next(iter(self._entries.items()))
+            if entry[2] >= expiredBefore:
+                break
+            del self._entries[serverId]
+            self.evictions += 1
+
+class MatchMessageIndex:
+    """The id of the match message of every server with an ongoing match, so clicks on the buttons of any other message can be ignored without loading anything.
+    Unlike the cache it is never evicted, as it is small and has to know every match message to be of any use."""
+    def __init__(self):
+        self._messageIds = {}
+        self._servers = {}
+
+    def __contains__(self, messageId: int):
+        return messageId in self._servers
+
+    def __len__(self):
+        return len(self._servers)
+
+    def set(self, serverId: int, messageId):
+        """Sets the match message of a server's ongoing match, which is None until the message is sent."""
+        self.discard(serverId)
+        self._messageIds[serverId] = messageId
+        if messageId is not None:
+            self._servers[messageId] = serverId
+
+    def update(self, serverId: int, messageId):
+        """Replaces the match message of a server. Servers without an ongoing match are left alone, like OngoingMatchCache.update."""
+        if serverId in self._messageIds:
+            self.set(serverId, messageId)
+
+    def discard(self, serverId: int):
+        """Removes the server's ongoing match from the index."""
+        messageId = self._messageIds.pop(serverId, None)
+        if messageId is not None:
+            del self._servers[messageId]
@@ -0,0 +1,257 @@
+"""Compact binary encodings of the ongoing match state that is saved on every command.
+Every encoding starts with a two byte tag and a version byte, so the format can change without breaking saved rows.
+Version 2 of the match encoding stores the number of bans in two bytes instead of one, version 1 matches are still decoded.
+Rows saved before the binary encodings were added are JSON text, and are still decoded by decodeMatch and decodeDiscordMessage."""
+import json
+import struct
+import uuid
+from array import array
+from rainbow import RainbowData, RainbowMatch
+
+MATCH_TAG = b'RM'
+DISCORD_MESSAGE_TAG = b'RD'
+MATCH_VERSION = 2
+DISCORD_MESSAGE_VERSION = 1
+
+_header = struct.Struct('<2sB')
+# matchId, seed, draws, side, currRound, blue score, red score, bitmask of the sites left, number of rounds
+_matchFields = struct.Struct('<16sQHbBBBBB')
+# message id, number of message content fields, number of reactions
+_discordMessageFields = struct.Struct('<QBB')
+_sides = (None, 'attack', 'defense')
+
+# Player mentions are almost always derived from the player's id, so only unusual ones are stored in full
+_MENTION = 0
+_NICKNAME_MENTION = 1
+_CUSTOM_MENTION = 2
+
+# The byte length that stands for None, as strings are at most a few thousand bytes long
+_NONE_LENGTH = 0xFFFF
+
+def _checkHeader(data: bytes, tag: bytes, maxVersion: int):
+    """Returns the offset after the header and the version of the data."""
+    dataTag, version = _header.unpack_from(data)
+    if dataTag != tag:
+        raise ValueError(f'Expected data tagged {tag!r}, got {dataTag!r}')
+    if not 1 <= version <= maxVersion:
+        raise ValueError(f'Unsupported version {version} of {tag!r} data')
+    return _header.size, version
+
+def _packCount(count: int, what: str):
+    """Packs a count that fits in a byte, 0xFF is reserved for None."""
+    if count >= 0xFF:
+        raise ValueError(f'Cannot encode {count} {what}, at most 254 fit in a byte')
+    return bytes([count])
+
+def _packMapName(matchMap: str):
+    if matchMap is None:
+        return b'\xff'
+    encoded = matchMap.encode('utf-8')
+    return _packCount(len(encoded), 'bytes of map name') + encoded
+
+def encodeMatch(match: RainbowMatch):
+    """Encodes the state of the match. The players string is not stored, as it is rebuilt from the players."""
+    roster = RainbowData.roster
+    numRounds = match.getNumRounds()
+    parts = [
+        _header.pack(MATCH_TAG, MATCH_VERSION),
+        _matchFields.pack(
+            uuid.UUID(match.matchId).bytes, match.seed, match.draws, _sides.index(match.playingOnSide), match.currRound,
+            match.scores['blue'], match.scores['red'], sum(1 << site for site in match.sites), numRounds
+        ),
+        # Map names are short, so their length fits in a byte
+        _packMapName(match.map),
+        struct.pack('<H', len(match.bannedOperators)),
+        array('b', [roster.getId(op) for op in match.bannedOperators]).tobytes(),
+        _packCount(len(match.players), 'players')
+    ]
+
+    # The ids and mention types of all players, followed by the byte lengths of their names and then the names themselves
+    mentionTypes = bytearray()
+    names = []
+    for player in match.players:
+        if player['mention'] == f'<@{player["id"]}>':
+            mentionTypes.append(_MENTION)
+        elif player['mention'] == f'<@!{player["id"]}>':
+            mentionTypes.append(_NICKNAME_MENTION)
+        else:
+            mentionTypes.append(_CUSTOM_MENTION)
+            names.append(player['mention'])
+        names += [player['name'], player['nick'], player['global_name']]
+    names = [None if name is None else name.encode('utf-8') for name in names]
+    parts += [
+        struct.pack(f'<{len(match.players)}Q', *[player['id'] for player in match.players]),
+        mentionTypes,
+        struct.pack(f'<{len(names)}H', *[_NONE_LENGTH if name is None else len(name) for name in names]),
+        *[name for name in names if name is not None],
+        match._rounds.tobytes(),
+        match._roundStats.tobytes()
+    ]
+
+    # Rounds started before the backups were regenerated still have them saved
+    if match._backupOperators is None:
+        parts.append(b'\xff')
+    else:
+        parts += [_packCount(len(match._backupOperators), 'backup operators'), array('b', [roster.getId(op) for op in match._backupOperators]).tobytes()]
+    return b''.join(parts)
+
+def decodeMatch(data):
+    """Decodes a match saved by encodeMatch, or as JSON text before the binary encoding was added."""
+    if isinstance(data, str):
+        return RainbowMatch(json.loads(data))
+
+    roster = RainbowData.roster
+    offset, version = _checkHeader(data, MATCH_TAG, MATCH_VERSION)
+    matchId, seed, draws, side, currRound, blue, red, sitesMask, numRounds = _matchFields.unpack_from(data, offset)
+    offset += _matchFields.size
+    mapLength = data[offset]
+    matchMap = None if mapLength == 0xFF else data[offset + 1:offset + 1 + mapLength].decode('utf-8')
+    offset += 1 + (0 if mapLength == 0xFF else mapLength)
+    # Version 1 stored the number of bans in a single byte
+    if version == 1:
+        numBans = data[offset]
+        offset += 1
+    else:
+        numBans, = struct.unpack_from('<H', data, offset)
+        offset += 2
+    bannedOperators = [roster.getName(op) for op in array('b', data[offset:offset + numBans])]
+    offset += numBans
+
+    numPlayers = data[offset]
+    offset += 1
+    playerIds = struct.unpack_from(f'<{numPlayers}Q', data, offset)
+    offset += 8 * numPlayers
+    mentionTypes = data[offset:offset + numPlayers]
+    offset += numPlayers
+    numNames = 3 * numPlayers + mentionTypes.count(_CUSTOM_MENTION)
+    lengths = struct.unpack_from(f'<{numNames}H', data, offset)
+    offset += 2 * numNames
+    names = []
+    for length in lengths:
+        if length == _NONE_LENGTH:
+            names.append(None)
+        else:
+            names.append(data[offset:offset + length].decode('utf-8'))
+            offset += length
+
+    players = []
+    names = iter(names)
+    for playerId, mentionType in zip(playerIds, mentionTypes):
+        if mentionType == _CUSTOM_MENTION:
+            mention = next(names)
+        else:
+            mention = f'<@{playerId}>' if mentionType == _MENTION else f'<@!{playerId}>'
+        players.append({'id': playerId, 'mention': mention, 'name': next(names), 'nick': next(names), 'global_name': next(names)})
+
+    # The match is filled in directly instead of through the constructor, which expects the dict format
+    match = RainbowMatch.__new__(RainbowMatch)
+    match.matchId = str(uuid.UUID(bytes=matchId))
+    match.bannedOperators = bannedOperators
+    match.map = matchMap
+    match.sites = [site for site in range(8) if sitesMask & (1 << site)]
+    match.playingOnSide = _sides[side]
+    match.currRound = currRound
+    match.scores = {'blue': blue, 'red': red}
+    match.players = players
+    match.playerStats = []
+    match.seed = seed
+    match.draws = draws
+    match._constructPlayersString()
+    match._setMapSites()
+    match._bannedOperatorSet = frozenset(bannedOperators)
+    match._resetEvents()
+
+    roundsSize = numRounds * RainbowMatch.roundWidth
+    match._rounds = array('b', data[offset:offset + roundsSize])
+    offset += roundsSize
+    roundStatsSize = numRounds * RainbowMatch.roundStatsWidth
+    match._roundStats = array('B', data[offset:offset + roundStatsSize])
+    offset += roundStatsSize
+
+    numBackups = data[offset]
+    if numBackups == 0xFF:
+        match._backupOperators = None
+    else:
+        match._backupOperators = [roster.getName(op) for op in array('b', data[offset + 1:offset + 1 + numBackups])]
+    return match
+
+# The type of an event is its first byte, followed by its arguments
+_eventTypes = ('draw', 'ban', 'unban', 'map', 'start', 'round', 'swap', 'site', 'stat', 'resolve')
+_eventTypeIds = {eventType: index for index, eventType in enumerate(_eventTypes)}
+_results = ('lost', 'won')
+
+def encodeEvent(event: tuple):
+    """Encodes an event recorded by a match. Events are not versioned, as they are only ever replayed on top of a snapshot saved by the same version."""
+    roster = RainbowData.roster
+    eventType = event[0]
+    encoded = bytes([_eventTypeIds[eventType]])
+    if eventType in ('ban', 'unban'):
+        return encoded + array('b', [roster.getId(op) for op in event[1]]).tobytes()
+    if eventType == 'map':
+        # Map names are never empty, so no name stands for no map
+        return encoded + (event[1].encode('utf-8') if event[1] is not None else b'')
+    if eventType == 'start':
+        return encoded + bytes([_sides.index(event[1])])
+    if eventType == 'swap':
+        return encoded + struct.pack('<Bb', event[1], event[2])
+    if eventType == 'site':
+        return encoded + bytes([event[1]])
+    if eventType == 'stat':
+        return encoded + bytes([event[1], RainbowMatch.statTypes.index(event[2])])
+    if eventType == 'resolve':
+        return encoded + bytes([_results.index(event[1]), _sides.index(event[2])])
+    return encoded
+
+def decodeEvent(data: bytes):
+    """Decodes an event saved by encodeEvent."""
+    roster = RainbowData.roster
+    eventType = _eventTypes[data[0]]
+    if eventType in ('ban', 'unban'):
+        return (eventType, [roster.getName(op) for op in array('b', data[1:])])
+    if eventType == 'map':
+        return (eventType, data[1:].decode('utf-8') if len(data) > 1 else None)
+    if eventType == 'start':
+        return (eventType, _sides[data[1]])
+    if eventType == 'swap':
+        return (eventType, *struct.unpack_from('<Bb', data, 1))
+    if eventType == 'site':
+        return (eventType, data[1])
+    if eventType == 'stat':
+        return (eventType, data[1], RainbowMatch.statTypes[data[2]])
+    if eventType == 'resolve':
+        return (eventType, _results[data[1]], _sides[data[2]])
+    return (eventType,)
+
+def encodeDiscordMessage(discordMessage: dict):
+    """Encodes the state of the match message. The byte lengths of all strings are packed together before the strings, so they can be read in one go."""
+    messageContent = discordMessage['messageContent']
+    strings = [string.encode('utf-8') for string in [*messageContent.keys(), *messageContent.values(), *discordMessage['reactions']]]
+    return b''.join([
+        _header.pack(DISCORD_MESSAGE_TAG, DISCORD_MESSAGE_VERSION),
+        # Discord ids are never 0, so it stands for a message that has not been sent yet
+        _discordMessageFields.pack(discordMessage['matchMessageId'] or 0, len(messageContent), len(discordMessage['reactions'])),
+        struct.pack(f'<{len(strings)}H', *map(len, strings)),
+        *strings
+    ])
+
+def decodeDiscordMessage(data):
+    """Decodes a match message saved by encodeDiscordMessage, or as JSON text before the binary encoding was added."""
+    if isinstance(data, str):
+        return json.loads(data)
+
+    offset, _ = _checkHeader(data, DISCORD_MESSAGE_TAG, DISCORD_MESSAGE_VERSION)
+    matchMessageId, numFields, numReactions = _discordMessageFields.unpack_from(data, offset)
+    offset += _discordMessageFields.size
+    numStrings = 2 * numFields + numReactions
+    lengths = struct.unpack_from(f'<{numStrings}H', data, offset)
+    offset += 2 * numStrings
+
+    strings = []
+    for length in lengths:
+        strings.append(data[offset:offset + length].decode('utf-8'))
+        offset += length
+    return {
+        'matchMessageId': matchMessageId or None,
+        'messageContent': dict(zip(strings[:numFields], strings[numFields:2 * numFields])),
+        'reactions': strings[2 * numFields:]
+    }
@@ -0,0 +1,31 @@
+import discord
+
+# The button shown for each control of discordMessage['reactions'], as (custom id, label, style).
+# The controls are still stored as their emojis, so saved match messages keep working.
+CONTROLS = {
+    '⚔️': ('attack', 'Attack', discord.ButtonStyle.primary),
+    '🛡️': ('defense', 'Defense', discord.ButtonStyle.primary),
+    '🇼': ('won', 'Won', discord.ButtonStyle.success),
+    '🇱': ('lost', 'Lost', discord.ButtonStyle.danger),
+    '🗡️': ('interrogation', 'Interrogation', discord.ButtonStyle.secondary),
+    '👍': ('another', 'Another match', discord.ButtonStyle.success),
+    '🎤': ('anotherHere', 'Another match with voice channel', discord.ButtonStyle.secondary),
+    '👎': ('goodnight', 'Goodnight', discord.ButtonStyle.danger),
+    '✋': ('delete', 'End without saving', discord.ButtonStyle.secondary)
+}
+CUSTOM_ID_PREFIX = 'randomSix:'
+_controlOfCustomId = {CUSTOM_ID_PREFIX + customId: emoji for emoji, (customId, _, _) in CONTROLS.items()}
+
+def buildControls(controls: list):
+    """Returns the view with a button for each control emoji, in order. Clicks are handled by RainbowBot.on_interaction, so the view has no callbacks,
+    and is stopped so discord.py does not keep it around for every match message."""
+    view = discord.ui.View(timeout=None)
+    for emoji in controls:
+        customId, label, style = CONTROLS[emoji]
+        view.add_item(discord.ui.Button(style=style, label=label, emoji=emoji, custom_id=CUSTOM_ID_PREFIX + customId))
+    view.stop()
+    return view
+
+def getControl(customId: str):
+    """Returns the control emoji of a button's custom id, or None if the button is not a match control."""
+    return _controlOfCustomId.get(customId)
@@ -0,0 +1,82 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from database import RainbowDatabase
+
+class MatchSession:
+    """The unit of work of a single command (or button click) on a server's ongoing match.
+    The match and discord message are loaded at most once and kept for the whole command, even if the cache evicts them in the meantime,
+    and all writes of the command are queued and flushed in a single transaction when it ends."""
+    def __init__(self, serverId: int):
+        self.serverId = serverId
+        self.isLoaded = False
+        self.match = None
+        self.discordMessage = None
+        self._writes = []
+
+    def remember(self, match, discordMessage):
+        """Keeps the current state of the ongoing match, which is None for both if the server has no ongoing match."""
+        self.isLoaded = True
+        self.match = match
+        self.discordMessage = discordMessage
+
+    def addWrite(self, function, *args):
+        """Queues a call of function(cursor, *args) for the flush. Writes are run in the order they were queued."""
+        self._writes.append((function, args))
+
+    async def flush(self, db: RainbowDatabase):
+        """Runs all queued writes in a single transaction."""
+        if not self._writes:
+            return
+        writes, self._writes = self._writes, []
+
+        def writeAll(cursor):
+            for function, args in writes:
+                function(cursor, *args)
+        await db.transaction(writeAll)
+
+# The session of the command that is being handled by the current task
+currentSession = ContextVar('currentSession', default=None)
+
+class GuildQueue:
+    """Runs the commands of each server one at a time, in the order they arrived, while commands of different servers run in parallel.
+    Otherwise two commands on the same match could both load it, and the changes of the first one would be lost when the second one saves."""
+    def __init__(self):
+        # The lock of each server with commands in flight, and the number of its commands that are running or waiting
+        self._servers = {}
+        self.numWaits = 0
+        self.totalWaitTime = 0.0
+        self.maxWaitTime = 0.0
+        self.maxDepth = 0
+
+    def depth(self, serverId: int):
+        """Returns the number of the server's commands that are running or waiting to run."""
+        entry = self._servers.get(serverId)
+        return entry[1] if entry is not None else 0
+
+    @property
+    def totalDepth(self):
+        """The number of commands that are running or waiting to run on all servers."""
+        return sum(entry[1] for entry in self._servers.values())
+
+    @asynccontextmanager
+    async def turn(self, serverId: int):
+        """Waits until all earlier commands of the server have finished, and blocks later ones until the context exits."""
+        entry = self._servers.get(serverId)
+        if entry is None:
+            entry = self._servers[serverId] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        self.maxDepth = max(self.maxDepth, entry[1])
+        start = time.perf_counter()
+        try:
+            async with entry[0]:
+                waitTime = time.perf_counter() - start
+                self.numWaits += 1
+                self.totalWaitTime += waitTime
+                self.maxWaitTime = max(self.maxWaitTime, waitTime)
+                yield waitTime
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._servers[serverId]
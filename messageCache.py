@@ -0,0 +1,66 @@
+from bisect import insort
+from collections import OrderedDict
+
+class RecentMessageCache:
+    """The most recent messages of the channels the bot posts match messages in, with their number of lines.
+    It is kept up to date from gateway events, so whether the match message is still near the bottom of its channel can be checked without fetching the channel history.
+    A channel is only known once its history has been fetched, and is forgotten again when deletions leave too few messages to be sure what the most recent ones are."""
+    def __init__(self, size: int = 7, maxChannels: int = 1000):
+        self.size = size
+        self.maxChannels = maxChannels
+        # Maps the channel id to [messages, isComplete], with the [messageId, numLines] of the messages sorted from oldest to newest.
+        # A channel is complete if it had fewer messages than were fetched, so every message it has is known.
+        self._channels = OrderedDict()
+
+    def __contains__(self, channelId: int):
+        return channelId in self._channels
+
+    def recent(self, channelId: int):
+        """Returns the (messageId, numLines) of the most recent messages of a known channel from newest to oldest, or None if the channel is not known."""
+        entry = self._channels.get(channelId)
+        if entry is None:
+            return None
+        self._channels.move_to_end(channelId)
+        return [tuple(message) for message in reversed(entry[0][-self.size:])]
+
+    def fetchLimit(self):
+        """The number of messages to fetch when a channel is not known. More than the window is kept, so a few deletions do not make the channel unknown again."""
+        return 2 * self.size
+
+    def prime(self, channelId: int, messages: list):
+        """Sets the messages of a channel from its fetched history, which is given from newest to oldest like discord.TextChannel.history."""
+        self._channels[channelId] = [[[message.id, _numLines(message.content)] for message in reversed(messages)], len(messages) < self.fetchLimit()]
+        self._channels.move_to_end(channelId)
+        while len(self._channels) > self.maxChannels:
+            self._channels.popitem(last=False)
+
+    def add(self, channelId: int, messageId: int, content: str):
+        """Adds a new message to a known channel. Messages are kept in the order of their ids, as the bot's own messages can be added both when sent and when their gateway event arrives."""
+        entry = self._channels.get(channelId)
+        if entry is None or any(message[0] == messageId for message in entry[0]):
+            return
+        insort(entry[0], [messageId, _numLines(content)])
+        if len(entry[0]) > self.fetchLimit():
+            del entry[0][:-self.fetchLimit()]
+            entry[1] = False
+
+    def edit(self, channelId: int, messageId: int, content: str):
+        """Updates the number of lines of an edited message."""
+        entry = self._channels.get(channelId)
+        if entry is None:
+            return
+        for message in entry[0]:
+            if message[0] == messageId:
+                message[1] = _numLines(content)
+
+    def delete(self, channelId: int, messageId: int):
+        """Removes a deleted message. If that leaves fewer messages than the window, older messages that are not known could be among the most recent ones, so the channel is forgotten."""
+        entry = self._channels.get(channelId)
+        if entry is None:
+            return
+        entry[0] = [message for message in entry[0] if message[0] != messageId]
+        if len(entry[0]) < self.size and not entry[1]:
+            del self._channels[channelId]
+
+def _numLines(content: str):
+    return len(content.split('\n'))
@@ -0,0 +1,58 @@
+import asyncio
+import contextvars
+
+class DebouncedRenderer:
+    """Merges the updates of each server's match message that are made within a short window into one, so fast commands and button clicks do not edit the same message back to back.
+    Only the latest update of the window is made, the window starts with the first update and is not extended by later ones."""
+    def __init__(self, window: float):
+        self.window = window
+        # Maps the server id to the [render, task, messageId] of its pending update
+        self._pending = {}
+        self.renders = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def schedule(self, serverId: int, messageId: int, render):
+        """Makes the update of the given message by awaiting render() at the end of the server's window, unless a later update replaces it first.
+        A pending update of another message must be flushed before, as it would otherwise be replaced."""
+        entry = self._pending.get(serverId)
+        if entry is not None:
+            entry[0] = render
+            entry[2] = messageId
+            self.coalesced += 1
+            return
+        # The update is made outside of the command that scheduled it, so it must not see that command's context variables
+        task = contextvars.Context().run(asyncio.create_task, self._renderLater(serverId))
+        self._pending[serverId] = [render, task, messageId]
+
+    def cancel(self, serverId: int, messageId: int):
+        """Drops the pending update of the server if it is an update of the given message, e.g. because the message is about to be replaced or is updated right away."""
+        entry = self._pending.get(serverId)
+        if entry is not None and entry[2] == messageId:
+            del self._pending[serverId]
+            entry[1].cancel()
+            self.coalesced += 1
+
+    async def flush(self, serverId: int):
+        """Makes the pending update of the server right away."""
+        entry = self._pending.get(serverId)
+        if entry is not None:
+            entry[1].cancel()
+            await self._render(serverId)
+
+    async def _renderLater(self, serverId: int):
+        await asyncio.sleep(self.window)
+        await self._render(serverId)
+
+    async def _render(self, serverId: int):
+        entry = self._pending.pop(serverId, None)
+        if entry is None:
+            return
+        self.renders += 1
+        try:
+            await entry[0]()
+        except Exception as e:
+            # Nothing awaits the update, so its errors would otherwise be lost
+            print(f'Could not update the match message of server {serverId}: {e}')
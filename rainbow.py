@@ -1,24 +1,72 @@
+import numpy as np
 import random
 import re
+import unicodedata
 import uuid
+from array import array
 from fuzzywuzzy import process
 from dataclasses import dataclass
+from functools import lru_cache
+from itertools import islice
+from types import MappingProxyType
+
+@dataclass(frozen=True)
+class OperatorRoster:
+    """An immutable roster of operators, with constant time lookups between operator names and their ids.
+    An operator's id is its 1-based index in the list of attackers, or its negated 1-based index in the list of defenders."""
+    attackers: tuple
+    defenders: tuple
+
+    def __post_init__(self):
+        ids = {name: index + 1 for index, name in enumerate(self.attackers)}
+        ids.update({name: -(index + 1) for index, name in enumerate(self.defenders)})
+        object.__setattr__(self, 'ids', MappingProxyType(ids))
+        object.__setattr__(self, 'names', MappingProxyType({operatorId: name for name, operatorId in ids.items()}))
+        object.__setattr__(self, 'sides', MappingProxyType({'attack': self.attackers, 'defense': self.defenders}))
+        object.__setattr__(self, 'attackerSet', frozenset(self.attackers))
+        object.__setattr__(self, 'defenderSet', frozenset(self.defenders))
+        object.__setattr__(self, '_sideIds', MappingProxyType({
+            'attack': np.arange(1, len(self.attackers) + 1, dtype=np.int8),
+            'defense': -np.arange(1, len(self.defenders) + 1, dtype=np.int8)
+        }))
+
+    def getId(self, name: str):
+        """Returns the id of the operator with the given name."""
+        return self.ids[name]
+
+    def getName(self, operatorId: int):
+        """Returns the name of the operator with the given id."""
+        return self.names[operatorId]
+
+    def sampleLineups(self, side: str, bannedOperators: frozenset, count: int, size: int = 5, rng: np.random.Generator = None):
+        """Returns a (count, size) array of operator ids, each row being a random lineup of distinct operators of the given side that are not banned.
+        Every operator gets a random key and banned operators get an infinite one, so the first columns of the sorted keys are a uniform sample of the available operators."""
+        rng = rng if rng is not None else np.random.default_rng()
+        sideIds = self._sideIds[side]
+        banned = np.fromiter((name in bannedOperators for name in self.sides[side]), dtype=bool, count=len(sideIds))
+        size = min(size, len(sideIds) - int(banned.sum()))
+
+        keys = rng.random((count, len(sideIds)))
+        keys[:, banned] = np.inf
+        return sideIds[np.argsort(keys, axis=1)[:, :size]]
 
 @dataclass
 class RainbowData:
-    attackers = [
+    attackers = (
         "Sledge", "Thatcher", "Ash", "Thermite", "Twitch", "Montagne", "Glaz", "Fuze", "Blitz", "IQ",
         "Buck", "Blackbeard", "Capitão", "Hibana", "Jackal", "Ying", "Zofia", "Dokkaebi", "Lion", "Finka",
         "Maverick", "Nomad", "Gridlock", "Nøkk", "Amaru", "Kali", "Iana", "Ace", "Zero", "Flores",
         "Osa", "Sens", "Grim", "Brava", "Ram", "Deimos"
-    ]
+    )
 
-    defenders = [
+    defenders = (
         "Smoke", "Mute", "Castle", "Pulse", "Doc", "Rook", "Kapkan", "Tachanka", "Jäger", "Bandit",
         "Frost", "Valkyrie", "Caveira", "Echo", "Mira", "Lesion", "Ela", "Vigil", "Alibi", "Maestro",
         "Clash", "Kaid", "Mozzie", "Warden", "Goyo", "Wamai", "Oryx", "Melusi", "Aruni", "Thunderbird",
         "Thorn", "Azami", "Solis", "Fenrir", "Tubarão"
-    ]
+    )
+
+    roster = OperatorRoster(attackers, defenders)
 
     maps = {
         'Lair': ['2F Master Office/2F R6 Room', '1F Bunks/1F Briefing', '1F Armory/1F Weapon Maintenance', 'B Lab/B Lab Support'],
@@ -48,8 +96,101 @@ class RainbowData:
         'UnknownMap': ['FIRST', 'SECOND', 'THIRD', 'FOURTH']
     }
 
+    # Common nicknames that should resolve to an operator or map, in addition to their names
+    operatorAliases = {
+        'Blackbeard': ['bb'],
+        'Dokkaebi': ['dokk'],
+        'Maverick': ['mav'],
+        'Montagne': ['monty'],
+        'Tachanka': ['chanka', 'lord'],
+        'Thunderbird': ['tb'],
+        'Valkyrie': ['valk']
+    }
+
+    mapAliases = {
+        'Club House': ['clubhouse'],
+        'Kafe Dostoyevsky': ['kafe', 'cafe'],
+        'Hereford Base': ['hereford'],
+        'Presidential Plane': ['plane'],
+        'Theme Park': ['themepark'],
+        'Emerald Plains': ['emerald'],
+        'Stadium Bravo': ['stadium'],
+        'Nighthaven Labs': ['nighthaven']
+    }
+
+class NameResolver:
+    """Resolves user input to one of a fixed list of names, such as operators or maps.
+    Exact, normalized (lowercase, without spaces, punctuation or diacritics, e.g. "jager" for "Jäger") and alias lookups are answered from hash tables.
+    Only input that matches none of them is fuzzy matched against all names."""
+    # Letters that are not split into a base letter and a diacritic by unicode normalization
+    _specialCharacters = str.maketrans({'ø': 'o', 'æ': 'ae', 'ß': 'ss'})
+
+    def __init__(self, names: list, aliases: dict = None, minimumScore: int = 75):
+        self.names = list(names)
+        self.minimumScore = minimumScore
+        self._exact = {name: name for name in self.names}
+        self._normalized = {self.normalize(name): name for name in self.names}
+        for name, nameAliases in (aliases or {}).items():
+            if name in self._exact:
+                for alias in nameAliases:
+                    self._normalized.setdefault(self.normalize(alias), name)
+
+        self.resolve = lru_cache(maxsize=1024)(self._resolve)
+
+    @classmethod
+    def normalize(cls, name: str):
+        name = unicodedata.normalize('NFKD', name.lower().translate(cls._specialCharacters))
+        return ''.join(character for character in name if character.isalnum())
+
+    def lookup(self, name: str):
+        """Returns the name the input is exactly, once normalized or as an alias, or None without fuzzy matching it."""
+        if name in self._exact:
+            return self._exact[name]
+        return self._normalized.get(self.normalize(name))
+
+    def _resolve(self, name: str):
+        """Returns the name the input resolves to, or None if it is not similar enough to any name."""
+        match = self.lookup(name)
+        if match is not None:
+            return match
+
+        if not self.normalize(name):
+            return None
+        match, score = process.extractOne(name, self.names)
+        return match if score >= self.minimumScore else None
+
+operatorResolver = NameResolver(RainbowData.attackers + RainbowData.defenders, RainbowData.operatorAliases, minimumScore=75)
+attackerResolver = NameResolver(RainbowData.attackers, RainbowData.operatorAliases, minimumScore=75)
+defenderResolver = NameResolver(RainbowData.defenders, RainbowData.operatorAliases, minimumScore=75)
+# Map names have always been accepted with a score above 70
+mapResolver = NameResolver(RainbowData.maps.keys(), RainbowData.mapAliases, minimumScore=71)
+
+def warmUpResolvers():
+    """Fuzzy matches a name on every resolver without caching it, so the first command with a misspelled name does not pay for fuzzywuzzy's lazy setup."""
+    for resolver in (operatorResolver, attackerResolver, defenderResolver, mapResolver):
+        resolver._resolve('warm up')
+
 class RainbowMatch:
-    def __init__(self, existingMatch=None):
+    """The state of a match. Rounds are stored as fixed-width records in a signed byte array, [site, result, operator ids...],
+    with -1 for a site or result that is not set and 0 for a player slot without an operator.
+    The player stats of the rounds are stored as unsigned byte counts, one for each stat type and player slot of every round.
+    toDict and the constructor convert to and from the dict format the match has always been saved in.
+    Every change that is not a change of players is also recorded as a small event, such as ('ban', names) or ('round',), so the match can be saved as
+    an append-only log of events on top of a snapshot. applyEvents replays them, which is deterministic as all randomness comes from the seed."""
+    __slots__ = (
+        'matchId', 'bannedOperators', 'map', 'sites', 'playingOnSide', 'currRound', 'scores', 'players', 'playersString', 'playerStats', 'seed', 'draws',
+        '_rounds', '_roundStats', '_backupOperators', '_mapSites', '_bannedOperatorSet', '_events', '_loggedEvents', '_needsSnapshot'
+    )
+
+    maxPlayers = 5
+    statTypes = ('interrogations', 'aces')
+    # site, result and one operator id for each player
+    roundWidth = 2 + maxPlayers
+    roundStatsWidth = len(statTypes) * maxPlayers
+    # The round stats are stored as bytes, far more than anyone can get in a round
+    maxRoundStat = 255
+
+    def __init__(self, existingMatch=None, seed: int = None):
         if existingMatch:
             self.matchId = existingMatch['matchId']
             self.bannedOperators = existingMatch['bannedOperators']
@@ -57,45 +198,209 @@ class RainbowMatch:
             self.sites = existingMatch['sites']
             self.playingOnSide = existingMatch['playingOnSide']
             self.currRound = existingMatch['currRound']
-            self.rounds = existingMatch['rounds']
             self.scores = existingMatch['scores']
             self.players = existingMatch['players']
             self.playersString = existingMatch['playersString']
             self.playerStats = existingMatch['playerStats']
+            # Matches saved before they were seeded get the seed they would have been given
+            self.seed = existingMatch['seed'] if 'seed' in existingMatch else self._seedFromMatchId()
+            self.draws = existingMatch.get('draws', 0)
+            self._setRounds(existingMatch['rounds'])
+            self._setMapSites()
+            self._bannedOperatorSet = frozenset(self.bannedOperators)
+            self._resetEvents(needsSnapshot=True)
         else:
             self.matchId = str(uuid.uuid4())
             self.bannedOperators = []
             self.map = None
+            self._setMapSites()
             self.sites = self._resetSites()
             self.playingOnSide = None
             self.currRound = 0
-            self.rounds = []
+            self._rounds = array('b')
+            self._roundStats = array('B')
+            self._backupOperators = None
             self.scores = {"blue": 0, "red": 0}
             self.players = []
             self.playersString = ''
             self.playerStats = []
+            self.seed = seed if seed is not None else self._seedFromMatchId()
+            self.draws = 0
+            self._bannedOperatorSet = frozenset()
+            self._resetEvents(needsSnapshot=True)
+
+    def _seedFromMatchId(self):
+        return uuid.UUID(self.matchId).int & 0xFFFFFFFFFFFFFFFF
+
+    def _nextRng(self):
+        """Returns the generator for the next draw of the match that is not part of a round, such as the ban choices."""
+        rng = random.Random(f'{self.seed}:{self.draws}')
+        self._log(('draw',))
+        return rng
+
+    def _roundRng(self, roundIndex: int):
+        """Returns the generator of the given (0-indexed) round. It only depends on the seed, so the round can be regenerated at any time."""
+        return random.Random(f'{self.seed}:round:{roundIndex}')
+
+    def _resetEvents(self, needsSnapshot: bool = False):
+        self._events = []
+        self._loggedEvents = 0
+        self._needsSnapshot = needsSnapshot
+
+    def _log(self, event: tuple):
+        """Applies an event to the match and records it, returning the result of applying it. Events that cannot be applied are not recorded,
+        as they would fail again whenever the log is replayed."""
+        result = self._apply(event)
+        self._events.append(event)
+        return result
+
+    def _apply(self, event: tuple):
+        eventType = event[0]
+        if eventType == 'draw':
+            self.draws += 1
+        elif eventType == 'ban':
+            # The list keeps the order the operators were banned in for display, the set is used for lookups
+            self.bannedOperators.extend(event[1])
+            self._bannedOperatorSet = frozenset(self.bannedOperators)
+        elif eventType == 'unban':
+            for op in event[1]:
+                self.bannedOperators.remove(op)
+            self._bannedOperatorSet = frozenset(self.bannedOperators)
+        elif eventType == 'map':
+            self.map = event[1]
+            self._setMapSites()
+            # Maps with fewer sites cannot play the sites that do not exist on them
+            self.sites = [site for site in self.sites if site < len(self._mapSites)]
+        elif eventType == 'start':
+            self.playingOnSide = event[1]
+            if self.currRound == 0:
+                self.currRound = 1
+        elif eventType == 'round':
+            return self._startRound()
+        elif eventType == 'swap':
+            self._rounds[self._roundStart(-1) + 2 + event[1]] = event[2]
+        elif eventType == 'site':
+            self._rounds[self._roundStart(-1)] = event[1]
+        elif eventType == 'stat':
+            index = self._roundStatIndex(-1, event[1], event[2])
+            self._roundStats[index] = min(self._roundStats[index] + 1, self.maxRoundStat)
+        elif eventType == 'resolve':
+            return self._resolveRound(event[1], event[2])
+        else:
+            raise ValueError(f'Unknown match event {event!r}')
+
+    def applyEvents(self, events: list):
+        """Replays events that were recorded by another instance of this match, e.g. on top of a snapshot loaded from the database.
+        The events count as already saved."""
+        for event in events:
+            self._apply(event)
+        self._loggedEvents += len(events)
+
+    def takeEvents(self):
+        """Returns the events that have been recorded since the last call and forgets them, together with the position of the first one in the log since the last snapshot."""
+        firstIndex, events = self._loggedEvents, self._events
+        self._events = []
+        self._loggedEvents += len(events)
+        return firstIndex, events
+
+    def needsSnapshot(self, maxEvents: int):
+        """Returns True if the match has to be saved in full, because it changed in a way events do not describe (such as its players),
+        or because the events since the last snapshot would exceed maxEvents."""
+        return self._needsSnapshot or self._loggedEvents + len(self._events) > maxEvents
+
+    def savedSnapshot(self):
+        """Marks the match as saved in full, so the events recorded until now are no longer needed."""
+        self._resetEvents()
 
-    def _getOperators(self):
-        """Returns a dictionary with the list of attacker and defender operators."""
-        return {
-            "attackers": RainbowData.attackers,
-            "defenders": RainbowData.defenders
-        }
-    
     def _getMap(self, map):
         if map is None:
             map = 'UnknownMap'
 
         maps = RainbowData.maps
 
-        best_match, score = process.extractOne(map, maps.keys())
-        if score > 70:
+        best_match = mapResolver.resolve(map)
+        if best_match is not None:
             return [best_match, maps[best_match]]
         return [None, maps['UnknownMap']]
 
+    def _setMapSites(self):
+        """Caches the site names of the current map. The map has already been resolved to its canonical name when it was set, so this is a plain lookup."""
+        self._mapSites = RainbowData.maps[self.map if self.map in RainbowData.maps else 'UnknownMap']
+
     def _resetSites(self):
         """Resets the sites for the current map."""
-        return list(range(len(self._getMap(self.map)[1])))
+        return list(range(len(self._mapSites)))
+
+    def toDict(self):
+        """Returns the state of the match that is saved to the database, in the dict format with the rounds expanded."""
+        values = {key: getattr(self, key) for key in self.__slots__ if not key.startswith('_')}
+        values['rounds'] = self.rounds
+        return values
+
+    def _setRounds(self, rounds: list):
+        """Converts rounds in the dict format to round records and stats."""
+        playerIndices = {str(player['id']): index for index, player in enumerate(self.players)}
+        self._rounds = array('b')
+        self._roundStats = array('B', bytes(self.roundStatsWidth * len(rounds)))
+        self._backupOperators = None
+        for roundIndex, round in enumerate(rounds):
+            operators = list(round['operators']) + [0] * (self.maxPlayers - len(round['operators']))
+            self._rounds.extend([-1 if round['site'] is None else round['site'], -1 if round['result'] is None else round['result']] + operators)
+            if not round['playerStats']:
+                continue
+            for statIndex, statType in enumerate(self.statTypes):
+                for playerId, count in round['playerStats'].get(statType, {}).items():
+                    self._roundStats[roundIndex * self.roundStatsWidth + statIndex * self.maxPlayers + playerIndices[playerId]] = min(count, self.maxRoundStat)
+        # Rounds started before the backups were regenerated still have them saved
+        if rounds and 'backupOperators' in rounds[-1]:
+            self._backupOperators = rounds[-1]['backupOperators']
+
+    @property
+    def rounds(self):
+        """Returns the rounds in the dict format. The dicts are built on every call, so changing them does not change the match."""
+        rounds = []
+        for roundIndex in range(self.getNumRounds()):
+            start = roundIndex * self.roundWidth
+            site, result = self._rounds[start], self._rounds[start + 1]
+            operators = [op for op in self._rounds[start + 2:start + self.roundWidth] if op]
+            playerStats = {}
+            statsStart = roundIndex * self.roundStatsWidth
+            # Most rounds have no stats at all
+            if any(self._roundStats[statsStart:statsStart + self.roundStatsWidth]):
+                for statIndex, statType in enumerate(self.statTypes):
+                    start = statsStart + statIndex * self.maxPlayers
+                    counts = {str(player['id']): count for player, count in zip(self.players, self._roundStats[start:start + self.maxPlayers]) if count}
+                    if counts:
+                        playerStats[statType] = counts
+            rounds.append({"site": None if site == -1 else site, "operators": operators, "result": None if result == -1 else result, "playerStats": playerStats})
+        if self._backupOperators is not None:
+            rounds[-1]["backupOperators"] = self._backupOperators
+        return rounds
+
+    def getNumRounds(self):
+        """Returns the number of rounds that have been started."""
+        return len(self._rounds) // self.roundWidth
+
+    def getRound(self, roundIndex: int):
+        """Returns the site index (None when attacking), result (None while it is being played, 1 if won, 0 if lost) and operator ids of the given round."""
+        start = self._roundStart(roundIndex)
+        site, result = self._rounds[start], self._rounds[start + 1]
+        operators = [op for op in self._rounds[start + 2:start + self.roundWidth] if op]
+        return (None if site == -1 else site), (None if result == -1 else result), operators
+
+    def getRoundPlayerStat(self, roundIndex: int, playerIndex: int, statType: str):
+        """Returns the number of times the player at the given index got a certain stat in the given round."""
+        return self._roundStats[self._roundStatIndex(roundIndex, playerIndex, statType)]
+
+    def _roundStart(self, roundIndex: int):
+        """Returns the position of the given round's record, counting from the last round for negative indices like a list."""
+        numRounds = self.getNumRounds()
+        if not -numRounds <= roundIndex < numRounds:
+            raise IndexError('round index out of range')
+        return (roundIndex % numRounds) * self.roundWidth
+
+    def _roundStatIndex(self, roundIndex: int, playerIndex: int, statType: str):
+        return (self._roundStart(roundIndex) // self.roundWidth) * self.roundStatsWidth + self.statTypes.index(statType) * self.maxPlayers + playerIndex
 
     def setPlayers(self, playerNames):
         """Sets the players in the current match."""
@@ -111,6 +416,7 @@ class RainbowMatch:
                 "global_name": player.global_name
             }
         
+        self._needsSnapshot = True
         playerNames = [dict(t) for t in {tuple(d.items()) for d in playerNames}]
         self.players = sorted(playerNames, key=lambda player: (player['nick'].lower() if player['nick'] else (player['global_name'].lower() if player['global_name'] else player['name'].lower())))
         self._constructPlayersString()
@@ -125,6 +431,7 @@ class RainbowMatch:
             self.players = originalPlayers
             return False
 
+        self._needsSnapshot = True
         self._constructPlayersString()
         return True
 
@@ -142,18 +449,28 @@ class RainbowMatch:
     def getMapBan(self):
         """Returns a choice of map that should be banned."""
         mapStrings = ["FIRST", "SECOND", "THIRD", "FOURTH", "FIFTH"]
-        return random.sample(mapStrings, k=1)[0]
+        return self._nextRng().choice(mapStrings)
 
     def getOperatorBanChoices(self):
         """Returns a choice of operators that should be banned, two for each side (main and backup)."""
-        attackers, defenders = self._getOperators().values()
-        attBans = random.sample(attackers, k=2)
-        defBans = random.sample(defenders, k=2)
+        roster = RainbowData.roster
+        rng = self._nextRng()
+        attBans = rng.sample(roster.attackers, k=2)
+        defBans = rng.sample(roster.defenders, k=2)
         return attBans, defBans
 
+    def _resolveBannedOperator(self, name):
+        """Returns the banned operator the input names, or None. Misspelled names are only matched against the banned operators, so they cannot resolve to a similar operator that is not banned."""
+        match = operatorResolver.lookup(name)
+        if match is not None:
+            return match if match in self._bannedOperatorSet else None
+        if not self.bannedOperators or not NameResolver.normalize(name):
+            return None
+        match, score = process.extractOne(name, self.bannedOperators)
+        return match if score >= 75 else None
+
     def banOperators(self, inputString, ban=True):
         """Removes the given operators from the list of available operators, and returns the sanitized list of operators."""
-        attackers, defenders = self._getOperators().values()
         input_names = re.split(r'\W+\s*', inputString)
 
         if not input_names or all(name == '' for name in input_names):
@@ -161,35 +478,33 @@ class RainbowMatch:
 
         sanitized_names = []
         for name in input_names:
-            match, score = process.extractOne(name, attackers + defenders) if ban else process.extractOne(name, self.bannedOperators)
-            if score >= 75:
-                sanitized_names.append(match)
-            else:
-                sanitized_names.append(None)
-
-        for op in sanitized_names:
             if ban:
-                if op in attackers:
-                    self.bannedOperators.append(op)
-                elif op in defenders:
-                    self.bannedOperators.append(op)
+                sanitized_names.append(operatorResolver.resolve(name))
             else:
-                if op in self.bannedOperators:
-                    self.bannedOperators.remove(op)
+                sanitized_names.append(self._resolveBannedOperator(name))
 
+        if ban:
+            # Operators that are already banned, or named more than once, are only banned once
+            newBans = dict.fromkeys(op for op in sanitized_names if op in RainbowData.roster.ids and op not in self._bannedOperatorSet)
+            self._log(('ban', list(newBans)))
+        else:
+            remainingBans = self.bannedOperators.copy()
+            unbanned = []
+            for op in sanitized_names:
+                if op in remainingBans:
+                    remainingBans.remove(op)
+                    unbanned.append(op)
+            self._log(('unban', unbanned))
         return sanitized_names
     
     def swapOperator(self, player, newOperator):
         """Swaps the operator a given player is playing in the current round. The player and new operator are assumed to have been validated already."""
-        attackers, defenders = self._getOperators().values()
+        roster = RainbowData.roster
         playerIndex = next((i for i, p in enumerate(self.players) if p['id'] == player.id), None)
 
-        if newOperator in attackers:
-            self.rounds[-1]["operators"][playerIndex] = attackers.index(newOperator) + 1
-        else:
-            self.rounds[-1]["operators"][playerIndex] = -(defenders.index(newOperator) + 1)
+        self._log(('swap', playerIndex, roster.getId(newOperator)))
 
-        return [attackers[abs(op) - 1] if op > 0 else defenders[abs(op) - 1] for op in self.rounds[-1]["operators"]], self.rounds[-1]["backupOperators"]
+        return [roster.getName(op) for op in self.getRound(-1)[2]], self.getBackupOperators()
 
     def setMap(self, map):
         """Sets the map for the current match. Returns True if the map has been set successfully."""
@@ -197,65 +512,106 @@ class RainbowMatch:
         if not mapMapping:
             return False
 
-        self.map = mapMapping[0]
-        if len(self._getMap(map)[1]) < len(self.sites):
-            for site in self.sites:
-                if site >= len(self._getMap(map)[1]):
-                    self.sites.remove(site)
+        self._log(('map', mapMapping[0]))
         return True
     
+    def startPlaying(self, side: str):
+        """Sets the side the next round is played on, which also starts the match if it has not started yet."""
+        self._log(('start', side))
+
     def setupRound(self):
-        """Starts a new round, returning the chosen operators and site."""
-        siteIndex, playedSite = self.getRandomSite() if self.playingOnSide == "defense" else (None, None)
-        playedOperators = self.getRandomOperators()
-        attackers, defenders = self._getOperators().values()
-
-        self.rounds.append({
-            "site": siteIndex,
-            # The 1-indexed index of the current operator, negated if it is a defender
-            "operators": [(attackers.index(op) + 1) if self.playingOnSide == "attack" else -(defenders.index(op) + 1) for op in playedOperators[:len(self.players)]],
-            "backupOperators": playedOperators[len(self.players):],
-            "result": None,
-            "playerStats": {}
-        })
+        """Starts a new round, returning the chosen operators and site.
+        The backup operators are not saved with the round, as they can be regenerated from the seed and the round number."""
+        return self._log(('round',))
+
+    def _startRound(self):
+        rng = self._roundRng(self.getNumRounds())
+        # The operators are drawn first, so regenerating them does not depend on the sites that were left
+        playedOperators = self.getRandomOperators(rng)
+        siteIndex, playedSite = self.getRandomSite(rng) if self.playingOnSide == "defense" else (None, None)
+
+        # The 1-indexed index of the current operator, negated if it is a defender
+        operators = [RainbowData.roster.getId(op) for op in playedOperators[:len(self.players)]]
+        self._rounds.extend([-1 if siteIndex is None else siteIndex, -1] + operators + [0] * (self.maxPlayers - len(operators)))
+        self._roundStats.extend(bytes(self.roundStatsWidth))
+        self._backupOperators = None
         return playedOperators, playedSite
 
-    def getRandomSite(self):
+    def getRandomSite(self, rng: random.Random):
         """Returns a choice of site that should be played."""
-        siteIndex = random.choice(self.sites)
-        return siteIndex, self._getMap(self.map)[1][siteIndex]
+        siteIndex = rng.choice(self.sites)
+        return siteIndex, self._mapSites[siteIndex]
     
     def trySetSite(self, siteIndex):
         """Attempts to set a new site for the current round. Returns the name of the new site if successful, or None if the site is invalid."""
         # The site index is 1-indexed when input by the user
         siteIndex -= 1
         if siteIndex in self.sites:
-            self.rounds[-1]["site"] = siteIndex
-            return self._getMap(self.map)[1][siteIndex]
+            self._log(('site', siteIndex))
+            return self._mapSites[siteIndex]
         return None
     
     def getCurrentSiteName(self):
         """Returns the name of the site currently being played."""
-        return self._getMap(self.map)[1][self.rounds[-1]["site"]] if self.rounds else None
+        site = self.getRound(-1)[0] if self._rounds else None
+        return self._mapSites[site] if site is not None else None
 
-    def getRandomOperators(self):
+    def getRandomOperators(self, rng: random.Random):
         """Returns a random list of operators for the specified side, excluding any banned operators."""
-        attackers, defenders = self._getOperators().values()
-        available_operators = [op for op in (attackers if self.playingOnSide == "attack" else defenders) if op not in self.bannedOperators]
-        return random.sample(available_operators, k=min(5, len(available_operators)))
+        return list(islice(self._shuffledOperators(rng), 5))
+
+    def _shuffledOperators(self, rng: random.Random):
+        """Yields the operators of the specified side that are not banned, in the order the given generator shuffles the side into.
+        The side is shuffled one operator at a time, so only as many operators are drawn as are taken, and the first ones do not depend on how many are taken.
+        Banned operators are skipped after being drawn, so banning an operator does not change the order of the others."""
+        side = list(RainbowData.roster.sides[self.playingOnSide])
+        for i in range(len(side)):
+            j = rng.randrange(i, len(side))
+            side[i], side[j] = side[j], side[i]
+            if side[i] not in self._bannedOperatorSet:
+                yield side[i]
+
+    def getBackupOperators(self):
+        """Returns the backup operators of the current round: the first operators of the round's lineup that are not banned or being played."""
+        # Rounds started before the backups were regenerated still have them saved
+        if self._backupOperators is not None:
+            return self._backupOperators
+
+        roster = RainbowData.roster
+        operators = self.getRound(-1)[2]
+        playedOperators = {roster.getName(op) for op in operators}
+        rng = self._roundRng(self.getNumRounds() - 1)
+        backupOperators = (op for op in self._shuffledOperators(rng) if op not in playedOperators)
+        return list(islice(backupOperators, max(0, 5 - len(operators))))
+
+    def generateLineups(self, count: int, rng: np.random.Generator = None):
+        """Generates the lineups of count rounds at once for the current side and bans, without changing the match.
+        Returns a (count, len(players)) array of the played operator ids, a (count, 5 - len(players)) array of the backup operator ids, and an array of count site indices (-1 when attacking).
+        Without a generator, the lineups are drawn from one seeded by the match and its number of rounds, so they can be generated again."""
+        rng = rng if rng is not None else np.random.default_rng([self.seed, self.getNumRounds()])
+        lineups = RainbowData.roster.sampleLineups(self.playingOnSide, self._bannedOperatorSet, count, rng=rng)
+        if self.playingOnSide == "defense":
+            sites = rng.choice(np.array(self.sites, dtype=np.int8), size=count)
+        else:
+            sites = np.full(count, -1, dtype=np.int8)
+        return lineups[:, :len(self.players)], lineups[:, len(self.players):], sites
 
     def resolveRound(self, result, overtimeSide):
         """Resolves the round, updating the scores and the side, and returns True if the match is still ongoing."""
-        self.rounds[-1].pop("backupOperators")
+        return self._log(('resolve', result, overtimeSide))
+
+    def _resolveRound(self, result, overtimeSide):
+        self._backupOperators = None
+        roundStart = self._roundStart(-1)
 
         if result == "won":
             self.scores["blue"] += 1
-            self.rounds[-1]["result"] = 1
+            self._rounds[roundStart + 1] = 1
             if self.playingOnSide == "defense":
-                self.sites.remove(self.rounds[-1]["site"])
+                self.sites.remove(self._rounds[roundStart])
         else:
             self.scores["red"] += 1
-            self.rounds[-1]["result"] = 0
+            self._rounds[roundStart + 1] = 0
 
         if self.scores["blue"] == 3 and self.scores["red"] == 3:
             self.playingOnSide = overtimeSide
@@ -282,18 +638,16 @@ class RainbowMatch:
 
     def addPlayerStat(self, playerId, statType):
         """Adds a player stat to the list of player stats for this match."""
-        statTypes = ['interrogations', 'aces']
-        if statType in statTypes:
-            if self.rounds[-1]['playerStats'].get(statType) is None:
-                self.rounds[-1]['playerStats'][statType] = {}
-            if self.rounds[-1]['playerStats'][statType].get(str(playerId)) is None:
-                self.rounds[-1]['playerStats'][statType][str(playerId)] = 0
-            self.rounds[-1]['playerStats'][statType][str(playerId)] += 1
+        if statType in self.statTypes:
+            playerIndex = next(i for i, player in enumerate(self.players) if player['id'] == int(playerId))
+            # Stats past the maximum would not change the match, so they are not logged either
+            if self.getRoundPlayerStat(-1, playerIndex, statType) < self.maxRoundStat:
+                self._log(('stat', playerIndex, statType))
 
     def getPlayerStat(self, playerId, statType):
         """Returns the number of times a player has gotten a certain stat during the current match."""
-        count = 0
-        for round in self.rounds:
-            if round['playerStats'].get(statType) and round['playerStats'][statType].get(str(playerId)):
-                count += round['playerStats'][statType][str(playerId)]
-        return count
+        playerIndex = next((i for i, player in enumerate(self.players) if player['id'] == int(playerId)), None)
+        if playerIndex is None or statType not in self.statTypes:
+            return 0
+        offset = self.statTypes.index(statType) * self.maxPlayers + playerIndex
+        return sum(self._roundStats[offset::self.roundStatsWidth])
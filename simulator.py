@@ -0,0 +1,191 @@
+"""Plays randomized matches through the RainbowMatch state machine without Discord, to measure its throughput and check its invariants.
+
+Usage: python simulator.py [--matches N] [--workers N] [--seed N]
+"""
+import argparse
+import json
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from multiprocessing import Pool
+import numpy as np
+from fuzzywuzzy import process
+from matchCodec import decodeEvent, decodeMatch, encodeEvent, encodeMatch
+from rainbow import RainbowData, RainbowMatch
+
+# The number of lineups drawn at once through RainbowMatch.generateLineups
+LINEUP_BATCH = 16
+# Every score a finished match can end on: first to four, or first to five after overtime at 3:3
+VALID_FINAL_SCORES = {(4, 0), (4, 1), (4, 2), (0, 4), (1, 4), (2, 4), (5, 3), (5, 4), (3, 5), (4, 5)}
+
+class SimulationError(AssertionError):
+    """An invariant of the match state machine was violated."""
+
+class FuzzyMatchCounter:
+    """Counts the names that are fuzzy matched, which all go through fuzzywuzzy's extractOne, while the counter is installed."""
+    def __init__(self):
+        self.calls = 0
+
+    @contextmanager
+    def installed(self):
+        extractOne = process.extractOne
+        def countedExtractOne(*args, **kwargs):
+            self.calls += 1
+            return extractOne(*args, **kwargs)
+        process.extractOne = countedExtractOne
+        try:
+            yield self
+        finally:
+            process.extractOne = extractOne
+
+def _check(condition: bool, match: RainbowMatch, message: str):
+    if not condition:
+        raise SimulationError(f'{message} (match {match.matchId}, round {match.currRound}, score {match.scores})')
+
+def _checkLineups(match: RainbowMatch):
+    """Draws a batch of lineups for the coming round, which have to follow the same rules as the lineup the round is played with."""
+    roster = RainbowData.roster
+    played, backups, sites = match.generateLineups(LINEUP_BATCH)
+    sideSet = roster.attackerSet if match.playingOnSide == 'attack' else roster.defenderSet
+    numAvailable = len(sideSet - set(match.bannedOperators))
+    _check(played.shape == (LINEUP_BATCH, len(match.players)), match, f'Generated lineups of {played.shape[1]} operators for {len(match.players)} players')
+    _check(played.shape[1] + backups.shape[1] == min(5, numAvailable), match, f'Generated {backups.shape[1]} backup operators')
+    lineups = np.sort(np.hstack([played, backups]), axis=1)
+    _check((np.diff(lineups, axis=1) != 0).all(), match, 'Duplicate operators in generated lineups')
+    _check(not np.isin(lineups, [roster.getId(op) for op in match.bannedOperators]).any(), match, 'Banned operator in generated lineups')
+    _check(((lineups > 0) == (match.playingOnSide == 'attack')).all(), match, 'Operator of the wrong side in generated lineups')
+    expectedSites = set(match.sites) if match.playingOnSide == 'defense' else {-1}
+    _check(set(sites.tolist()) <= expectedSites, match, f'Generated sites {set(sites.tolist())} outside of {expectedSites}')
+
+def simulateMatch(rng: random.Random, fuzzyMatches: FuzzyMatchCounter):
+    """Plays a single randomized match from start to finish, and returns its final score, number of rounds and number of fuzzy matched names."""
+    startFuzzyMatches = fuzzyMatches.calls
+    match = RainbowMatch(seed=rng.getrandbits(64))
+    roster = RainbowData.roster
+
+    numPlayers = rng.randint(1, 5)
+    match.setPlayers([{'id': playerId, 'mention': f'<@{playerId}>', 'name': f'player{playerId}', 'nick': None, 'global_name': None} for playerId in range(numPlayers)])
+    # Everything after the players are set is recorded as events, which are replayed on top of this snapshot at the end
+    snapshot = encodeMatch(match)
+    match.savedSnapshot()
+    bans = rng.sample(roster.attackers, k=rng.randint(0, 3)) + rng.sample(roster.defenders, k=rng.randint(0, 3))
+    match.banOperators(' '.join(bans))
+    if rng.random() < 0.9:
+        mapName = rng.choice([map for map in RainbowData.maps if map != 'UnknownMap'])
+        # Some maps are misspelled by leaving out a letter, which has to be fuzzy matched
+        if rng.random() < 0.2:
+            letter = rng.randrange(len(mapName))
+            mapName = mapName[:letter] + mapName[letter + 1:]
+        match.setMap(mapName)
+    # The map is resolved once when it is set, so the rounds must not fuzzy match any names
+    roundFuzzyMatches = fuzzyMatches.calls
+
+    startingSide = rng.choice(['attack', 'defense'])
+    match.startPlaying(startingSide)
+    overtimeSide = None
+    wonSites = set()
+
+    lineupSide = None
+    while True:
+        # Batches of lineups are drawn once for every side the match is played on, as their rules only change with the side
+        if match.playingOnSide != lineupSide:
+            lineupSide = match.playingOnSide
+            _checkLineups(match)
+        operators, site = match.setupRound()
+        expectedSide = startingSide if match.currRound <= 3 else ('defense' if startingSide == 'attack' else 'attack')
+        if overtimeSide is not None:
+            expectedSide = overtimeSide if match.currRound != 8 else ('defense' if overtimeSide == 'attack' else 'attack')
+        _check(match.playingOnSide == expectedSide, match, f'Playing on {match.playingOnSide} instead of {expectedSide}')
+
+        _check(match.getBackupOperators() == operators[len(match.players):], match, f'Regenerated backups differ from lineup {operators}')
+        _check(len(set(operators)) == len(operators), match, f'Duplicate operators in lineup {operators}')
+        _check(not set(operators) & set(match.bannedOperators), match, f'Banned operator in lineup {operators}')
+        _check(all((roster.getId(op) > 0) == (match.playingOnSide == 'attack') for op in operators), match, f'Operator of the wrong side in lineup {operators}')
+
+        if match.playingOnSide == 'defense':
+            # Occasionally switch to another site that has not been won yet, like the !site command does
+            if rng.random() < 0.1:
+                newSite = rng.choice(match.sites)
+                _check(match.trySetSite(newSite + 1) is not None, match, f'Could not switch to available site {newSite}')
+            site = match.getRound(-1)[0]
+            _check(site not in wonSites, match, f'Site {site} was already won')
+        else:
+            site = match.getRound(-1)[0]
+            _check(site is None, match, 'Attacking round has a site')
+
+        if rng.random() < 0.05:
+            match.addPlayerStat(rng.choice(match.players)['id'], rng.choice(['aces', 'interrogations']))
+
+        result = rng.choice(['won', 'lost'])
+        side = rng.choice(['attack', 'defense'])
+        if result == 'won' and match.playingOnSide == 'defense':
+            wonSites.add(site)
+
+        isOngoing = match.resolveRound(result, side)
+        if match.scores['blue'] == 3 and match.scores['red'] == 3:
+            overtimeSide = side
+            wonSites.clear()
+            _check(match.sites == list(range(len(match._mapSites))), match, 'Sites were not reset for overtime')
+
+        if not isOngoing:
+            break
+        _check(match.currRound <= 9, match, 'Match did not end after nine rounds')
+
+    _check(fuzzyMatches.calls == roundFuzzyMatches, match, f'Fuzzy matched {fuzzyMatches.calls - roundFuzzyMatches} names while playing the rounds')
+    finalScore = (match.scores['blue'], match.scores['red'])
+    _check(match.isMatchFinished(), match, 'Match ended without being finished')
+    _check(finalScore in VALID_FINAL_SCORES, match, f'Invalid final score {finalScore}')
+    _check(match.getNumRounds() == sum(finalScore), match, f'Played {match.getNumRounds()} rounds for a score of {finalScore}')
+    matchData = json.loads(json.dumps(match.toDict()))
+    _check(RainbowMatch(matchData).toDict() == matchData, match, 'The match changed when converted to the dict format and back')
+    _check(decodeMatch(encodeMatch(match)).toDict() == matchData, match, 'The match changed when encoded and decoded')
+    replayedMatch = decodeMatch(snapshot)
+    replayedMatch.applyEvents([decodeEvent(encodeEvent(event)) for event in match.takeEvents()[1]])
+    _check(replayedMatch.toDict() == matchData, match, 'Replaying the events of the match did not lead to the same match')
+    return finalScore, match.getNumRounds(), fuzzyMatches.calls - startFuzzyMatches
+
+def simulateMatches(numMatches: int, seed: int):
+    """Plays the given number of matches, and returns the distribution of final scores, the number of played rounds and the most names fuzzy matched in a match."""
+    rng = random.Random(seed)
+    scores = Counter()
+    numRounds = 0
+    maxFuzzyMatches = 0
+    with FuzzyMatchCounter().installed() as fuzzyMatches:
+        for _ in range(numMatches):
+            finalScore, matchRounds, matchFuzzyMatches = simulateMatch(rng, fuzzyMatches)
+            scores[finalScore] += 1
+            numRounds += matchRounds
+            maxFuzzyMatches = max(maxFuzzyMatches, matchFuzzyMatches)
+    return scores, numRounds, fuzzyMatches.calls, maxFuzzyMatches
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays randomized matches through the RainbowMatch state machine and checks its invariants.')
+    parser.add_argument('--matches', type=int, default=100000, help='The number of matches to simulate.')
+    parser.add_argument('--workers', type=int, default=1, help='The number of processes to spread the matches over.')
+    parser.add_argument('--seed', type=int, default=None, help='The seed for the first worker, later workers use the following seeds.')
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    matchesPerWorker = [args.matches // args.workers + (1 if i < args.matches % args.workers else 0) for i in range(args.workers)]
+
+    print(f'Simulating {args.matches} matches on {args.workers} worker(s) with seed {seed}')
+    start = time.perf_counter()
+    if args.workers == 1:
+        results = [simulateMatches(args.matches, seed)]
+    else:
+        with Pool(args.workers) as pool:
+            results = pool.starmap(simulateMatches, [(numMatches, seed + i) for i, numMatches in enumerate(matchesPerWorker)])
+    duration = time.perf_counter() - start
+
+    scores = sum((result[0] for result in results), Counter())
+    numRounds = sum(result[1] for result in results)
+    print(f'Played {args.matches} matches and {numRounds} rounds in {duration:.2f}s')
+    print(f'{args.matches / duration:.0f} matches/s, {numRounds / duration:.0f} rounds/s')
+    print(f'Fuzzy matched {sum(result[2] for result in results)} names, {sum(result[2] for result in results) / args.matches:.4f} per match and at most {max(result[3] for result in results)} in a match')
+    print('Final scores:')
+    for (blue, red), count in sorted(scores.items(), key=lambda item: -item[1]):
+        print(f'\t{blue}:{red}  {count:>9}  {count / args.matches:6.2%}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Fires thousands of commands at a single simulated server at the same time, against the in-process Discord stand-in of fakeDiscord.py,
+and checks that none of their changes to the match were lost: the map, every ban, every round result and every tracked statistic has to be in the final state.
+Chat messages are mixed in with the commands, which must not wait for a turn on the server.
+
+Usage: python stressTest.py [--matches N] [--bans N] [--stats N] [--chat N] [--latency MS] [--seed N]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+# The bot prints a line for every command in debug mode
+os.environ['IS_DEBUG'] = '0'
+
+from bot import RainbowBot
+from fakeDiscord import FakeDiscord
+from rainbow import RainbowData
+
+# The round results fired at once, which end on a score of 3:2 so none of them has to name the side overtime starts on
+ROUND_RESULTS = ['won'] * 3 + ['lost'] * 2
+
+class StressTest:
+    """Plays matches on one server, firing the map, bans, round results and statistics of each match concurrently, and collects every difference from the expected state."""
+    def __init__(self, bot: RainbowBot, fake: FakeDiscord, rng: random.Random):
+        self.bot = bot
+        self.fake = fake
+        self.rng = rng
+        self.guild = fake.createGuild(numMembers=5)
+        self.failures = []
+        self.numEvents = 0
+        self.numChatMessages = 0
+        # The interrogations and aces expected in the database, by player id
+        self.expectedStats = Counter()
+        bot.add_listener(self._onCommandError, 'on_command_error')
+
+    async def _onCommandError(self, ctx, error):
+        self.failures.append(f'{ctx.message.content}: {error!r}')
+
+    def _check(self, condition: bool, message: str):
+        if not condition:
+            self.failures.append(message)
+
+    async def playMatch(self, matchNum: int, numBans: int, numStats: int, numChatMessages: int):
+        channel = self.guild.textChannel
+        players = self.guild.players
+        author = players[0]
+        await self.fake.sendCommand(channel, author, '!startMatch ' + ' '.join(player.mention for player in players))
+        await self.fake.sendCommand(channel, author, '!attack')
+
+        # Names with spaces would be split into several operators by the !ban command
+        bans = self.rng.sample([operator for operator in RainbowData.roster.attackers + RainbowData.roster.defenders if ' ' not in operator], k=numBans)
+        stats = [(self.rng.choice(players), self.rng.choice(['interrogation', 'ace'])) for _ in range(numStats)]
+        # Only matches with a map are saved when they end
+        matchMap = self.rng.choice([map for map in RainbowData.maps if map != 'UnknownMap' and ' ' not in map])
+        events = [f'!map {matchMap}'] + [f'!ban {operator}' for operator in bans] + [f'!{result}' for result in ROUND_RESULTS] + [f'!{stat} {player.mention}' for player, stat in stats]
+        chatMessages = [f'gg {messageNum}' for messageNum in range(numChatMessages)]
+        messages = events + chatMessages
+        self.rng.shuffle(messages)
+        await asyncio.gather(*[self.fake.sendCommand(channel, self.rng.choice(players), message) for message in messages])
+        self.numEvents += len(events) + 2
+        self.numChatMessages += numChatMessages
+
+        expected = {
+            'map': matchMap,
+            'bans': set(bans),
+            'scores': {'blue': ROUND_RESULTS.count('won'), 'red': ROUND_RESULTS.count('lost')},
+            'currRound': len(ROUND_RESULTS) + 1,
+            'stats': Counter((player.id, stat + 's') for player, stat in stats),
+        }
+        match, _ = await self.bot.loadOngoingMatch(self.guild.id)
+        self._checkMatch(f'match {matchNum}', match, expected)
+        # The match loaded from its snapshot and event log has to be the same as the one that was cached
+        self.bot.matchCache.pop(self.guild.id)
+        match, _ = await self.bot.loadOngoingMatch(self.guild.id)
+        self._checkMatch(f'match {matchNum} after loading it from the database', match, expected)
+
+        await self.fake.sendCommand(channel, author, '!won')
+        match, _ = await self.bot.loadOngoingMatch(self.guild.id)
+        self._check(match.scores == {'blue': 4, 'red': 2}, f'match {matchNum}: final score is {match.scores} instead of 4:2')
+        self.expectedStats.update(player.id for player, _ in stats)
+        await self.fake.sendCommand(channel, author, '!goodnight')
+        self.numEvents += 2
+
+    def _checkMatch(self, name: str, match, expected: dict):
+        if match is None:
+            return self.failures.append(f'{name}: there is no ongoing match')
+        self._check(match.map == expected['map'], f'{name}: the map is {match.map} instead of {expected["map"]}')
+        self._check(set(match.bannedOperators) == expected['bans'], f'{name}: lost the bans {expected["bans"] - set(match.bannedOperators)}')
+        self._check(match.scores == expected['scores'], f'{name}: the score is {match.scores} instead of {expected["scores"]}')
+        self._check(match.currRound == expected['currRound'], f'{name}: playing round {match.currRound} instead of {expected["currRound"]}')
+        for player in match.players:
+            for statType in match.statTypes:
+                count = match.getPlayerStat(player['id'], statType)
+                self._check(count == expected['stats'][(player['id'], statType)], f'{name}: {player["name"]} has {count} {statType} instead of {expected["stats"][(player["id"], statType)]}')
+
+    async def checkDatabase(self, numMatches: int):
+        """Checks the completed matches and the statistics saved for them."""
+        results = await self.bot.db.fetchall("SELECT result, (SELECT COUNT(*) FROM rounds WHERE rounds.match_id = matches.match_id) FROM matches WHERE server_id = ?", (self.guild.id,))
+        self._check(results == [(1, 6)] * numMatches, f'saved matches are {results} instead of {numMatches} won matches of 6 rounds')
+        stats = Counter()
+        for playerId, value in await self.bot.db.fetchall("SELECT player_id, value FROM player_additional_stats"):
+            stats[playerId] += value
+        self._check(stats == self.expectedStats, f'saved statistics are {dict(stats)} instead of {dict(self.expectedStats)}')
+
+async def runStressTest(args):
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    with tempfile.TemporaryDirectory() as directory:
+        bot = RainbowBot(os.path.join(directory, 'stressTest.db'))
+        fake = FakeDiscord(bot, args.latency / 1000)
+        await fake.login()
+        test = StressTest(bot, fake, random.Random(seed))
+
+        print(f'Playing {args.matches} match(es) on one server with {args.bans} bans and {args.stats} statistics fired at once in each, with seed {seed}')
+        start = time.perf_counter()
+        for matchNum in range(args.matches):
+            await test.playMatch(matchNum, args.bans, args.stats, args.chat)
+        await test.checkDatabase(args.matches)
+        # Only the commands take turns on the server, chat messages are not held up behind them
+        test._check(bot.guildQueue.numWaits == test.numEvents, f'{bot.guildQueue.numWaits} turns were taken for {test.numEvents} commands')
+        # The last updates of the match message are only made once their window has passed
+        while len(bot.renderer):
+            await asyncio.sleep(0.05)
+        duration = time.perf_counter() - start
+        bot.db.close()
+
+    print(f'Handled {test.numEvents} commands and {test.numChatMessages} chat messages in {duration:.2f}s, at most {bot.guildQueue.maxDepth} of them queued at once and waiting up to {bot.guildQueue.maxWaitTime * 1000:.0f}ms')
+    for failure in test.failures[:20]:
+        print(failure)
+    print(f'{len(test.failures)} failures')
+    return len(test.failures)
+
+def main():
+    parser = argparse.ArgumentParser(description='Fires thousands of concurrent commands at one simulated server and checks that the match state includes all of them.')
+    parser.add_argument('--matches', type=int, default=5, help='The number of matches played one after another.')
+    parser.add_argument('--bans', type=int, default=30, help='The number of operators banned at once in each match, each with its own command.')
+    parser.add_argument('--stats', type=int, default=500, help='The number of interrogations and aces fired at once in each match.')
+    parser.add_argument('--chat', type=int, default=500, help='The number of chat messages sent in between the commands of each match.')
+    parser.add_argument('--latency', type=float, default=1.0, help='The milliseconds each simulated REST call takes.')
+    parser.add_argument('--seed', type=int, default=None, help='The seed of the order the commands are fired in.')
+    sys.exit(1 if asyncio.run(runStressTest(parser.parse_args())) else 0)
+
+if __name__ == '__main__':
+    main()